@@ -70,6 +70,39 @@ async function calculateNeuralMetricsBatchAPI(pairs, metricsToCalc, backendUrl =
 }
 
 
+
+async function translateBatchAPI(segments, provider, options = {}, onResult = null, backendUrl = 'http://localhost:5000') {
+  try {
+    const response = await fetch(`${backendUrl}/translate/batch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ segments, provider, ...options, stream: true })
+    });
+    if (!response.ok) throw new Error('Batch translation error');
+    // NDJSON: one result per line, delivered as each batch finishes
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const results = new Array(segments.length).fill(null);
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (value) buffer += decoder.decode(value, { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = done ? '' : lines.pop();
+      lines.filter(line => line.trim()).forEach(line => {
+        const result = JSON.parse(line);
+        results[result.index] = result;
+        if (onResult) onResult(result);
+      });
+      if (done) break;
+    }
+    return results;
+  } catch (error) {
+    console.error('Batch translation error:', error);
+    return null;
+  }
+}
+
 async function evaluateWithLLMAPI(original, translation, fromLang, toLang, evaluatorKey, evaluatorModel, availableModels, calculateCostFn) {
   const startTime = Date.now();
   
@@ -199,6 +232,57 @@ Respond ONLY with a valid JSON object in this exact format (no other text):
 }
 
 
+// Judges many segments per LLM request through the server (/judge); results follow evaluateWithLLMAPI()
+async function evaluateWithLLMBatchAPI(items, fromLang, toLang, evaluatorKey, evaluatorModel, availableModels, backendUrl = 'http://localhost:5000') {
+  if (!evaluatorKey || evaluatorKey.trim() === '' || !items.length) return null;
+
+  let provider, model;
+  if (evaluatorKey.startsWith('sk-ant-')) {
+    const found = availableModels.find(m => m.id === evaluatorModel);
+    provider = 'anthropic';
+    model = found ? found.model : undefined;
+  } else {
+    provider = evaluatorModel.includes('deepseek') ? 'deepseek' : 'openai';
+    model = provider === 'deepseek' ? evaluatorModel : 'gpt-4o';
+  }
+
+  try {
+    const response = await fetch(`${backendUrl}/judge`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        items: items.map(it => ({ original: it.original, translation: it.translation })),
+        source_lang: fromLang,
+        target_lang: toLang,
+        provider,
+        model,
+        api_key: evaluatorKey
+      })
+    });
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error || 'Judge backend error');
+    return data.results.map(r => r.error ? {
+      score: 'Error',
+      fluency: 'Error',
+      adequacy: 'Error',
+      feedback: `LLM evaluation failed: ${r.error}`,
+      time: 0,
+      cost: r.cost
+    } : {
+      score: r.score.toFixed(1),
+      fluency: r.fluency.toFixed(1),
+      adequacy: r.adequacy.toFixed(1),
+      feedback: r.feedback,
+      time: r.time || 0,
+      cost: r.cost
+    });
+  } catch (error) {
+    console.error('LLM batch evaluation error:', error);
+    return null;
+  }
+}
+
+
 // Build translation prompt
 function buildTranslationPrompt(fromLang, toLang, languages, systemPrompt, styleInstructions, customPrompt = null) {
   const fromName = languages.find(l => l.code === fromLang)?.name || fromLang;
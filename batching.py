@@ -0,0 +1,87 @@
+"""
+Request coalescing for the single-segment metric routes.
+Concurrent callers are queued per metric for up to max_wait_ms (or until max_batch
+items arrive), scored in one batched forward pass and handed their own result back.
+If the batched call fails, its items are rescored one by one, so a bad input only
+fails its own caller.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    def __init__(self, name, score_fn, max_batch=32, max_wait_ms=10):
+        self.name, self.score_fn = name, score_fn
+        self.max_batch, self.max_wait = max(1, int(max_batch)), max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue, self._worker, self._pid = queue.Queue(), None, None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'errors': 0, 'fallbacks': 0, 'max_batch_size': 0, 'queue_wait_ms_total': 0.0, 'queue_wait_ms_max': 0.0}
+
+    def submit(self, item, timeout=None):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future.result(timeout)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s['avg_batch_size'] = round(s['requests'] / s['batches'], 2) if s['batches'] else 0
+        wait_total = s.pop('queue_wait_ms_total')
+        s['avg_queue_wait_ms'] = round(wait_total / s['requests'], 2) if s['requests'] else 0
+        s['queue_wait_ms_max'] = round(s['queue_wait_ms_max'], 2)
+        s.update({'queued': self._queue.qsize(), 'max_batch': self.max_batch, 'max_wait_ms': self.max_wait * 1000})
+        return s
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so each worker process starts its own
+        if self._pid == os.getpid() and self._worker.is_alive(): return
+        with self._lock:
+            if self._pid == os.getpid() and self._worker.is_alive(): return
+            if self._pid != os.getpid(): self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name=f'batcher-{self.name}', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try: batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty: break
+            self._dispatch(batch)
+
+    def _score(self, items):
+        results = self.score_fn(items)
+        if len(results) != len(items): raise RuntimeError(f'{self.name}: scorer returned {len(results)} results for {len(items)} inputs')
+        return results
+
+    def _dispatch(self, batch):
+        started = time.perf_counter()
+        waits = [(started - queued_at) * 1000 for _, _, queued_at in batch]
+        fallback = False
+        try:
+            for (_, future, _), result in zip(batch, self._score([item for item, _, _ in batch])): future.set_result(result)
+        except Exception as e:
+            if len(batch) == 1: batch[0][1].set_exception(e)
+            else:
+                # One bad input must not fail everyone it was coalesced with: score the batch item by item
+                fallback = True
+                for item, future, _ in batch:
+                    try: future.set_result(self._score([item])[0])
+                    except Exception as item_error: future.set_exception(item_error)
+        failed = sum(1 for _, future, _ in batch if future.exception() is not None)
+        with self._lock:
+            self._stats['requests'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['errors'] += failed
+            self._stats['fallbacks'] += int(fallback)
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+            self._stats['queue_wait_ms_total'] += sum(waits)
+            self._stats['queue_wait_ms_max'] = max(self._stats['queue_wait_ms_max'], max(waits))
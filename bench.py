@@ -0,0 +1,317 @@
+"""
+Headless benchmark for translation and metric throughput.
+Replays a bundled corpus (1TranslationTestData/opus.*, the TMX files, 1Results/opus100_*.json)
+through server.py, in-process via Flask's test client or against a running server with --url,
+and reports per stage: segments/s, p50/p95/p99 request latency, peak RSS and model-load time.
+Cloud providers are answered by stub_server, so no API keys or network are needed.
+
+  python bench.py --corpus 1TranslationTestData/opus.de-en-test --source de --target en --limit 200 \\
+      --stages nllb,batch:nllb,anthropic,lexical,metrics,comet --out bench/HEAD.json
+  python bench.py --compare bench/base.json bench/HEAD.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import jobs
+import stub_server
+
+try: import resource
+except ImportError: resource = None  # POSIX only: the client's peak RSS is reported as n/a on Windows
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCAL_PROVIDERS = ('nllb', 'opus', 'argos')
+CLOUD_PROVIDERS = ('anthropic', 'openai', 'deepseek', 'deepl')
+METRIC_ROUTES = ('bertscore', 'comet', 'comet-qe', 'bleurt')
+# Translation stages come first: later metric stages score the most recent successful translation
+DEFAULT_STAGES = 'nllb,batch:nllb,opus,argos,anthropic,batch:anthropic,deepl,lexical,metrics,bertscore,comet,comet-qe,bleurt'
+ENV_KNOBS = ('BATCH_MAX_SIZE', 'BATCH_TOKEN_BUDGET', 'MICROBATCH_MAX_SIZE', 'MICROBATCH_WAIT_MS', 'INFERENCE_WORKERS', 'TORCH_NUM_THREADS',
+             'LOCAL_GEN_MAX_BATCH', 'LOCAL_GEN_TOKEN_BUDGET', 'LOCAL_NUM_BEAMS', 'LEXICAL_WORKERS', 'LEXICAL_PARALLEL_MIN', 'LEXICAL_VARIANT',
+             'CACHE_ENABLED', 'MODEL_MEMORY_BUDGET_MB', 'PRELOAD_MODELS', 'PIN_MODELS', 'WEB_CONCURRENCY', 'GUNICORN_THREADS')
+# (field, higher is better) pairs checked by --compare
+COMPARED = (('segments_per_s', True), ('p50_ms', False), ('p95_ms', False), ('p99_ms', False), ('peak_rss_mb', False), ('model_load_s', False))
+
+
+def load_segments(corpus, source_lang, target_lang, limit, candidate_model=None):
+    fmt, paths = jobs.resolve_corpus(SCRIPT_DIR, corpus, source_lang, target_lang)
+    segments = []
+    for item in jobs.iter_corpus(fmt, paths, source_lang, target_lang):
+        segments.append(item)
+        if limit and len(segments) >= limit: break
+    # opus100_*.json rows carry the stored model outputs: use them as metric candidates
+    if fmt == 'json':
+        with open(paths[0], encoding='utf-8') as f: rows = json.load(f)
+        rows = [r for r in (rows if isinstance(rows, list) else []) if r.get('original') or r.get('source') or r.get('text')]
+        for item, row in zip(segments, rows):
+            translations = row.get('translations') or {}
+            model = candidate_model if candidate_model in translations else next(iter(translations), None)
+            if model and (translations[model] or {}).get('text'): item['candidate'] = translations[model]['text']
+    return segments
+
+
+def percentile(values, p):
+    if not values: return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def self_peak_rss_mb():
+    if resource is None: return None
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * scale / 1048576, 1)
+
+
+def proc_peak_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'): return round(int(line.split()[1]) / 1024, 1)
+    except OSError: pass
+    return None
+
+
+class InProcessClient:
+    """Calls server.app through Flask's test client; one client per thread."""
+
+    def __init__(self):
+        import server
+        self.server, self._local = server, threading.local()
+
+    def post(self, path, body):
+        client = getattr(self._local, 'client', None)
+        if client is None: client = self._local.client = self.server.app.test_client()
+        res = client.post(path, json=body)
+        return res.status_code, res.get_json(silent=True) or {}
+
+    def get(self, path):
+        res = self.server.app.test_client().get(path)
+        return res.status_code, res.get_json(silent=True) or {}
+
+    def peak_rss_mb(self): return self_peak_rss_mb()
+
+
+class HttpClient:
+    def __init__(self, base_url, server_pid=None, timeout=600):
+        import requests
+        self.base_url, self.server_pid, self.timeout = base_url.rstrip('/'), server_pid, timeout
+        self._requests, self._local = requests, threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None: session = self._local.session = self._requests.Session()
+        return session
+
+    def post(self, path, body):
+        res = self._session().post(self.base_url + path, json=body, timeout=self.timeout)
+        try: return res.status_code, res.json()
+        except ValueError: return res.status_code, {'error': res.text[:200]}
+
+    def get(self, path):
+        res = self._session().get(self.base_url + path, timeout=self.timeout)
+        return res.status_code, res.json()
+
+    # The server's RSS is only visible when it runs on this host and its pid is given
+    def peak_rss_mb(self): return proc_peak_rss_mb(self.server_pid) if self.server_pid else None
+
+
+def loaded_models(client):
+    try:
+        status, health = client.get('/health')
+        return health.get('models', {}).get('models', {}) if status == 200 else {}
+    except Exception:
+        return {}
+
+
+def candidate_of(seg): return seg.get('candidate') or seg.get('translation') or seg.get('reference') or seg['source']
+
+
+def stage_requests(stage, segments, args):
+    """(route, [(request body, segments in it), ...]) for one stage."""
+    src, tgt, extra = args.source, args.target, {} if args.cache else {'no_cache': True}
+    kind, _, provider = stage.partition(':')
+    if kind in LOCAL_PROVIDERS + CLOUD_PROVIDERS:
+        key = {'api_key': 'bench-stub-key:fx' if kind == 'deepl' else 'bench-stub-key'} if kind in CLOUD_PROVIDERS else {}
+        return f'/translate/{kind}', [(dict(extra, text=s['source'], source_lang=src, target_lang=tgt, **key), 1) for s in segments]
+    chunks = [segments[i:i + args.batch_size] for i in range(0, len(segments), args.batch_size)]
+    if kind == 'batch':
+        if provider not in LOCAL_PROVIDERS + CLOUD_PROVIDERS: raise ValueError(f'Unknown provider for {stage}')
+        key = {'api_key': 'bench-stub-key:fx' if provider == 'deepl' else 'bench-stub-key'} if provider in CLOUD_PROVIDERS else {}
+        return '/translate/batch', [(dict(extra, provider=provider, stream=False, source_lang=src, target_lang=tgt, segments=[s['source'] for s in c], **key), len(c)) for c in chunks]
+    if kind in METRIC_ROUTES:
+        return f'/{kind}', [(dict(extra, source=s['source'], reference=s.get('reference') or '', translation=candidate_of(s), candidate=candidate_of(s), lang=tgt), 1) for s in segments]
+    if kind == 'metrics':
+        metrics = provider.split('+') if provider else None
+        pairs = lambda c: [{'source': s['source'], 'reference': s.get('reference') or '', 'translation': candidate_of(s), 'candidate': candidate_of(s), 'lang': tgt} for s in c]
+        return '/batch', [(dict(extra, pairs=pairs(c), **({'metrics': metrics} if metrics else {})), len(c)) for c in chunks]
+    if kind == 'lexical':
+        metrics = provider.split('+') if provider else None
+        pairs = lambda c: [{'source': s['source'], 'reference': s.get('reference') or '', 'candidate': candidate_of(s)} for s in c]
+        return '/lexical', [({'pairs': pairs(c), 'target_lang': tgt, 'metrics': metrics}, len(c)) for c in chunks]
+    if kind == 'judge':
+        items = lambda c: [{'original': s['source'], 'translation': candidate_of(s)} for s in c]
+        return '/judge', [(dict(extra, provider=provider or 'deepseek', api_key='bench-stub-key', source_lang=src, target_lang=tgt, items=items(c)), len(c)) for c in chunks]
+    raise ValueError(f'Unknown stage: {stage}')
+
+
+def response_error(status, payload):
+    if status != 200 or 'error' in payload: return payload.get('error') or f'HTTP {status}'
+    failed = [r.get('error') for r in payload.get('results', []) if isinstance(r, dict) and 'error' in r]
+    if failed: return failed[0]
+    if payload.get('errors'): return '; '.join(f'{k}: {v}' for k, v in payload['errors'].items())
+    return None
+
+
+def run_stage(client, stage, segments, args):
+    path, calls = stage_requests(stage, segments, args)
+    before = loaded_models(client)
+    # Keep at least one timed request when the stage is a single batch
+    n_warmup = args.warmup if len(calls) > args.warmup else 0
+    warmup, timed = calls[:n_warmup], calls[n_warmup:]
+    latencies, errors, done, translations = [], [], [0], {}
+    lock = threading.Lock()
+
+    def call(item):
+        body, count = item
+        started = time.perf_counter()
+        try: status, payload = client.post(path, body)
+        except Exception as e: status, payload = 0, {'error': str(e)}
+        elapsed = (time.perf_counter() - started) * 1000
+        error = response_error(status, payload)
+        if not error and path.startswith('/translate/'):
+            outputs = [r.get('translation') for r in payload['results']] if 'results' in payload else [payload.get('translation')]
+            for seg, text in zip(body.get('segments') or [body['text']], outputs):
+                if text: translations[seg] = text
+        with lock:
+            if error: errors.append(str(error))
+            else: done[0] += count
+        return elapsed
+
+    # Warm-up requests run serially first so model loading does not land in the latency percentiles
+    warmup_ms = [round(call(r), 1) for r in warmup]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool: latencies = list(pool.map(call, timed))
+    wall = time.perf_counter() - started
+    after = loaded_models(client)
+    for seg in segments:
+        if seg['source'] in translations: seg['translation'] = translations[seg['source']]
+
+    total = sum(count for _, count in timed)
+    result = {'route': path, 'requests': len(timed), 'segments': total, 'warmup_ms': warmup_ms, 'wall_s': round(wall, 3),
+              'segments_per_s': round(done[0] / wall, 2) if wall > 0 and done[0] else 0.0,
+              'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+              'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+              'p99_ms': round(percentile(latencies, 99), 1) if latencies else None,
+              'peak_rss_mb': client.peak_rss_mb(),
+              'models_loaded': sorted(set(after) - set(before)),
+              'model_load_s': round(sum(m.get('load_time_s', 0) for k, m in after.items() if k not in before), 2),
+              'errors': len(errors)}
+    if errors:
+        result['status'] = 'error' if len(errors) >= len(calls) else 'partial'
+        result['first_error'] = errors[0][:300]
+    else:
+        result['status'] = 'ok'
+    return result
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=SCRIPT_DIR, capture_output=True, text=True, timeout=30).stdout.strip()
+        return f'{rev}-dirty' if rev and dirty else rev or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args):
+    stub = None
+    if not args.url:
+        # server reads the provider URLs at import, so the stub must be up first
+        stub, base_url = stub_server.start_stub_server(0, args.stub_latency_ms, args.stub_fail_rate)
+        os.environ.update(stub_server.stub_env(base_url))
+    client = HttpClient(args.url, args.server_pid) if args.url else InProcessClient()
+    segments = load_segments(args.corpus, args.source, args.target, args.limit, args.candidate_model)
+    if not segments: raise SystemExit(f'No segments read from {args.corpus}')
+    report = {'meta': {'created': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'revision': git_revision(), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'mode': args.url or 'in-process', 'corpus': args.corpus,
+                       'source_lang': args.source, 'target_lang': args.target, 'segments': len(segments), 'concurrency': args.concurrency,
+                       'batch_size': args.batch_size, 'warmup': args.warmup, 'cache': args.cache, 'stub_latency_ms': None if args.url else args.stub_latency_ms,
+                       'env': {k: os.environ[k] for k in ENV_KNOBS if k in os.environ}},
+              'stages': {}}
+    print(f"\n Benchmark: {len(segments)} segments from {args.corpus} ({args.source}->{args.target}), {report['meta']['mode']}\n")
+    for stage in [s.strip() for s in args.stages.split(',') if s.strip()]:
+        try: result = run_stage(client, stage, segments, args)
+        except ValueError as e: result = {'status': 'error', 'first_error': str(e)}
+        report['stages'][stage] = result
+        if result['status'] == 'error': print(f" {stage:<18} error: {result['first_error'][:100]}")
+        else:
+            rss = f"{result['peak_rss_mb']} MB" if result['peak_rss_mb'] is not None else 'n/a'
+            print(f" {stage:<18} {result['segments_per_s']:>9.2f} seg/s  p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                  f"rss {rss}  load {result['model_load_s']}s" + (f"  ({result['errors']} errors)" if result['errors'] else ''))
+    if stub: stub.shutdown()
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\n Written to {args.out}")
+    return report
+
+
+def compare(base_path, new_path, threshold):
+    with open(base_path, encoding='utf-8') as f: base = json.load(f)
+    with open(new_path, encoding='utf-8') as f: new = json.load(f)
+    print(f"\n {base['meta'].get('revision')} -> {new['meta'].get('revision')}  (regression threshold {threshold:.0f}%)")
+    differing = [k for k in ('mode', 'corpus', 'source_lang', 'target_lang', 'segments', 'concurrency', 'batch_size', 'cache', 'stub_latency_ms', 'env') if base['meta'].get(k) != new['meta'].get(k)]
+    if differing: print(f" Note: runs differ in {', '.join(differing)}")
+    print()
+    regressions = 0
+    for stage in [s for s in new['stages'] if s in base['stages']]:
+        old_r, new_r = base['stages'][stage], new['stages'][stage]
+        if old_r.get('status') == 'error' or new_r.get('status') == 'error':
+            print(f" {stage:<18} skipped (status {old_r.get('status')} -> {new_r.get('status')})")
+            continue
+        for field, higher_better in COMPARED:
+            old_v, new_v = old_r.get(field), new_r.get(field)
+            if old_v is None or new_v is None: continue
+            change = (new_v - old_v) / old_v * 100 if old_v else 0.0
+            worse = (change < -threshold) if higher_better else (change > threshold)
+            regressions += worse
+            print(f" {stage:<18} {field:<15} {old_v:>10} -> {new_v:<10} {change:+7.1f}%" + ('  REGRESSION' if worse else ''))
+    for stage in sorted(set(base['stages']) ^ set(new['stages'])): print(f" {stage:<18} only in {'base' if stage in base['stages'] else 'new'}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Translation and metric throughput benchmark')
+    parser.add_argument('--corpus', default='1TranslationTestData/opus.de-en-test', help='opus.* prefix, .tmx or .json path relative to this directory')
+    parser.add_argument('--source', default='de')
+    parser.add_argument('--target', default='en')
+    parser.add_argument('--limit', type=int, default=200, help='segments to replay (0 = whole corpus)')
+    parser.add_argument('--stages', default=DEFAULT_STAGES, help='comma-separated: nllb, opus, argos, anthropic, openai, deepseek, deepl, batch:<provider>, '
+                        'bertscore, comet, comet-qe, bleurt, metrics[:m1+m2] (POST /batch), lexical[:m1+m2], judge[:provider] (POST /judge)')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent requests per stage')
+    parser.add_argument('--batch-size', type=int, default=32, help='segments per request for batch:*, metrics and lexical')
+    parser.add_argument('--warmup', type=int, default=1, help='requests per stage run before timing starts')
+    parser.add_argument('--cache', action='store_true', help='allow cached translations and scores (bypassed by default)')
+    parser.add_argument('--candidate-model', help='model in a 1Results JSON whose stored output is scored')
+    parser.add_argument('--url', help='benchmark a running server instead of importing server.py')
+    parser.add_argument('--server-pid', type=int, help='pid of the --url server, for its peak RSS')
+    parser.add_argument('--stub-latency-ms', type=float, default=200, help='simulated cloud provider latency')
+    parser.add_argument('--stub-fail-rate', type=float, default=0.0)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two reports instead of running')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent change reported as a regression by --compare')
+    args = parser.parse_args()
+    if args.compare: sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    run(args)
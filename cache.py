@@ -0,0 +1,105 @@
+"""
+Persistent content-addressed cache for translations and metric scores.
+Entries live in a single SQLite file, keyed by a SHA-256 of their inputs and
+evicted least-recently-used first once the total payload exceeds max_bytes.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def make_key(kind, *parts):
+    return hashlib.sha256(json.dumps([kind, *parts], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path, max_bytes):
+        self.path, self.max_bytes = path, int(max_bytes)
+        self._lock = threading.Lock()
+        self._conn, self._pid, self._total = None, None, 0
+        self._stats, self._evictions = {}, 0
+
+    def _db(self):
+        # SQLite handles must not cross fork(); each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+            self._pid = os.getpid()
+            self._total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        return self._conn
+
+    def _count(self, kind, field, n=1):
+        self._stats.setdefault(kind, {'hits': 0, 'misses': 0, 'writes': 0})[field] += n
+
+    def get(self, kind, key):
+        return self.get_many(kind, [key]).get(key)
+
+    def get_many(self, kind, keys):
+        found = {}
+        with self._lock:
+            db = self._db()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = db.execute(f'SELECT key, value FROM entries WHERE key IN ({",".join("?" * len(chunk))})', chunk).fetchall()
+                found.update((k, json.loads(v)) for k, v in rows)
+            if found: db.executemany('UPDATE entries SET accessed = ? WHERE key = ?', [(time.time(), k) for k in found])
+            self._count(kind, 'hits', len(found))
+            self._count(kind, 'misses', len(set(keys)) - len(found))
+        return found
+
+    def put(self, kind, key, value):
+        self.put_many(kind, {key: value})
+
+    def put_many(self, kind, values):
+        if not values: return
+        rows = [(k, kind, json.dumps(v, ensure_ascii=False)) for k, v in values.items()]
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN')
+            try:
+                replaced = 0
+                for k, _, v in rows:
+                    old = db.execute('SELECT size FROM entries WHERE key = ?', (k,)).fetchone()
+                    replaced += old[0] if old else 0
+                db.executemany('INSERT OR REPLACE INTO entries (key, kind, value, size, accessed) VALUES (?, ?, ?, ?, ?)', [(k, kd, v, len(v), time.time()) for k, kd, v in rows])
+                db.execute('COMMIT')
+            except BaseException:
+                # Leave the shared connection usable (outside a transaction) for the next caller
+                db.execute('ROLLBACK')
+                raise
+            self._total += sum(len(v) for _, _, v in rows) - replaced
+            self._count(kind, 'writes', len(rows))
+            if self._total > self.max_bytes: self._evict(db)
+
+    def _evict(self, db):
+        # Other processes may write to the same file, so re-read the real total first
+        self._total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        target = self.max_bytes * 0.9
+        if self._total <= target: return
+        victims, freed = [], 0
+        for key, size in db.execute('SELECT key, size FROM entries ORDER BY accessed'):
+            if self._total - freed <= target: break
+            victims.append((key,))
+            freed += size
+        db.executemany('DELETE FROM entries WHERE key = ?', victims)
+        self._total -= freed
+        self._evictions += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._db().execute('DELETE FROM entries')
+            self._total = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._db().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            kinds = {kind: dict(s, hit_rate=round(s['hits'] / (s['hits'] + s['misses']), 3) if s['hits'] + s['misses'] else 0) for kind, s in self._stats.items()}
+            return {'path': self.path, 'entries': entries, 'size_mb': round(self._total / 1048576, 2), 'max_mb': round(self.max_bytes / 1048576, 2), 'evictions': self._evictions, 'kinds': kinds}
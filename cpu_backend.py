@@ -0,0 +1,262 @@
+"""
+Optional CPU inference backends for the local translators and metric models.
+CPU_BACKEND sets the default and CPU_BACKENDS overrides it per model key with
+first-match glob rules, e.g. "nllb-200-*=int8,opus-mt-*=onnx,comet=int8":
+  fp32  unchanged PyTorch (default)
+  int8  torch dynamic int8 quantization of the Linear layers
+  onnx  ONNX Runtime via optimum, seq2seq translators only (metric models use int8)
+Converted translators are cached under hf_cache/cpu_backends/ and reused on the next
+load. Backends only apply to models that run on the CPU.
+
+Accuracy drift against fp32 on a 1Results sample:
+  python cpu_backend.py --backend int8 --models opus-mt-en-de,comet --sample 1Results/opus100_en_de.json
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKENDS = ('fp32', 'int8', 'onnx')
+ARTIFACT_DIR = os.environ.get('CPU_BACKEND_DIR', os.path.join(SCRIPT_DIR, 'hf_cache', 'cpu_backends'))
+DEFAULT_BACKEND = os.environ.get('CPU_BACKEND', 'fp32').strip().lower()
+RULES = [tuple(p.strip().lower() for p in rule.split('=', 1)) for rule in os.environ.get('CPU_BACKENDS', '').split(',') if '=' in rule]
+ORT_THREADS = int(os.environ.get('TORCH_NUM_THREADS', 0))
+_overrides, _active = {}, {}
+
+
+def _checked(backend):
+    if backend in BACKENDS: return backend
+    logger.warning(f"Unknown CPU backend '{backend}' (expected {', '.join(BACKENDS)}), using fp32")
+    return 'fp32'
+
+
+def configured(key):
+    if key in _overrides: return _overrides[key]
+    for pattern, backend in RULES:
+        if fnmatch.fnmatchcase(key.lower(), pattern): return _checked(backend)
+    return _checked(DEFAULT_BACKEND)
+
+
+def backend_for(key, device='cpu', translator=True):
+    if device != 'cpu': return 'fp32'
+    backend = configured(key)
+    return 'int8' if backend == 'onnx' and not translator else backend
+
+
+def cache_suffix(key, device='cpu', translator=True):
+    """Appended to cache keys so converted-model outputs never mix with fp32 ones. Once the model has loaded this is
+    the backend it actually runs (a failed conversion falls back to fp32), before that the configured one."""
+    backend = _active[key] if key in _active else backend_for(key, device, translator)
+    return '' if backend == 'fp32' else f'+{backend}'
+
+
+def set_backend(key, backend):
+    if backend is None: _overrides.pop(key, None)
+    else: _overrides[key] = _checked(backend)
+
+
+def active():
+    return dict(_active)
+
+
+def module_bytes(module):
+    # Dynamic-quantized weights live in packed params rather than parameters(); tied weights count once
+    total, seen = 0, set()
+    for value in module.state_dict().values():
+        for t in (value if isinstance(value, (tuple, list)) else (value,)):
+            if not hasattr(t, 'element_size'): continue
+            ident = (t.data_ptr(), t.numel())
+            if ident in seen: continue
+            seen.add(ident)
+            total += t.numel() * t.element_size()
+    return total
+
+
+def _quantize(module):
+    import torch
+    module = torch.ao.quantization.quantize_dynamic(module.eval(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    module.footprint_bytes = module_bytes(module)
+    return module
+
+
+def _artifact_dir(backend, hf_name): return os.path.join(ARTIFACT_DIR, backend, hf_name.replace('/', '--'))
+
+
+def _versions():
+    import torch, transformers
+    return {'torch': torch.__version__, 'transformers': transformers.__version__}
+
+
+def _load_int8_seq2seq(hf_name):
+    import torch
+    from transformers import AutoConfig, AutoModelForSeq2SeqLM, GenerationConfig
+    path, versions = _artifact_dir('int8', hf_name), dict(_versions(), format='state_dict')
+    # Only the quantized weights are cached, loaded with weights_only=True so nothing is unpickled: the architecture
+    # is rebuilt from the config and quantized the same way first. Packed weights are tied to the versions that wrote them
+    try:
+        with open(os.path.join(path, 'versions.json'), encoding='utf-8') as f: cached = json.load(f)
+        if cached == versions:
+            model = _quantize(AutoModelForSeq2SeqLM.from_config(AutoConfig.from_pretrained(hf_name)))
+            model.load_state_dict(torch.load(os.path.join(path, 'model.pt'), weights_only=True))
+            # from_config() leaves the hub's generation defaults (beams, bad words, max length) behind
+            try: model.generation_config = GenerationConfig.from_pretrained(hf_name)
+            except OSError: pass
+            model.footprint_bytes = module_bytes(model)
+            return model
+    except FileNotFoundError: pass
+    except Exception as e: logger.warning(f"Rebuilding int8 artifact for {hf_name}: {e}")
+    model = _quantize(AutoModelForSeq2SeqLM.from_pretrained(hf_name))
+    try:
+        os.makedirs(path, exist_ok=True)
+        tmp = os.path.join(path, f'model.pt.{os.getpid()}.tmp')
+        torch.save(model.state_dict(), tmp)
+        os.replace(tmp, os.path.join(path, 'model.pt'))
+        with open(os.path.join(path, 'versions.json'), 'w', encoding='utf-8') as f: json.dump(versions, f)
+    except Exception as e:
+        logger.warning(f"Could not cache int8 {hf_name}: {e}")
+    return model
+
+
+def _load_onnx_seq2seq(hf_name):
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    path = _artifact_dir('onnx', hf_name)
+    if not os.path.exists(os.path.join(path, 'config.json')):
+        logger.info(f"Exporting {hf_name} to ONNX (once)...")
+        tmp = f'{path}.{os.getpid()}.tmp'
+        ORTModelForSeq2SeqLM.from_pretrained(hf_name, export=True).save_pretrained(tmp)
+        # Another worker may have finished the same export first
+        try: os.rename(tmp, path)
+        except OSError: shutil.rmtree(tmp, ignore_errors=True)
+    options = onnxruntime.SessionOptions()
+    if ORT_THREADS: options.intra_op_num_threads = ORT_THREADS
+    model = ORTModelForSeq2SeqLM.from_pretrained(path, provider='CPUExecutionProvider', session_options=options)
+    model.footprint_bytes = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if f.endswith(('.onnx', '.onnx_data')))
+    return model
+
+
+def load_seq2seq(key, hf_name):
+    """Translation model for registry key, with its configured backend (the translators always run on the CPU)."""
+    backend = backend_for(key)
+    if backend != 'fp32':
+        try:
+            model = _load_int8_seq2seq(hf_name) if backend == 'int8' else _load_onnx_seq2seq(hf_name)
+            _active[key] = backend
+            logger.info(f"{hf_name} using {backend} backend ({model.footprint_bytes / 1048576:.0f} MB)")
+            return model
+        except Exception as e:
+            logger.error(f"{backend} backend failed for {key}, using fp32: {e}")
+    from transformers import AutoModelForSeq2SeqLM
+    _active[key] = 'fp32'
+    return AutoModelForSeq2SeqLM.from_pretrained(hf_name)
+
+
+def convert_module(key, module, device='cpu'):
+    """Metric model module converted in place to its configured backend (int8 on CPU, otherwise unchanged)."""
+    backend = backend_for(key, device, translator=False)
+    if backend != 'fp32':
+        try:
+            module = _quantize(module)
+            _active[key] = backend
+            logger.info(f"{key} using {backend} backend ({module.footprint_bytes / 1048576:.0f} MB)")
+            return module
+        except Exception as e:
+            logger.error(f"{backend} backend failed for {key}, using fp32: {e}")
+    _active[key] = 'fp32'
+    return module
+
+
+def _load_sample(path, limit, candidate_model=None):
+    with open(path, encoding='utf-8') as f: rows = json.load(f)
+    items = []
+    for row in rows[:limit]:
+        translations = row.get('translations') or {}
+        model = candidate_model if candidate_model in translations else next(iter(translations), None)
+        candidate = (translations.get(model) or {}).get('text') if model else None
+        items.append({'source': row['original'], 'reference': row.get('reference') or '', 'candidate': candidate or row.get('reference') or '',
+                      'source_lang': row.get('sourceLang', 'en'), 'target_lang': row.get('targetLang', 'de')})
+    return items
+
+
+def _pearson(xs, ys):
+    n = len(xs)
+    mx, my = sum(xs) / n, sum(ys) / n
+    sxy = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    sx, sy = sum((x - mx) ** 2 for x in xs) ** 0.5, sum((y - my) ** 2 for y in ys) ** 0.5
+    return sxy / (sx * sy) if sx and sy else None
+
+
+def _run(server, key, backend, items, batch_size):
+    set_backend(key, backend)
+    server._models.unload(key)
+    started = time.perf_counter()
+    if key in server.METRIC_SCORERS:
+        outputs = server.score_metric_batched(key, items)
+        outputs = [o['f1'] if isinstance(o, dict) else o for o in outputs]
+    else:
+        provider, src, tgt = ('nllb', items[0]['source_lang'], items[0]['target_lang']) if key in server.NLLB_VARIANTS else ('opus', *key[len('opus-mt-'):].split('-'))
+        model, tokenizer, gen_kwargs, _ = server.get_local_translator(provider, src, tgt, key)
+        outputs = []
+        for i in range(0, len(items), batch_size):
+            outputs += server.generate_local(model, tokenizer, [it['source'] for it in items[i:i + batch_size]], server.LOCAL_NUM_BEAMS, **gen_kwargs)
+    elapsed = time.perf_counter() - started
+    entry = server._models.stats()['models'].get(key, {})
+    server._models.unload(key)
+    set_backend(key, None)
+    load_s = entry.get('load_time_s', 0)
+    return outputs, {'backend': active().get(key, backend), 'load_s': load_s, 'run_s': round(elapsed - load_s, 3), 'size_mb': entry.get('size_mb')}
+
+
+def drift_check(keys, backend, sample_path, limit=50, batch_size=8, candidate_model=None):
+    import lexical_metrics
+    import server
+    items = _load_sample(sample_path, limit, candidate_model)
+    report = {'sample': sample_path, 'segments': len(items), 'backend': backend, 'models': {}}
+    for key in keys:
+        try:
+            base, base_info = _run(server, key, 'fp32', items, batch_size)
+            converted, info = _run(server, key, backend, items, batch_size)
+        except Exception as e:
+            report['models'][key] = {'error': str(e)}
+            continue
+        result = {'fp32': base_info, backend: info, 'speedup': round(base_info['run_s'] / info['run_s'], 2) if info['run_s'] else None,
+                  'size_ratio': round(info['size_mb'] / base_info['size_mb'], 3) if info['size_mb'] and base_info['size_mb'] else None}
+        if key in server.METRIC_SCORERS:
+            diffs = [abs(a - b) for a, b in zip(base, converted)]
+            result.update({'mean_abs_diff': round(sum(diffs) / len(diffs), 5), 'max_abs_diff': round(max(diffs), 5), 'pearson': round(_pearson(base, converted) or 0, 5)})
+        else:
+            lang = lexical_metrics.meteor_lang(items[0]['target_lang'])
+            versus = lambda refs, cands: lexical_metrics.score_batch([{'reference': r, 'candidate': c} for r, c in zip(refs, cands)], ['bleu', 'chrF'], lang, corpus=True, workers=1)[1]
+            refs = [it['reference'] for it in items]
+            result.update({'identical': round(sum(a == b for a, b in zip(base, converted)) / len(items), 3), 'vs_fp32': versus(base, converted),
+                           'vs_reference': {'fp32': versus(refs, base), backend: versus(refs, converted)}})
+        report['models'][key] = result
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Accuracy drift and speed of a CPU backend against fp32')
+    parser.add_argument('--backend', default='int8', choices=[b for b in BACKENDS if b != 'fp32'])
+    parser.add_argument('--models', default='opus-mt-en-de,comet', help='comma-separated model keys (nllb-200-600m, opus-mt-en-de, comet, comet_qe, bleurt, bertscore)')
+    parser.add_argument('--sample', default='1Results/opus100_en_de.json')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--candidate-model', help='stored translation scored by the metric models (default: first in the file)')
+    parser.add_argument('--max-mean-diff', type=float, default=0.01, help='fail when a metric drifts more than this on average')
+    parser.add_argument('--min-chrf', type=float, default=90.0, help='fail when translations score below this chrF against the fp32 output')
+    parser.add_argument('--out')
+    args = parser.parse_args()
+    report = drift_check([k.strip() for k in args.models.split(',') if k.strip()], args.backend, os.path.join(SCRIPT_DIR, args.sample), args.limit, args.batch_size, args.candidate_model)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2, ensure_ascii=False)
+    failed = [k for k, r in report['models'].items() if 'error' in r or r.get('mean_abs_diff', 0) > args.max_mean_diff or float((r.get('vs_fp32') or {}).get('chrF', 100)) < args.min_chrf]
+    if failed: print(f"\n Failed or drifted above threshold: {', '.join(failed)}")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,40 @@
+"""
+Production serving (Linux/macOS): gunicorn -c gunicorn.conf.py server:app
+
+The app is imported once in the master. With PRELOAD_MODELS set, the models are
+loaded there before workers fork, so read-only weights are shared copy-on-write
+instead of being loaded once per worker. On GPU nodes set PRELOAD_IN_MASTER=0:
+CUDA cannot be initialised before fork, so each worker preloads after forking.
+"""
+
+import gc
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = True
+# Model loading and long batch/stream responses can legitimately take minutes
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 600))
+graceful_timeout = 60
+keepalive = 5
+
+PRELOAD_IN_MASTER = os.environ.get('PRELOAD_IN_MASTER', '1') != '0'
+
+
+def when_ready(server):
+    app_module = sys.modules.get('server')
+    if app_module and PRELOAD_IN_MASTER and app_module.PRELOAD_MODELS:
+        server.log.info(f"Preloading models in master: {', '.join(app_module.PRELOAD_MODELS)}")
+        app_module.preload_models(background=False)
+    # Keep the collector from touching (and so copying) objects inherited by workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    app_module = sys.modules.get('server')
+    if not app_module: return
+    app_module.configure_torch()
+    if not PRELOAD_IN_MASTER: app_module.preload_models()
@@ -0,0 +1,245 @@
+"""
+Request and stage instrumentation, served at /metrics.
+Per-route request counts and latency histograms, stage timings (model load, tokenize,
+generate/forward, outbound provider HTTP), tokens and batch sizes, plus values pulled
+from registered collectors (cache, providers, models) and process RSS / torch memory
+at scrape time. Prometheus text by default, JSON with ?format=json.
+Values are per process: under gunicorn every worker keeps its own.
+
+PROFILE_REQUESTS=1 enables ?profile=1 on any route: that request runs under cProfile, with
+its forward passes on the request thread (single-segment metrics skip the micro-batcher),
+and the trace is written to PROFILE_DIR and named in the X-Profile response header.
+"""
+
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try: import resource
+except ImportError: resource = None  # POSIX only: no peak-RSS gauge on Windows
+
+PREFIX = 'translator'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '0') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'profiles'))
+
+HELP = {
+    'http_requests_total': 'Requests by route, method and status',
+    'http_request_duration_seconds': 'Time until the response is returned (streamed bodies excluded)',
+    'stage_duration_seconds': 'Time spent in one processing stage (model_load, tokenize, generate, forward, provider_http)',
+    'tokens_total': 'Tokens processed (metric inputs are the approx_tokens() estimate)',
+    'batch_size': 'Items per batched generate/forward call',
+    'process_resident_memory_bytes': 'Current resident set size',
+    'process_peak_resident_memory_bytes': 'Peak resident set size',
+    'torch_memory_allocated_bytes': 'Memory held by torch tensors on the accelerator',
+    'torch_memory_reserved_bytes': 'Memory reserved by the torch caching allocator',
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets, self.counts, self.sum, self.count = buckets, [0] * (len(buckets) + 1), 0.0, 0
+
+    def observe(self, value):
+        # Buckets are inclusive upper bounds (Prometheus 'le')
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (None past the last bucket)."""
+        if not self.count: return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets + (None,), self.counts):
+            seen += n
+            if seen >= rank: return bound
+        return None
+
+
+_lock = threading.Lock()
+_counters, _histograms, _collectors = {}, {}, []
+_local = threading.local()
+_profile_lock = threading.Lock()
+_started = time.time()
+
+
+def _key(name, labels): return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, n=1, **labels):
+    key = _key(name, labels)
+    with _lock: _counters[key] = _counters.get(key, 0) + n
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None: hist = _histograms[key] = Histogram(buckets)
+        hist.observe(value)
+
+
+def observe_stage(name, seconds, **labels): observe('stage_duration_seconds', seconds, stage=name, **labels)
+
+
+@contextmanager
+def stage(name, **labels):
+    started = time.perf_counter()
+    try: yield
+    finally: observe_stage(name, time.perf_counter() - started, **labels)
+
+
+def record_batch(kind, size, tokens=None, **labels):
+    observe('batch_size', size, SIZE_BUCKETS, kind=kind, **labels)
+    if tokens: inc('tokens_total', tokens, kind=kind, **labels)
+
+
+def register_collector(fn, help=None):
+    """fn() -> iterable of (name, 'gauge'|'counter', labels dict, value), called on every scrape."""
+    _collectors.append(fn)
+    HELP.update(help or {})
+
+
+def profiling():
+    """True on the thread of a request being profiled: inference should run inline there."""
+    return getattr(_local, 'profiling', False)
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError): return None
+
+
+def _process_values():
+    rows = []
+    if resource is not None: rows.append(('process_peak_resident_memory_bytes', 'gauge', {}, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)))
+    rss = _rss_bytes()
+    if rss is not None: rows.append(('process_resident_memory_bytes', 'gauge', {}, rss))
+    # Only report torch memory once something else has imported torch
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        try:
+            if torch.cuda.is_available():
+                for i in range(torch.cuda.device_count()):
+                    rows.append(('torch_memory_allocated_bytes', 'gauge', {'device': f'cuda:{i}'}, torch.cuda.memory_allocated(i)))
+                    rows.append(('torch_memory_reserved_bytes', 'gauge', {'device': f'cuda:{i}'}, torch.cuda.memory_reserved(i)))
+            elif hasattr(torch, 'mps') and torch.backends.mps.is_available():
+                rows.append(('torch_memory_allocated_bytes', 'gauge', {'device': 'mps'}, torch.mps.current_allocated_memory()))
+        except Exception: pass
+    return rows
+
+
+def _collected():
+    rows = _process_values()
+    for fn in _collectors:
+        try: rows.extend(fn())
+        except Exception: continue
+    return rows
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: (h.count, h.sum, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99)) for k, h in _histograms.items()}
+    out = {'pid': os.getpid(), 'uptime_s': round(time.time() - _started, 1), 'counters': {}, 'histograms': {}, 'gauges': {}}
+    for (name, labels), value in sorted(counters.items()): out['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+    for (name, labels), (count, total, p50, p95, p99) in sorted(histograms.items()):
+        out['histograms'].setdefault(name, []).append({'labels': dict(labels), 'count': count, 'sum': round(total, 6), 'mean': round(total / count, 6) if count else None, 'p50_le': p50, 'p95_le': p95, 'p99_le': p99})
+    for name, kind, labels, value in _collected(): out['counters' if kind == 'counter' else 'gauges'].setdefault(name, []).append({'labels': labels, 'value': value})
+    return out
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items: return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in items) + '}'
+
+
+def render_prometheus():
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, (h.buckets, list(h.counts), h.sum, h.count)) for k, h in _histograms.items())
+    lines, typed = [], set()
+
+    def header(name, kind):
+        if name in typed: return
+        typed.add(name)
+        if name in HELP: lines.append(f'# HELP {PREFIX}_{name} {HELP[name]}')
+        lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+
+    for (name, labels), value in counters:
+        header(name, 'counter')
+        lines.append(f'{PREFIX}_{name}{_labels(labels)} {value}')
+    for (name, labels), (buckets, counts, total, count) in histograms:
+        header(name, 'histogram')
+        cumulative = 0
+        for bound, n in zip(buckets + ('+Inf',), counts):
+            cumulative += n
+            lines.append(f'{PREFIX}_{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{PREFIX}_{name}_sum{_labels(labels)} {total}')
+        lines.append(f'{PREFIX}_{name}_count{_labels(labels)} {count}')
+    for name, kind, labels, value in sorted(_collected(), key=lambda r: r[0]):
+        if value is None: continue
+        header(name, kind)
+        lines.append(f'{PREFIX}_{name}{_labels(sorted(labels.items()))} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _start_profile():
+    if not _profile_lock.acquire(blocking=False): return None
+    profile = cProfile.Profile()
+    _local.profiling = True
+    profile.enable()
+    return profile
+
+
+def _stop_profile(profile, route):
+    profile.disable()
+    _local.profiling = False
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'}")
+        profile.dump_stats(path + '.prof')
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(40)
+        with open(path + '.txt', 'w', encoding='utf-8') as f: f.write(text.getvalue())
+        return os.path.basename(path) + '.prof'
+    finally:
+        _profile_lock.release()
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def _before():
+        g.instrument_started = time.perf_counter()
+        if request.args.get('profile') == '1' and PROFILE_REQUESTS: g.instrument_profile = _start_profile()
+
+    @app.after_request
+    def _after(response):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        profile = g.pop('instrument_profile', None)
+        if profile is not None: response.headers['X-Profile'] = _stop_profile(profile, route)
+        elif request.args.get('profile') == '1': response.headers['X-Profile'] = 'busy' if PROFILE_REQUESTS else 'disabled (set PROFILE_REQUESTS=1)'
+        started = g.pop('instrument_started', None)
+        if started is not None:
+            inc('http_requests_total', route=route, method=request.method, status=response.status_code)
+            observe('http_request_duration_seconds', time.perf_counter() - started, route=route, method=request.method)
+        return response
+
+    @app.teardown_request
+    def _teardown(exc):
+        # after_request is skipped when a view raises; never leave the profiler running
+        profile = g.pop('instrument_profile', None)
+        if profile is not None: _stop_profile(profile, 'error')
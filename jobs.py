@@ -0,0 +1,241 @@
+"""
+Server-side corpus evaluation jobs.
+Corpora are read incrementally (TMX, parallel opus.* text files, JSON test sets),
+pushed through translate -> score stages over bounded queues, and every finished
+segment is appended to jobs/<id>/results.ndjson so an interrupted job resumes
+where it stopped. The runner holds an exclusive flock on jobs/<id>/run.lock, so every
+worker process sees whether a job is live and a second runner cannot start.
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+try: import fcntl
+except ImportError: fcntl = None  # No flock (Windows): liveness is only known to the process running the job
+
+TU_RE = re.compile(r'<tu[^>]*>(.*?)</tu>', re.S | re.I)
+TUV_RE = re.compile(r'''<tuv[^>]*(?:xml:lang|lang)=["']([^"']+)["'][^>]*>.*?<seg>(.*?)</seg>''', re.S | re.I)
+TMX_CHUNK_CHARS = 1024 * 1024
+MAX_SOURCE_CHARS = 5000
+
+
+def _unescape(text):
+    return text.strip().replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&').replace('&quot;', '"').replace('&apos;', "'")
+
+
+def iter_tmx(path, source_lang, target_lang):
+    # Same chunked regex scan as parseStreamingTMX() in utils.js: constant memory and tolerant of
+    # the malformed <seg>/<tmx> nesting some of the bundled TMX files have, which iterparse rejects
+    src, tgt = source_lang.lower(), target_lang.lower()
+    buffer = ''
+    with open(path, encoding='utf-8', errors='replace') as f:
+        while True:
+            chunk = f.read(TMX_CHUNK_CHARS)
+            buffer += chunk
+            for match in TU_RE.finditer(buffer):
+                original, translation, tuvs = None, None, []
+                for lang, text in TUV_RE.findall(match.group(1)):
+                    lang, text = lang.lower().split('-')[0], _unescape(text)
+                    tuvs.append(text)
+                    if lang == src: original = text
+                    elif lang == tgt: translation = text
+                if not original and len(tuvs) >= 2: original, translation = tuvs[0], tuvs[1]
+                if original and len(original) < MAX_SOURCE_CHARS: yield {'source': original, 'reference': translation}
+            last = buffer.rfind('</tu>')
+            buffer = buffer[last + 5:] if last > -1 else (buffer[-10000:] if len(buffer) > 50000 else buffer)
+            if not chunk: break
+
+
+def iter_parallel(source_path, target_path):
+    with open(source_path, encoding='utf-8', errors='replace') as fs, open(target_path, encoding='utf-8', errors='replace') as ft:
+        for source, reference in zip(fs, ft):
+            source, reference = source.strip(), reference.strip()
+            if source and reference: yield {'source': source, 'reference': reference}
+
+
+def iter_json(path):
+    with open(path, encoding='utf-8') as f: data = json.load(f)
+    for item in data if isinstance(data, list) else data.get('tests') or data.get('pairs') or []:
+        source = item.get('original') or item.get('source') or item.get('text')
+        if source: yield {'source': source, 'reference': item.get('reference') or item.get('translation') or item.get('target')}
+
+
+def resolve_corpus(base_dir, corpus, source_lang, target_lang):
+    """Return (format, paths) for a corpus path relative to base_dir; opus.* pairs are given without the language suffix."""
+    def inside(p):
+        full = os.path.realpath(os.path.join(base_dir, p))
+        if os.path.commonpath([full, os.path.realpath(base_dir)]) != os.path.realpath(base_dir): raise ValueError(f'Corpus outside project directory: {p}')
+        return full
+    path = inside(corpus)
+    if path.lower().endswith('.tmx'): fmt, paths = 'tmx', [path]
+    elif path.lower().endswith('.json'): fmt, paths = 'json', [path]
+    else: fmt, paths = 'parallel', [inside(f'{corpus}.{source_lang}'), inside(f'{corpus}.{target_lang}')]
+    missing = [p for p in paths if not os.path.isfile(p)]
+    if missing: raise ValueError(f'Corpus file not found: {", ".join(os.path.relpath(p, base_dir) for p in missing)}')
+    return fmt, paths
+
+
+def iter_corpus(fmt, paths, source_lang, target_lang):
+    if fmt == 'tmx': return iter_tmx(paths[0], source_lang, target_lang)
+    if fmt == 'json': return iter_json(paths[0])
+    return iter_parallel(*paths)
+
+
+class JobManager:
+    """translate_fn(spec, secrets, items) fills item['translation'] (or 'error'); score_fn(spec, items) fills item['scores']."""
+
+    def __init__(self, root, base_dir, translate_fn, score_fn, chunk_size=32, queue_size=4):
+        self.root, self.base_dir = root, base_dir
+        self.translate_fn, self.score_fn = translate_fn, score_fn
+        self.chunk_size, self.queue_size = chunk_size, queue_size
+        self._lock = threading.Lock()
+        self._threads, self._cancel, self._secrets = {}, {}, {}
+
+    def _dir(self, job_id): return os.path.join(self.root, job_id)
+
+    def _save(self, job):
+        job['updated'] = time.time()
+        path = os.path.join(self._dir(job['id']), 'job.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f: json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def get(self, job_id):
+        if not re.fullmatch(r'[0-9a-f]{12}', job_id or ''): return None
+        try:
+            with open(os.path.join(self._dir(job_id), 'job.json'), encoding='utf-8') as f: job = json.load(f)
+        except FileNotFoundError: return None
+        if job['status'] in ('queued', 'running') and not self._is_alive(job_id): job['status'] = 'interrupted'
+        return job
+
+    def list(self):
+        if not os.path.isdir(self.root): return []
+        jobs = [self.get(name) for name in sorted(os.listdir(self.root))]
+        return sorted([j for j in jobs if j], key=lambda j: j['created'], reverse=True)
+
+    def results_path(self, job_id): return os.path.join(self._dir(job_id), 'results.ndjson')
+
+    def _try_lock(self, job_id):
+        """The job's run lock as an open file, or None while a runner in any process holds it."""
+        f = open(os.path.join(self._dir(job_id), 'run.lock'), 'a')
+        if fcntl is None: return f
+        try: fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        return f
+
+    def _is_alive(self, job_id):
+        thread = self._threads.get(job_id)
+        if thread is not None and thread.is_alive(): return True
+        if fcntl is None: return False
+        lock = self._try_lock(job_id)
+        if lock is None: return True
+        lock.close()
+        return False
+
+    def create(self, spec, secrets=None):
+        fmt, _ = resolve_corpus(self.base_dir, spec['corpus'], spec['source_lang'], spec['target_lang'])
+        job = {'id': uuid.uuid4().hex[:12], 'spec': spec, 'format': fmt, 'status': 'queued', 'processed': 0, 'errors': 0, 'created': time.time(), 'error': None}
+        os.makedirs(self._dir(job['id']), exist_ok=True)
+        open(self.results_path(job['id']), 'a').close()
+        self._save(job)
+        self.start(job['id'], secrets)
+        return self.get(job['id'])
+
+    def start(self, job_id, secrets=None):
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive(): return False
+            lock = self._try_lock(job_id)
+            if lock is None: return False
+            if secrets: self._secrets[job_id] = secrets
+            self._cancel[job_id] = threading.Event()
+            self._threads[job_id] = threading.Thread(target=self._run, args=(job_id, lock), name=f'job-{job_id}', daemon=True)
+            self._threads[job_id].start()
+            return True
+
+    def _cancel_path(self, job_id): return os.path.join(self._dir(job_id), 'cancel')
+
+    def cancel(self, job_id):
+        thread, event = self._threads.get(job_id), self._cancel.get(job_id)
+        if event and thread is not None and thread.is_alive():
+            event.set()
+            return True
+        # The runner lives in another worker process: leave a marker it checks after every chunk
+        if not self._is_alive(job_id): return False
+        open(self._cancel_path(job_id), 'w').close()
+        return True
+
+    def _completed_lines(self, job_id):
+        # Results are appended before job.json is updated, so the file is the source of truth;
+        # a torn last line from a crash is dropped and that segment is redone
+        path, count, good = self.results_path(job_id), 0, 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'): break
+                count, good = count + 1, good + len(line)
+        with open(path, 'r+b') as f: f.truncate(good)
+        return count
+
+    def _run(self, job_id, lock):
+        try:
+            if os.path.exists(self._cancel_path(job_id)): os.remove(self._cancel_path(job_id))
+            self._execute(job_id)
+        finally:
+            # A stale event would swallow a later cancel aimed at a runner in another process
+            self._cancel.pop(job_id, None)
+            lock.close()
+
+    def _execute(self, job_id):
+        job = self.get(job_id)
+        spec, cancel, secrets = job['spec'], self._cancel[job_id], self._secrets.get(job_id, {})
+        job.update(status='running', error=None, processed=self._completed_lines(job_id))
+        self._save(job)
+        translated, done = queue.Queue(self.queue_size), object()
+
+        def translate_stage():
+            try:
+                fmt, paths = resolve_corpus(self.base_dir, spec['corpus'], spec['source_lang'], spec['target_lang'])
+                chunk, limit = [], spec.get('limit')
+                for index, item in enumerate(iter_corpus(fmt, paths, spec['source_lang'], spec['target_lang'])):
+                    if limit and index >= limit or cancel.is_set(): break
+                    if index < job['processed']: continue
+                    chunk.append(dict(item, index=index))
+                    if len(chunk) >= self.chunk_size:
+                        translated.put(self.translate_fn(spec, secrets, chunk))
+                        chunk = []
+                if chunk and not cancel.is_set(): translated.put(self.translate_fn(spec, secrets, chunk))
+                translated.put(done)
+            except Exception as e:
+                translated.put(e)
+
+        threading.Thread(target=translate_stage, name=f'job-{job_id}-translate', daemon=True).start()
+        try:
+            with open(self.results_path(job_id), 'a', encoding='utf-8') as out:
+                while True:
+                    items = translated.get()
+                    if items is done: break
+                    if isinstance(items, Exception): raise items
+                    scorable = [it for it in items if 'error' not in it]
+                    if scorable and spec.get('metrics'): self.score_fn(spec, scorable)
+                    out.write(''.join(json.dumps(it, ensure_ascii=False) + '\n' for it in items))
+                    out.flush()
+                    job['processed'] += len(items)
+                    job['errors'] += sum(1 for it in items if 'error' in it)
+                    self._save(job)
+                    if os.path.exists(self._cancel_path(job_id)): cancel.set()
+                    if cancel.is_set(): break
+            job['status'] = 'cancelled' if cancel.is_set() else 'completed'
+        except Exception as e:
+            job.update(status='failed', error=str(e))
+        finally:
+            # Unblock the reader thread if scoring stopped early
+            while not translated.empty(): translated.get_nowait()
+            cancel.set()
+            self._save(job)
+            self._secrets.pop(job_id, None)
@@ -0,0 +1,485 @@
+"""
+Server-side port of the lexical metrics (BLEU, METEOR, CER, WER, Jaccard, chrF,
+length ratio and the no-reference checks), returning the same toFixed() strings
+as the browser so runs can be scored headlessly and compared with saved exports.
+Both frontend implementations are reproduced: 'translator' (the inline functions
+translator.html runs: CJK-aware tokens, F1 chrF, uncapped error rates) and
+'metrics.js' (the standalone module).
+Edit distance is bit-parallel (Myers/Hyyro) over Python ints; corpus BLEU/chrF are
+computed from summed n-gram statistics; large batches are spread over processes.
+Parity check: python lexical_metrics.py --check "1Results/evaluation_*.json" (exits 1 on a mismatch
+that no LEGACY_FORMULAS entry explains)
+"""
+
+import argparse
+import glob
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from array import array
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, ROUND_HALF_UP
+
+import synonym_index
+
+# The JS patterns are not /u, so \w and \d are ASCII-only
+WORD_RE = re.compile(r'\b\w+\b', re.ASCII)
+WORD3_RE = re.compile(r'\b\w{3,}\b', re.ASCII)
+NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?', re.ASCII)
+SENTENCE_RE = re.compile('[.!?\u3002\uff1f\uff01]+')
+CJK = '\u4e00-\u9fff\u3400-\u4dbf\u3040-\u309f\u30a0-\u30ff\uac00-\ud7af'
+CJK_RE = re.compile(f'[{CJK}]')
+CJK_TOKEN_RE = re.compile(f'[{CJK}\\w]', re.ASCII)
+# JS \s, which is not the same set as Python's str.isspace()
+JS_SPACE = '\t\n\v\f\r \u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000\ufeff'
+JS_SPACES_RE = re.compile(f'[{JS_SPACE}]+')
+JS_SPACE_RE = re.compile(f'[{JS_SPACE}]')
+
+VARIANTS = ('translator', 'metrics.js')
+DEFAULT_VARIANT = os.environ.get('LEXICAL_VARIANT', 'translator')
+REFERENCE_METRICS = ('bleu', 'meteor', 'cer', 'wer', 'jaccard', 'chrF', 'lengthRatio')
+NO_REFERENCE_METRICS = ('repetition', 'numberPres', 'copyRate', 'charCount', 'wordCount')
+METRIC_NAMES = REFERENCE_METRICS + NO_REFERENCE_METRICS
+METRIC_ALIASES = {'chrf': 'chrF', 'length_ratio': 'lengthRatio', 'lengthratio': 'lengthRatio', 'number_preservation': 'numberPres', 'numberpres': 'numberPres',
+                  'copy_rate': 'copyRate', 'copyrate': 'copyRate', 'char_count': 'charCount', 'word_count': 'wordCount'}
+
+PARALLEL_MIN = int(os.environ.get('LEXICAL_PARALLEL_MIN', 2000))
+WORKERS = int(os.environ.get('LEXICAL_WORKERS', 0)) or os.cpu_count() or 1
+CHUNK_SIZE = 500
+
+
+def to_fixed(x, digits=2):
+    """Number.prototype.toFixed: the exact binary value rounded half away from zero."""
+    if math.isnan(x): return 'NaN'
+    if math.isinf(x): return 'Infinity' if x > 0 else '-Infinity'
+    return str(Decimal(x or 0.0).quantize(Decimal(1).scaleb(-digits), rounding=ROUND_HALF_UP))
+
+
+def js_div(a, b):
+    if b: return a / b
+    return math.nan if a == 0 else math.copysign(math.inf, a)
+
+
+def utf16(text):
+    """Text as one str char per UTF-16 code unit, so len(), slicing and n-grams match JS strings."""
+    if text.isascii() or max(map(ord, text)) < 0x10000: return text
+    return ''.join(map(chr, array('H', text.encode('utf-16-le'))))
+
+
+def is_cjk(text): return CJK_RE.search(text) is not None
+
+
+def words(text, pattern=WORD_RE): return pattern.findall(text.lower())
+
+
+def tokenize(text):
+    """tokenize() in translator.html: characters for CJK text, ASCII words otherwise."""
+    lower = text.lower()
+    if is_cjk(text): return [c for c in lower if CJK_TOKEN_RE.match(c) and not JS_SPACE_RE.match(c)]
+    return WORD_RE.findall(lower)
+
+
+def tokens_for(variant): return tokenize if variant == 'translator' else words
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two sequences, bit-parallel over the shorter one (Hyyro 2003)."""
+    if len(a) > len(b): a, b = b, a
+    m = len(a)
+    if m == 0: return len(b)
+    peq = defaultdict(int)
+    for i, c in enumerate(a): peq[c] |= 1 << i
+    mask, high = (1 << m) - 1, 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for c in b:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high: score += 1
+        elif mh & high: score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+
+def ngram_counts(tokens, n, joiner):
+    # Keys are joined like the JS object keys (translator.html joins with '', metrics.js with ' ')
+    return Counter(map(joiner.join, zip(*(tokens[i:] for i in range(n)))))
+
+
+def char_ngram_counts(text, n): return Counter(map(text.__getitem__, map(slice, range(len(text) - n + 1), range(n, len(text) + 1))))
+
+
+def clipped(cand, ref): return sum(min(c, ref[g]) for g, c in cand.items() if g in ref)
+
+
+# ---- BLEU -------------------------------------------------------------------
+
+def bleu_stats(reference, candidate, variant=DEFAULT_VARIANT):
+    """[ref_len, cand_len, matches_1, total_1, ..., matches_4, total_4]"""
+    tok, joiner = (tokenize, '') if variant == 'translator' else (words, ' ')
+    ref, cand = tok(reference), tok(candidate)
+    stats = [len(ref), len(cand)]
+    for n in range(1, 5):
+        cand_ngrams = ngram_counts(cand, n, joiner)
+        stats += [clipped(cand_ngrams, ngram_counts(ref, n, joiner)), sum(cand_ngrams.values())]
+    return stats
+
+
+def bleu_from_stats(stats):
+    ref_len, cand_len, orders = stats[0], stats[1], (len(stats) - 2) // 2
+    if cand_len == 0 or orders == 0: return 0.0
+    log_sum = 0
+    for n in range(orders):
+        matches, total = stats[2 + 2 * n], stats[3 + 2 * n]
+        log_sum += math.log((matches / total if total > 0 else 0) + 1e-10)
+    return math.exp(log_sum / orders) * min(1, math.exp(1 - ref_len / cand_len)) * 100
+
+
+def segment_bleu(stats, variant=DEFAULT_VARIANT):
+    # translator.html drops the orders longer than the shorter segment
+    if variant == 'translator': stats = stats[:2 + 2 * min(4, stats[0], stats[1])]
+    return to_fixed(bleu_from_stats(stats))
+
+
+def bleu(reference, candidate, variant=DEFAULT_VARIANT): return segment_bleu(bleu_stats(reference, candidate, variant), variant)
+
+
+# ---- chrF -------------------------------------------------------------------
+
+def chrf_stats(reference, candidate, variant=DEFAULT_VARIANT, n=6):
+    """[matches_1, cand_total_1, ref_total_1, ...] for character orders 1..n"""
+    if variant == 'translator': ref, cand = utf16(reference), utf16(candidate)
+    else: ref, cand = (utf16(JS_SPACES_RE.sub(' ', t.lower())) for t in (reference, candidate))
+    stats = []
+    for order in range(1, n + 1):
+        stats += [clipped(char_ngram_counts(cand, order), char_ngram_counts(ref, order)), max(0, len(cand) - order + 1), max(0, len(ref) - order + 1)]
+    return stats
+
+
+def chrf_from_stats(stats, variant=DEFAULT_VARIANT, beta=2):
+    if variant == 'translator':
+        # Pooled over all orders, F1
+        matches, cand_total, ref_total = sum(stats[0::3]), sum(stats[1::3]), sum(stats[2::3])
+        precision, recall = matches / cand_total if cand_total else 0, matches / ref_total if ref_total else 0
+        return (2 * precision * recall) / (precision + recall) * 100 if precision + recall > 0 else 0.0
+    total_precision, total_recall, count = 0, 0, 0
+    for i in range(0, len(stats), 3):
+        matches, cand_total, ref_total = stats[i:i + 3]
+        if cand_total > 0 and ref_total > 0:
+            total_precision += matches / cand_total
+            total_recall += matches / ref_total
+            count += 1
+    if count == 0: return 0.0
+    precision, recall = total_precision / count, total_recall / count
+    if precision + recall == 0: return 0.0
+    return (1 + beta * beta) * precision * recall / (beta * beta * precision + recall) * 100
+
+
+def chrf(reference, candidate, variant=DEFAULT_VARIANT): return to_fixed(chrf_from_stats(chrf_stats(reference, candidate, variant), variant))
+
+
+# ---- METEOR -----------------------------------------------------------------
+
+def meteor(reference, candidate, lang='en', variant=DEFAULT_VARIANT):
+    tok = tokens_for(variant)
+    ref, cand = tok(reference), tok(candidate)
+    if not ref or not cand: return '0.00'
+    # Exact pass: each candidate token takes the first unmatched equal reference token
+    positions = defaultdict(deque)
+    for i, token in enumerate(ref): positions[token].append(i)
+    ref_matched, cand_matched = set(), set()
+    for ci, token in enumerate(cand):
+        if positions.get(token):
+            ref_matched.add(positions[token].popleft())
+            cand_matched.add(ci)
+    # Synonym pass over what is left; metrics.js falls back to the English table, translator.html skips the pass
+    index = synonym_index.get_index(lang)
+    if index is None and variant != 'translator': index = synonym_index.get_index('en')
+    if index is not None and len(cand_matched) < len(cand) and len(ref_matched) < len(ref):
+        ref_groups = [None if ri in ref_matched else index.groups(rtoken) for ri, rtoken in enumerate(ref)]
+        for ci, token in enumerate(cand):
+            groups = None if ci in cand_matched else index.groups(token)
+            if not groups: continue
+            for ri, rgroups in enumerate(ref_groups):
+                if rgroups and ri not in ref_matched and not groups.isdisjoint(rgroups):
+                    ref_matched.add(ri)
+                    cand_matched.add(ci)
+                    break
+    matches = len(cand_matched)
+    if matches == 0: return '0.00'
+    precision, recall = matches / len(cand), matches / len(ref)
+    if variant == 'translator':
+        alpha = 0.9
+        f_mean = (precision * recall) / (alpha * precision + (1 - alpha) * recall)
+        matched = sorted(cand_matched)
+    else:
+        f_mean = (10 * precision * recall) / (9 * precision + recall)
+        matched = sorted(ref_matched)
+    chunks, last = 0, -2
+    for i in matched:
+        if i != last + 1: chunks += 1
+        last = i
+    return to_fixed(f_mean * (1 - 0.5 * math.pow(chunks / matches, 3)) * 100)
+
+
+def meteor_lang(target_lang):
+    """Synonym table for a target language code or display name, chosen like runReferenceEvaluation()."""
+    name = (target_lang or '').strip().lower()
+    return 'de' if name.startswith('de') else 'ru' if name.startswith('ru') else 'en'
+
+
+# ---- Edit rates, overlap and ratios --------------------------------------------
+
+def cer(reference, candidate, variant=DEFAULT_VARIANT):
+    reference, candidate = utf16(reference), utf16(candidate)
+    if variant == 'translator': return to_fixed(js_div(edit_distance(reference, candidate), len(reference)) * 100)
+    if not reference: return '0.00'
+    return to_fixed(min(200, edit_distance(reference, candidate) / len(reference) * 100))
+
+
+def wer(reference, candidate, variant=DEFAULT_VARIANT):
+    tok = tokens_for(variant)
+    ref, cand = tok(reference), tok(candidate)
+    if not ref: return '0.00'
+    rate = edit_distance(ref, cand) / len(ref) * 100
+    return to_fixed(rate if variant == 'translator' else min(200, rate))
+
+
+def jaccard(reference, candidate, variant=DEFAULT_VARIANT):
+    tok = tokens_for(variant)
+    ref, cand = set(tok(reference)), set(tok(candidate))
+    if not ref and not cand: return '0.00' if variant == 'translator' else '100.00'
+    return to_fixed(len(ref & cand) / len(ref | cand) * 100)
+
+
+def length_ratio(reference, candidate, variant=DEFAULT_VARIANT):
+    ref_len = len(utf16(reference))
+    if ref_len == 0: return '0.00' if variant == 'translator' else '100.00'
+    return to_fixed(len(utf16(candidate)) / ref_len * 100)
+
+
+def repetition(text, variant=DEFAULT_VARIANT):
+    if variant == 'translator':
+        # Share of bigrams that occur more than once
+        tokens = tokenize(text)
+        if len(tokens) < 4: return '0.00'
+        counts = Counter(map(''.join, zip(tokens, tokens[1:])))
+        return to_fixed(sum(c for c in counts.values() if c > 1) / (len(tokens) - 1) * 100)
+    tokens, n = words(text), 3
+    if len(tokens) < n * 2: return '0.00'
+    ngrams = list(zip(*(tokens[i:] for i in range(n))))
+    return to_fixed((len(ngrams) - len(set(ngrams))) / len(ngrams) * 100)
+
+
+def number_preservation(original, translation):
+    extract = lambda text: sorted(n.replace(',', '.', 1) for n in NUMBER_RE.findall(text))
+    orig, trans = extract(original), extract(translation)
+    if not orig: return {'preserved': 100, 'missing': 0, 'extra': len(trans)}
+    remaining = Counter(trans)
+    preserved = 0
+    for num in orig:
+        if remaining[num]: preserved, remaining[num] = preserved + 1, remaining[num] - 1
+    return {'preserved': to_fixed(preserved / len(orig) * 100, 1), 'missing': len(orig) - preserved, 'extra': len(trans) - preserved}
+
+
+def copy_rate(original, translation, variant=DEFAULT_VARIANT):
+    if variant == 'translator' and (is_cjk(original) or is_cjk(translation)):
+        # Character bigrams for CJK text
+        bigrams = lambda text: (lambda chars: set(map(''.join, zip(chars, chars[1:]))))(CJK_RE.findall(text.lower()))
+        orig, trans = bigrams(original), bigrams(translation)
+        if not trans: return '0.00'
+        return to_fixed(len(trans & orig) / len(trans) * 100)
+    orig, trans = set(words(original, WORD3_RE)), words(translation, WORD3_RE)
+    if not trans: return '0.00'
+    return to_fixed(sum(1 for w in trans if w in orig) / len(trans) * 100)
+
+
+def basic_stats(text, variant=DEFAULT_VARIANT):
+    return {'charCount': len(utf16(text)), 'charNoSpace': len(utf16(JS_SPACE_RE.sub('', text))), 'wordCount': len(tokens_for(variant)(text)),
+            'sentenceCount': len(SENTENCE_RE.findall(text)) or 1}
+
+
+# ---- Batch scoring ------------------------------------------------------------
+
+def normalize_metrics(metrics):
+    """Canonical metric names; raises ValueError listing unknown ones."""
+    names = [m if m in METRIC_NAMES else METRIC_ALIASES.get(m.lower(), m) for m in (metrics or REFERENCE_METRICS)]
+    unknown = [m for m in names if m not in METRIC_NAMES]
+    if unknown: raise ValueError(f'Unknown lexical metrics: {", ".join(unknown)}')
+    return names
+
+
+def score_pair(pair, metrics=REFERENCE_METRICS, lang='en', variant=DEFAULT_VARIANT):
+    """pair: {reference, candidate|translation, source|original}. Without a reference, jaccard and
+    lengthRatio compare against the source as in the no-reference evaluation."""
+    reference, candidate = pair.get('reference') or '', pair.get('candidate', pair.get('translation')) or ''
+    source = pair.get('source', pair.get('original')) or ''
+    scores = {}
+    for m in metrics:
+        if m == 'bleu': scores[m] = bleu(reference, candidate, variant)
+        elif m == 'meteor': scores[m] = meteor(reference, candidate, pair.get('lang', lang), variant)
+        elif m == 'cer': scores[m] = cer(reference, candidate, variant)
+        elif m == 'wer': scores[m] = wer(reference, candidate, variant)
+        elif m == 'jaccard': scores[m] = jaccard(reference or source, candidate, variant)
+        elif m == 'chrF': scores[m] = chrf(reference, candidate, variant)
+        elif m == 'lengthRatio': scores[m] = length_ratio(reference or source, candidate, variant)
+        elif m == 'repetition': scores[m] = repetition(candidate, variant)
+        elif m == 'numberPres': scores[m] = number_preservation(source, candidate)['preserved']
+        elif m == 'copyRate': scores[m] = copy_rate(source, candidate, variant)
+        elif m == 'charCount': scores[m] = len(utf16(candidate))
+        elif m == 'wordCount': scores[m] = len(tokens_for(variant)(candidate))
+    return scores
+
+
+def _score_chunk(pairs, metrics, lang, variant, with_stats):
+    out = []
+    for pair in pairs:
+        try:
+            if not with_stats:
+                out.append(score_pair(pair, metrics, lang, variant))
+                continue
+            # Corpus totals need the n-gram statistics anyway, so the segment BLEU/chrF come from them too
+            reference, candidate = pair.get('reference') or '', pair.get('candidate', pair.get('translation')) or ''
+            stats = (bleu_stats(reference, candidate, variant), chrf_stats(reference, candidate, variant))
+            derived = {'bleu': lambda: segment_bleu(stats[0], variant), 'chrF': lambda: to_fixed(chrf_from_stats(stats[1], variant))}
+            scores = score_pair(pair, [m for m in metrics if m not in derived], lang, variant)
+            scores = dict({m: derived[m]() if m in derived else scores[m] for m in metrics}, _stats=stats)
+        except Exception as e:
+            scores = {'error': str(e)}
+        out.append(scores)
+    return out
+
+
+_pool, _pool_pid, _pool_lock = None, None, threading.Lock()
+
+
+def _get_pool():
+    # Spawned rather than forked: the server process has model and request threads that fork() would copy mid-flight
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool, _pool_pid = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context('spawn')), os.getpid()
+        return _pool
+
+
+def score_batch(pairs, metrics=None, lang='en', variant=DEFAULT_VARIANT, corpus=False, workers=None):
+    """Returns (per-pair scores, corpus scores or None). Batches of PARALLEL_MIN pairs or more are scored in worker processes."""
+    if variant not in VARIANTS: raise ValueError(f'Unknown variant: {variant} (expected one of {", ".join(VARIANTS)})')
+    metrics = normalize_metrics(metrics)
+    workers = WORKERS if workers is None else workers
+    if workers > 1 and len(pairs) >= PARALLEL_MIN:
+        chunks = [pairs[i:i + CHUNK_SIZE] for i in range(0, len(pairs), CHUNK_SIZE)]
+        n = len(chunks)
+        results = [r for part in _get_pool().map(_score_chunk, chunks, [metrics] * n, [lang] * n, [variant] * n, [corpus] * n) for r in part]
+    else:
+        results = _score_chunk(pairs, metrics, lang, variant, corpus)
+    if not corpus: return results, None
+    bleu_total, chrf_total, segments = [0] * 10, [0] * 18, 0
+    for r in results:
+        if 'error' in r: continue
+        b, c = r.pop('_stats')
+        bleu_total, chrf_total, segments = [x + y for x, y in zip(bleu_total, b)], [x + y for x, y in zip(chrf_total, c)], segments + 1
+    return results, {'bleu': to_fixed(bleu_from_stats(bleu_total)), 'chrF': to_fixed(chrf_from_stats(chrf_total, variant)), 'segments': segments}
+
+
+# ---- Parity check against saved runs -------------------------------------------
+
+def _legacy_bleu(reference, candidate, source):
+    return to_fixed(bleu_from_stats(bleu_stats(reference, candidate, 'translator')))
+
+
+def _legacy_wer(reference, candidate, source):
+    ref, cand = tokenize(reference), tokenize(candidate)
+    return to_fixed(js_div(edit_distance(ref, cand), len(ref)) * 100)
+
+
+def _legacy_jaccard(reference, candidate, source):
+    ref, cand = set(words(reference or source)), set(words(candidate))
+    return to_fixed(len(ref & cand) / len(ref | cand) * 100) if ref | cand else '0.00'
+
+
+def _legacy_word_count(reference, candidate, source): return len(words(candidate))
+
+
+# Older translator.html builds wrote some of the bundled exports. A stored score that differs from the current
+# formula is accepted only when it equals the formula that build used, so the check still fails on real drift.
+LEGACY_FORMULAS = {'translator': {
+    # Before calculateBLEU() capped the order at the shorter segment: all four orders always counted, so a
+    # segment under four tokens got log(1e-10) for the empty orders ('04:26:35' -> 0.32, not 100.00)
+    'bleu': ('all four n-gram orders scored for segments under four tokens', _legacy_bleu),
+    # Before calculateWER() returned 0.00 for a reference with no tokens (Cyrillic has no ASCII \w words):
+    # 0/0 was stored as NaN and n/0 as Infinity
+    'wer': ('no guard for references without tokens (NaN/Infinity)', _legacy_wer),
+    # Before tokenize() switched to characters on any CJK character: a Russian output with a stray 援助 was
+    # still split into ASCII words
+    'jaccard': ('mixed text with a few CJK characters tokenized as ASCII words', _legacy_jaccard),
+    'wordCount': ('mixed text with a few CJK characters tokenized as ASCII words', _legacy_word_count),
+}}
+
+
+def check_file(path, variant=DEFAULT_VARIANT, tolerance=0.0):
+    """Recompute the lexical scores stored in an evaluation_*.json export.
+    Returns {metric: [checked, mismatched, examples, legacy]}; legacy counts stored scores explained by LEGACY_FORMULAS."""
+    legacy_formulas = LEGACY_FORMULAS.get(variant, {})
+    with open(path, encoding='utf-8') as f: rows = json.load(f)
+    report = {}
+    for row in rows:
+        original, reference = row.get('original') or '', row.get('reference') or ''
+        lang = meteor_lang(row.get('targetLang'))
+        for model, ev in (row.get('evaluations') or {}).items():
+            translation = ev.get('translation')
+            if not isinstance(translation, str): continue
+            stored = {m: ev[m] for m in METRIC_NAMES if m in ev and ev[m] not in ('Error', 'N/A', None)}
+            # No-reference exports score jaccard/lengthRatio against the source text
+            pair = {'reference': reference if 'bleu' in ev or 'meteor' in ev else '', 'candidate': translation, 'source': original}
+            for m, value in score_pair(pair, list(stored), lang, variant).items():
+                entry = report.setdefault(m, [0, 0, [], 0])
+                entry[0] += 1
+                try: same = abs(float(value) - float(stored[m])) <= tolerance
+                except (TypeError, ValueError): same = False
+                if same or str(value) == str(stored[m]): continue
+                if m in legacy_formulas and str(legacy_formulas[m][1](pair['reference'], translation, original)) == str(stored[m]):
+                    entry[3] += 1
+                else:
+                    entry[1] += 1
+                    if len(entry[2]) < 3: entry[2].append({'model': model, 'original': original[:60], 'stored': stored[m], 'computed': value})
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Lexical translation metrics (Python port of the browser implementation)')
+    parser.add_argument('--check', nargs='+', metavar='JSON', help='recompute the scores in evaluation_*.json exports and report mismatches')
+    parser.add_argument('--variant', choices=VARIANTS + ('both',), default='both', help='implementation to compare (default: both)')
+    parser.add_argument('--tolerance', type=float, default=0.0, help='allowed absolute difference per score')
+    parser.add_argument('--reference')
+    parser.add_argument('--candidate')
+    parser.add_argument('--lang', default='en')
+    args = parser.parse_args()
+    variants = VARIANTS if args.variant == 'both' else (args.variant,)
+    if args.check:
+        # An export records whichever implementation was live when it was made, so a file passes if it matches either variant
+        failed = []
+        for path in [p for pattern in args.check for p in sorted(glob.glob(pattern)) or [pattern]]:
+            reports = {v: check_file(path, v, args.tolerance) for v in variants}
+            print(f"\n {path}")
+            for metric in sorted(reports[variants[0]]):
+                print(f"   {metric:<12} " + '  '.join(f"{v}: {r[metric][0] - r[metric][1]}/{r[metric][0]}" + (f" ({r[metric][3]} legacy)" if r[metric][3] else '') for v, r in reports.items()))
+                if len(variants) == 1:
+                    for ex in reports[variants[0]][metric][2]: print(f"     {ex['model']}: stored {ex['stored']} computed {ex['computed']} ({ex['original']!r})")
+            if all(any(entry[1] for entry in r.values()) for r in reports.values()): failed.append(path)
+        if failed: print(f"\nMismatches in {len(failed)} file(s): {', '.join(failed)}")
+        sys.exit(1 if failed else 0)
+    elif args.reference is not None and args.candidate is not None:
+        print(json.dumps({v: score_pair({'reference': args.reference, 'candidate': args.candidate}, REFERENCE_METRICS, args.lang, v) for v in variants}, ensure_ascii=False, indent=2))
+    else:
+        parser.print_help()
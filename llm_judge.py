@@ -0,0 +1,178 @@
+"""
+Reference-free LLM-as-judge scoring with prompt packing.
+Instead of one request per segment (evaluateWithLLMAPI() in api.js), segments are packed into
+as few requests as JUDGE_TOKEN_BUDGET prompt tokens allow, so the instructions are paid for once
+per request. The judge answers with a JSON array of per-segment scores; items missing from the
+reply or failing validation are packed again and re-requested (up to JUDGE_MAX_ROUNDS rounds),
+the rest are kept. Packed requests run concurrently, bounded by the provider's *_MAX_CONCURRENCY.
+Each request's cost is split over the segments it carried, so every segment reports its own.
+"""
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import instrumentation
+from cache import make_key
+
+JUDGE_TOKEN_BUDGET = int(os.environ.get('JUDGE_TOKEN_BUDGET', 6000))
+JUDGE_MAX_SEGMENTS = int(os.environ.get('JUDGE_MAX_SEGMENTS', 25))
+JUDGE_MAX_ROUNDS = int(os.environ.get('JUDGE_MAX_ROUNDS', 3))
+REPLY_TOKENS_PER_SEGMENT = 80
+SCORES = ('fluency', 'adequacy', 'overall')
+SCORE_RANGE = (1, 10)
+PROVIDERS = {'anthropic': 'claude-sonnet-4-20250514', 'openai': 'gpt-4o', 'deepseek': 'deepseek-chat'}
+# $ per 1M input/output tokens, as MODEL_PRICING in config.js; unknown models fall back per provider
+PRICING = {
+    'claude-opus-4-5-20251101': (15.00, 75.00), 'claude-sonnet-4-5-20250929': (3.00, 15.00), 'claude-haiku-4-5-20251001': (1.00, 5.00),
+    'claude-sonnet-4-20250514': (3.00, 15.00), 'gpt-4o': (2.50, 10.00), 'gpt-4o-mini': (0.15, 0.60), 'deepseek-chat': (0.14, 0.28),
+}
+FALLBACK_PRICING = {'anthropic': (3.00, 15.00), 'openai': (2.50, 10.00), 'deepseek': (0.14, 0.28)}
+MALFORMED = 'Missing or malformed in the judge reply'
+SYSTEM_PROMPT = 'You are a professional translation quality evaluator.'
+PROMPT = """Evaluate each translation below from {source} to {target} on a scale of 1-10 for:
+1. Fluency (grammar, naturalness, readability)
+2. Adequacy (meaning preservation, completeness)
+3. Overall quality
+
+The segments are a JSON array of {{"id", "original", "translation"}} objects:
+{items}
+
+Respond ONLY with a JSON array holding one object per id, in this exact format (no other text):
+[{{"id": 0, "fluency": 8.5, "adequacy": 9.0, "overall": 8.7, "feedback": "Brief explanation of the scores"}}]"""
+
+
+def approx_tokens(text):
+    # Same ~4 UTF-8 bytes per token estimate as server.approx_tokens()
+    return len(text.encode('utf-8')) // 4 + 2
+
+
+def segment_json(seg_id, item):
+    return json.dumps({'id': seg_id, 'original': item['original'], 'translation': item['translation']}, ensure_ascii=False)
+
+
+def build_prompt(entries, source_lang, target_lang):
+    """entries: [(id, item)]; one segment object per line so the prompt stays readable in logs."""
+    return PROMPT.format(source=source_lang, target=target_lang, items='[\n' + ',\n'.join(segment_json(i, it) for i, it in entries) + '\n]')
+
+
+def pack(ids, items, token_budget=JUDGE_TOKEN_BUDGET, max_segments=JUDGE_MAX_SEGMENTS):
+    """Greedy, in order: fill each request up to the prompt token budget; an oversized segment goes alone."""
+    overhead = approx_tokens(PROMPT)
+    packs, current, used = [], [], overhead
+    for i in ids:
+        cost = approx_tokens(segment_json(i, items[i]))
+        if current and (used + cost > token_budget or len(current) >= max_segments):
+            packs.append(current)
+            current, used = [], overhead
+        current.append(i)
+        used += cost
+    if current: packs.append(current)
+    return packs
+
+
+def as_score(value):
+    if isinstance(value, bool): return None
+    try: number = float(value)
+    except (TypeError, ValueError): return None
+    return number if SCORE_RANGE[0] <= number <= SCORE_RANGE[1] else None
+
+
+def parse_reply(text, ids):
+    """{id: judgement} for every well-formed object in the reply. Objects are read one by one, so a
+    reply cut off by max_tokens or with one broken entry still yields the rest."""
+    wanted, found = set(ids), {}
+    for match in re.finditer(r'\{[^{}]*\}', text or ''):
+        try: obj = json.loads(match.group(0))
+        except ValueError: continue
+        try: seg_id = int(obj.get('id'))
+        except (TypeError, ValueError): continue
+        if seg_id not in wanted or seg_id in found: continue
+        scores = {k: as_score(obj.get(k)) for k in SCORES}
+        if any(v is None for v in scores.values()): continue
+        feedback = obj.get('feedback')
+        found[seg_id] = {'score': scores['overall'], 'fluency': scores['fluency'], 'adequacy': scores['adequacy'], 'feedback': feedback if isinstance(feedback, str) else ''}
+    return found
+
+
+def request_cost(provider, model, usage, prompt, reply):
+    """(input tokens, output tokens, input cost, output cost); costs in US cents, as calculateCost() reports them."""
+    usage = usage or {}
+    tokens_in = usage.get('input_tokens') or usage.get('prompt_tokens') or approx_tokens(prompt)
+    tokens_out = usage.get('output_tokens') or usage.get('completion_tokens') or approx_tokens(reply or '')
+    price_in, price_out = PRICING.get(model) or FALLBACK_PRICING.get(provider, (0, 0))
+    return tokens_in, tokens_out, tokens_in * price_in / 1e4, tokens_out * price_out / 1e4
+
+
+def cache_key(provider, model, source_lang, target_lang, item):
+    return make_key('judge', provider, model, source_lang, target_lang, item['original'], item['translation'])
+
+
+def judge(call, provider, items, api_key, model=None, source_lang='en', target_lang='de', token_budget=JUDGE_TOKEN_BUDGET,
+          max_segments=JUDGE_MAX_SEGMENTS, max_rounds=JUDGE_MAX_ROUNDS, concurrency=8, cache=None):
+    """Score [{original, translation}] with call(data) -> (payload, status), the server's provider call.
+    Returns {'results': [{index, score, fluency, adequacy, feedback, cost, time, ...} | {index, error, cost}], 'usage': {...}}."""
+    model = model or PROVIDERS[provider]
+    started = time.perf_counter()
+    results, costs, errors = [None] * len(items), [0.0] * len(items), {}
+    usage = {'requests': 0, 'rerequested': 0, 'input_tokens': 0, 'output_tokens': 0, 'cost': 0.0, 'cached': 0}
+    keys = [cache_key(provider, model, source_lang, target_lang, it) for it in items] if cache is not None else None
+    if cache is not None:
+        hits = cache.get_many('judge', keys)
+        for i, key in enumerate(keys):
+            if key in hits: results[i] = dict(hits[key], index=i, cached=True)
+        usage['cached'] = len(hits)
+
+    def send(ids):
+        prompt = build_prompt([(i, items[i]) for i in ids], source_lang, target_lang)
+        sent = time.perf_counter()
+        payload, status = call({'text': prompt, 'api_key': api_key, 'model': model, 'system_prompt': SYSTEM_PROMPT, 'max_tokens': REPLY_TOKENS_PER_SEGMENT * len(ids) + 200})
+        return prompt, payload, status, (time.perf_counter() - sent) * 1000
+
+    pending = [i for i, r in enumerate(results) if r is None]
+    for round_no in range(max(1, max_rounds)):
+        if not pending: break
+        if round_no: usage['rerequested'] += len(pending)
+        # Re-requests go out in smaller packs: long packs are the ones that get truncated
+        packs = pack(pending, items, token_budget, max(1, max_segments >> round_no))
+        with ThreadPoolExecutor(max_workers=max(1, min(len(packs), concurrency))) as pool:
+            futures = {pool.submit(send, ids): ids for ids in packs}
+            for future in as_completed(futures):
+                ids = futures[future]
+                try: prompt, payload, status, elapsed = future.result()
+                except Exception as e:
+                    # Connection failures were already retried by the provider client
+                    for i in ids: errors[i] = str(e)
+                    continue
+                usage['requests'] += 1
+                if status != 200:
+                    for i in ids: errors[i] = payload.get('error') or f'HTTP {status}'
+                    continue
+                reply = payload.get('translation', '')
+                tokens_in, tokens_out, cost_in, cost_out = request_cost(provider, model, payload.get('usage'), prompt, reply)
+                usage['input_tokens'] += tokens_in
+                usage['output_tokens'] += tokens_out
+                usage['cost'] += cost_in + cost_out
+                instrumentation.record_batch('judge', len(ids), tokens_in + tokens_out, provider=provider)
+                # Input cost by each segment's share of the prompt (instructions split evenly), output cost evenly
+                shares = [approx_tokens(segment_json(i, items[i])) + approx_tokens(PROMPT) / len(ids) for i in ids]
+                for i, share in zip(ids, shares): costs[i] += cost_in * share / sum(shares) + cost_out / len(ids)
+                found = parse_reply(reply, ids)
+                for i in ids:
+                    if i in found:
+                        results[i] = dict(found[i], index=i, time=round(elapsed, 1), rounds=round_no + 1)
+                        errors.pop(i, None)
+                    else: errors[i] = MALFORMED
+        # Provider errors are final (the client already retried 429/5xx); only bad replies are asked again
+        pending = [i for i in pending if results[i] is None and errors.get(i) == MALFORMED]
+
+    if cache is not None:
+        fresh = {keys[i]: {k: r[k] for k in ('score', 'fluency', 'adequacy', 'feedback')} for i, r in enumerate(results) if r and not r.get('cached')}
+        if fresh: cache.put_many('judge', fresh)
+    for i in range(len(items)):
+        if results[i] is None: results[i] = {'index': i, 'error': errors.get(i, 'Not evaluated')}
+        results[i]['cost'] = costs[i]
+    usage['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return {'provider': provider, 'model': model, 'results': results, 'usage': usage}
@@ -97,7 +97,44 @@ function getSynonymGroups() {
   return window.synonymGroups || defaultSynonymGroups;
 }
 
+// Per-language synonym index compiled by the server (word -> group ids), shared with translator.html
+const synonymIndexes = window.synonymIndexes || (window.synonymIndexes = {});
+let synonymScript = null;
+
+// The full synonyms.js table, loaded once and only when the server index is unavailable
+function loadSynonymScript() {
+  if (window.synonymGroups) return Promise.resolve(window.synonymGroups);
+  if (!synonymScript) {
+    synonymScript = new Promise(resolve => {
+      const script = document.createElement('script');
+      script.src = 'synonyms.js';
+      script.onload = () => resolve(window.synonymGroups || null);
+      script.onerror = () => {
+        console.log('Using built-in synonyms dictionary');
+        resolve(null);
+      };
+      document.head.appendChild(script);
+    });
+  }
+  return synonymScript;
+}
+
+async function loadSynonymIndex(lang, backendUrl = 'http://localhost:5000') {
+  if (!(lang in synonymIndexes)) {
+    try {
+      const res = await fetch(`${backendUrl}/synonyms/${lang}`);
+      const data = res.ok ? await res.json() : null;
+      synonymIndexes[lang] = data ? { words: data.words, index: new Map(Object.entries(data.index)) } : null;
+    } catch (e) {
+      synonymIndexes[lang] = null;
+    }
+  }
+  if (!synonymIndexes[lang]) await loadSynonymScript();
+  return synonymIndexes[lang];
+}
+
 function buildSynonymMap(lang) {
+  if (synonymIndexes[lang]) return synonymIndexes[lang].index;
   const synonymGroups = getSynonymGroups();
   const map = new Map();
   const groups = synonymGroups[lang] || synonymGroups['en'] || [];
@@ -115,7 +152,12 @@ function areSynonyms(word1, word2, synonymMap) {
   const w1 = word1.toLowerCase(), w2 = word2.toLowerCase();
   if (w1 === w2) return true;
   const syns = synonymMap.get(w1);
-  return syns ? syns.has(w2) : false;
+  if (!syns) return false;
+  if (Array.isArray(syns)) {
+    const other = synonymMap.get(w2);
+    return !!other && syns.some(g => other.includes(g));
+  }
+  return syns.has(w2);
 }
 
 function calculateMETEOR(reference, candidate, lang = 'en') {
@@ -0,0 +1,159 @@
+"""
+Model residency manager: tracks every loaded translation/metric model with its
+approximate parameter memory, evicts least-recently-used unpinned models when a
+memory budget is exceeded, and records load time and last use for /health.
+Loading is serialised per key, so concurrent first requests share one load.
+Room is made before a load, from the footprint measured on an earlier load or, for
+a model not seen yet, from size_hint(key). A failed load is remembered for
+failure_ttl seconds, during which get() returns None without calling the loader.
+"""
+
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(obj, _seen=None):
+    """Bytes held by torch parameters and buffers reachable from obj (modules, dicts, tuples, wrapper objects)."""
+    seen = _seen if _seen is not None else set()
+    if obj is None or id(obj) in seen: return 0
+    seen.add(id(obj))
+    # Converted models (int8, ONNX Runtime) report their own footprint
+    if getattr(obj, 'footprint_bytes', None) is not None: return obj.footprint_bytes
+    if callable(getattr(obj, 'parameters', None)) and callable(getattr(obj, 'buffers', None)):
+        tensors = [t for t in list(obj.parameters()) + list(obj.buffers()) if id(t) not in seen]
+        seen.update(id(t) for t in tensors)
+        return sum(t.numel() * t.element_size() for t in tensors)
+    if isinstance(obj, dict): return sum(estimate_size(v, seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)): return sum(estimate_size(v, seen) for v in obj)
+    # Wrappers such as BERTScorer keep their module in an attribute
+    return sum(estimate_size(v, seen) for v in vars(obj).values() if callable(getattr(v, 'parameters', None))) if hasattr(obj, '__dict__') else 0
+
+
+def model_device(obj):
+    for v in ([obj] + list(obj.values()) if isinstance(obj, dict) else [obj] + list(getattr(obj, '__dict__', {}).values())):
+        try: return str(next(v.parameters()).device)
+        except (AttributeError, StopIteration, TypeError): continue
+    return 'cpu'
+
+
+class ModelRegistry:
+    def __init__(self, budget_bytes=0, pinned=(), size_hint=None, failure_ttl=60):
+        self.budget = int(budget_bytes)
+        self._pinned = set(pinned)
+        self._size_hint, self.failure_ttl = size_hint, float(failure_ttl)
+        self._entries = OrderedDict()
+        self._known_sizes, self._failed = {}, {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._evictions = 0
+
+    def _touch(self, key):
+        entry = self._entries.get(key)
+        if entry is None: return None
+        entry['last_used'], entry['uses'] = time.time(), entry['uses'] + 1
+        self._entries.move_to_end(key)
+        return entry['model']
+
+    def _recently_failed(self, key):
+        failed_at = self._failed.get(key)
+        return failed_at is not None and time.monotonic() - failed_at < self.failure_ttl
+
+    def expected_size(self, key):
+        if key in self._known_sizes: return self._known_sizes[key]
+        return (self._size_hint(key) or 0) if self._size_hint else 0
+
+    def get(self, key, loader):
+        with self._lock:
+            model = self._touch(key)
+            if model is not None: return model
+            if self._recently_failed(key): return None
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        # One loader per key: concurrent first requests wait for it instead of loading a second copy
+        with load_lock:
+            with self._lock:
+                model = self._touch(key)
+                if model is not None: return model
+                # Waiters behind a load that just failed don't retry it
+                if self._recently_failed(key): return None
+                # Make room before loading, so the old and new models are never resident together
+                self._enforce_budget(self.expected_size(key))
+            started = time.perf_counter()
+            try: model = loader()
+            except Exception:
+                self._record_failure(key)
+                raise
+            if model is None:
+                self._record_failure(key)
+                return None
+            return self._register(key, model, started)
+
+    def _record_failure(self, key):
+        with self._lock: self._failed[key] = time.monotonic()
+        logger.warning(f"Model {key} failed to load; not retrying for {self.failure_ttl:.0f}s")
+
+    def _register(self, key, model, started):
+        entry = {'model': model, 'size': estimate_size(model), 'device': model_device(model), 'load_time': time.perf_counter() - started, 'loaded_at': time.time(), 'last_used': time.time(), 'uses': 1}
+        instrumentation.observe_stage('model_load', entry['load_time'], model=key)
+        with self._lock:
+            self._entries[key] = entry
+            self._known_sizes[key] = entry['size']
+            self._failed.pop(key, None)
+            self._enforce_budget(0, keep=key)
+        logger.info(f"Model {key} resident: {entry['size'] / 1048576:.0f} MB on {entry['device']}, loaded in {entry['load_time']:.1f}s")
+        return model
+
+    def peek(self, key):
+        entry = self._entries.get(key)
+        return entry['model'] if entry else None
+
+    def is_loaded(self, key): return key in self._entries
+
+    def keys(self): return list(self._entries)
+
+    def pin(self, key): self._pinned.add(key)
+
+    def unpin(self, key): self._pinned.discard(key)
+
+    def unload(self, key):
+        with self._lock: removed = self._entries.pop(key, None)
+        if removed: self._release()
+        return removed is not None
+
+    def _enforce_budget(self, incoming, keep=None):
+        if self.budget <= 0: return
+        used = sum(e['size'] for e in self._entries.values())
+        victims = []
+        for key, entry in self._entries.items():
+            if used + incoming <= self.budget: break
+            if key == keep or key in self._pinned: continue
+            victims.append(key)
+            used -= entry['size']
+        for key in victims:
+            logger.info(f"Evicting model {key} ({self._entries[key]['size'] / 1048576:.0f} MB) to stay within budget")
+            del self._entries[key]
+        self._evictions += len(victims)
+        if victims: self._release()
+        if used + incoming > self.budget: logger.warning(f"Model memory {(used + incoming) / 1048576:.0f} MB exceeds budget {self.budget / 1048576:.0f} MB (remaining models are pinned or in use)")
+
+    def _release(self):
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available(): torch.cuda.empty_cache()
+        except ImportError: pass
+
+    def stats(self):
+        with self._lock:
+            models = {key: {'size_mb': round(e['size'] / 1048576, 1), 'device': e['device'], 'load_time_s': round(e['load_time'], 2), 'loaded_at': e['loaded_at'],
+                            'last_used': e['last_used'], 'uses': e['uses'], 'pinned': key in self._pinned} for key, e in self._entries.items()}
+            used = sum(e['size'] for e in self._entries.values())
+            failed = {key: round(self.failure_ttl - (time.monotonic() - at), 1) for key, at in self._failed.items() if self._recently_failed(key)}
+        return {'used_mb': round(used / 1048576, 1), 'budget_mb': round(self.budget / 1048576, 1) if self.budget else None, 'evictions': self._evictions, 'models': models,
+                'failed_retry_in_s': failed}
@@ -0,0 +1,138 @@
+"""
+Shared outbound HTTP layer for the cloud translation providers.
+One keep-alive session per provider, bounded concurrency, token-bucket rate limiting
+and jittered exponential retry on 429/5xx that honours Retry-After. Connection failures
+are retried too; a read timeout is not, since the provider may already be processing
+(and billing) the request.
+
+Limits come from the environment, per provider first, then globally:
+  ANTHROPIC_MAX_CONCURRENCY / PROVIDER_MAX_CONCURRENCY   (default 8)
+  ANTHROPIC_RATE_LIMIT      / PROVIDER_RATE_LIMIT        requests per second, 0 = unlimited
+  ANTHROPIC_MAX_RETRIES     / PROVIDER_MAX_RETRIES       (default 4)
+  ANTHROPIC_TIMEOUT         / PROVIDER_TIMEOUT           read timeout in seconds (default 60)
+"""
+
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504, 529}
+CONNECT_TIMEOUT = 10
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate, self.capacity = float(rate), max(1.0, float(burst))
+        self.tokens, self.updated = self.capacity, time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0: return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderClient:
+    def __init__(self, name, max_concurrency=8, rate_limit=0, max_retries=4, timeout=60, backoff_base=0.5, backoff_max=30):
+        self.name, self.max_concurrency, self.max_retries, self.timeout = name, max(1, int(max_concurrency)), int(max_retries), float(timeout)
+        self.backoff_base, self.backoff_max = backoff_base, backoff_max
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._bucket = TokenBucket(rate_limit, self.max_concurrency)
+        self._lock = threading.Lock()
+        self._session, self._pid = None, None
+        self._stats = {'requests': 0, 'retries': 0, 'errors': 0, 'in_flight': 0}
+
+    @property
+    def session(self):
+        # Pooled sockets must not be shared with a forked child
+        if self._session is None or self._pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_concurrency)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._session, self._pid = session, os.getpid()
+        return self._session
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', (CONNECT_TIMEOUT, self.timeout))
+        for attempt in range(self.max_retries + 1):
+            self._bucket.acquire()
+            self._count('requests')
+            try:
+                with self._slots:
+                    self._count('in_flight')
+                    try:
+                        with instrumentation.stage('provider_http', provider=self.name): res = self.session.post(url, **kwargs)
+                    finally: self._count('in_flight', -1)
+            except requests.ConnectionError:
+                # Includes ConnectTimeout: the request never reached the provider
+                if attempt >= self.max_retries:
+                    self._count('errors')
+                    raise
+                delay = self._backoff(attempt)
+            except requests.Timeout:
+                self._count('errors')
+                raise
+            else:
+                if res.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    if res.status_code >= 400: self._count('errors')
+                    return res
+                delay = self._retry_after(res)
+                if delay is None: delay = self._backoff(attempt)
+            self._count('retries')
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_after(self, res):
+        value = res.headers.get('Retry-After')
+        if not value: return None
+        try: delay = float(value)
+        except ValueError:
+            try: delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError): return None
+        return min(self.backoff_max, max(0.0, delay))
+
+    def _count(self, field, n=1):
+        with self._lock: self._stats[field] += n
+
+    def stats(self):
+        with self._lock: s = dict(self._stats)
+        s.update({'max_concurrency': self.max_concurrency, 'rate_limit': self._bucket.rate, 'max_retries': self.max_retries})
+        return s
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _env(name, key, default):
+    return os.environ.get(f'{name.upper()}_{key}', os.environ.get(f'PROVIDER_{key}', default))
+
+
+def get_client(name):
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = ProviderClient(name, max_concurrency=int(_env(name, 'MAX_CONCURRENCY', 8)), rate_limit=float(_env(name, 'RATE_LIMIT', 0)),
+                                            max_retries=int(_env(name, 'MAX_RETRIES', 4)), timeout=float(_env(name, 'TIMEOUT', 60)))
+        return _clients[name]
+
+
+def provider_stats():
+    with _clients_lock: return {name: client.stats() for name, client in _clients.items()}
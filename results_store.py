@@ -0,0 +1,354 @@
+"""
+Typed store for evaluation results.
+The evaluation_*.json exports (one nested object per segment, every score a string)
+are imported into SQLite: one REAL per (run, segment, model, metric), with model and
+metric names dictionary-encoded. Aggregates (the calculateStatistics() figures plus
+percentiles), paired model-vs-model deltas and JSON/CSV exports are answered by
+indexed queries instead of loading whole files.
+  python results_store.py import 1Results/evaluation_*.json
+  python results_store.py aggregate --metrics comet,bleu --pair en-de
+  python results_store.py export --runs evaluation_opus100_en_de_no_ref --format csv > en_de.csv
+"""
+
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# evaluation files carry the UI language names
+LANG_CODES = {'english': 'en', 'deutsch': 'de', 'german': 'de', 'русский': 'ru', 'russian': 'ru', '中文': 'zh', 'chinese': 'zh', 'français': 'fr', 'french': 'fr',
+              'español': 'es', 'spanish': 'es', 'italiano': 'it', 'italian': 'it', '日本語': 'ja', 'japanese': 'ja', '한국어': 'ko', 'korean': 'ko'}
+REFERENCE_METRICS = ('bleu', 'meteor', 'cer', 'wer', 'chrF', 'bertScore', 'comet', 'bleurt')
+TEXT_FIELDS = ('translation',)
+DEFAULT_PERCENTILES = (50, 90)
+EXPORT_CHUNK = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, source TEXT, sha1 TEXT, source_lang TEXT, target_lang TEXT,
+    pair TEXT, mode TEXT, segments INTEGER NOT NULL DEFAULT 0, imported_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS runs_pair ON runs (pair, mode);
+CREATE TABLE IF NOT EXISTS models (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS metrics (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS segments (run_id INTEGER NOT NULL, seg INTEGER NOT NULL, original TEXT, reference TEXT, PRIMARY KEY (run_id, seg)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS outputs (run_id INTEGER NOT NULL, seg INTEGER NOT NULL, model_id INTEGER NOT NULL, translation TEXT, extra TEXT,
+    PRIMARY KEY (run_id, seg, model_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS scores (run_id INTEGER NOT NULL, seg INTEGER NOT NULL, model_id INTEGER NOT NULL, metric_id INTEGER NOT NULL, value REAL NOT NULL,
+    PRIMARY KEY (run_id, seg, model_id, metric_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scores_metric ON scores (metric_id, model_id, value, run_id);
+'''
+
+
+def lang_code(name):
+    name = (name or '').strip()
+    return LANG_CODES.get(name.lower(), name.lower() if 2 <= len(name) <= 3 else name)
+
+
+def as_number(value):
+    """Float for numeric values and numeric strings ("0.32"), None for 'N/A', 'Error', NaN and text."""
+    if isinstance(value, bool): return None
+    if isinstance(value, (int, float)): number = float(value)
+    elif isinstance(value, str):
+        try: number = float(value)
+        except ValueError: return None
+    else: return None
+    return number if math.isfinite(number) else None
+
+
+def interpolate(ranked, n, p):
+    """Linear-interpolated percentile from {rank: value} holding ranks floor/ceil of (n-1)*p/100."""
+    k = (n - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, n - 1)
+    return ranked[lo] + (ranked[hi] - ranked[lo]) * (k - lo)
+
+
+class ResultsStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn, self._pid = None, None
+
+    def _db(self):
+        # SQLite handles must not cross fork(); each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            # Imports insert into the value-ordered index out of order; a larger page cache keeps that off the disk
+            self._conn.execute('PRAGMA cache_size=-65536')
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _ids(self, db, table, names):
+        db.executemany(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', [(n,) for n in names])
+        return dict(db.execute(f'SELECT name, id FROM {table}').fetchall())
+
+    def import_rows(self, rows, name, source=None, sha1=None):
+        """Replace run `name` with evaluation rows: [{original, reference, sourceLang, targetLang, evaluations: {model: {translation, metric: value, ...}}}]."""
+        rows = [r for r in rows if isinstance(r, dict) and isinstance(r.get('evaluations'), dict)]
+        if not rows: raise ValueError('No evaluation rows (expected a list of {original, reference, evaluations})')
+        model_names = {m for r in rows for m in r['evaluations']}
+        metric_names = {k for r in rows for e in r['evaluations'].values() if isinstance(e, dict) for k, v in e.items() if k not in TEXT_FIELDS and as_number(v) is not None}
+        mode = 'ref' if metric_names & set(REFERENCE_METRICS) else 'no_ref'
+        src, tgt = rows[0].get('sourceLang', ''), rows[0].get('targetLang', '')
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                self._delete(db, name)
+                models, metrics = self._ids(db, 'models', model_names), self._ids(db, 'metrics', metric_names)
+                run_id = db.execute('INSERT INTO runs (name, source, sha1, source_lang, target_lang, pair, mode, segments, imported_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (name, source, sha1, src, tgt, f'{lang_code(src)}-{lang_code(tgt)}', mode, len(rows), time.time())).lastrowid
+                segments, outputs, scores = [], [], []
+                for seg, row in enumerate(rows):
+                    segments.append((run_id, seg, row.get('original'), row.get('reference')))
+                    for model, evaluation in row['evaluations'].items():
+                        if not isinstance(evaluation, dict): continue
+                        extra = {}
+                        for key, value in evaluation.items():
+                            if key in TEXT_FIELDS: continue
+                            number = as_number(value)
+                            if number is not None: scores.append((run_id, seg, models[model], metrics[key], number))
+                            elif value not in (None, '', 'N/A'): extra[key] = value
+                        outputs.append((run_id, seg, models[model], evaluation.get('translation'), json.dumps(extra, ensure_ascii=False) if extra else None))
+                db.executemany('INSERT INTO segments VALUES (?, ?, ?, ?)', segments)
+                db.executemany('INSERT INTO outputs VALUES (?, ?, ?, ?, ?)', outputs)
+                db.executemany('INSERT INTO scores VALUES (?, ?, ?, ?, ?)', scores)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return self.run(run_id)
+
+    def import_file(self, path, name=None):
+        with open(path, 'rb') as f: raw = f.read()
+        data = json.loads(raw.decode('utf-8'))
+        rows = data if isinstance(data, list) else data.get('results') or data.get('evalResults') or []
+        return self.import_rows(rows, name or os.path.splitext(os.path.basename(path))[0], os.path.basename(path), hashlib.sha1(raw).hexdigest())
+
+    def import_job(self, job, lines):
+        """A finished /jobs run (results.ndjson lines) as one model's evaluation."""
+        spec = job['spec']
+        model = spec.get('model') or spec['provider']
+        rows = []
+        for line in lines:
+            item = json.loads(line)
+            if 'error' in item: continue
+            rows.append({'original': item['source'], 'reference': item.get('reference'), 'sourceLang': spec['source_lang'], 'targetLang': spec['target_lang'],
+                         'evaluations': {model: dict(item.get('scores') or {}, translation=item.get('translation'))}})
+        return self.import_rows(rows, f"job-{job['id']}", f"jobs/{job['id']}")
+
+    def _delete(self, db, name):
+        row = db.execute('SELECT id FROM runs WHERE name = ?', (name,)).fetchone()
+        if not row: return False
+        for table in ('scores', 'outputs', 'segments'): db.execute(f'DELETE FROM {table} WHERE run_id = ?', row)
+        db.execute('DELETE FROM runs WHERE id = ?', row)
+        return True
+
+    def delete_run(self, run):
+        info = self.run(run)
+        if not info: return False
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                self._delete(db, info['name'])
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return True
+
+    def _run_row(self, row):
+        keys = ('id', 'name', 'source', 'sha1', 'source_lang', 'target_lang', 'pair', 'mode', 'segments', 'imported_at')
+        return dict(zip(keys, row))
+
+    def runs(self, pair=None, mode=None):
+        sql, args = 'SELECT id, name, source, sha1, source_lang, target_lang, pair, mode, segments, imported_at FROM runs WHERE 1=1', []
+        if pair: sql, args = sql + ' AND pair = ?', args + [pair]
+        if mode: sql, args = sql + ' AND mode = ?', args + [mode]
+        with self._lock: return [self._run_row(r) for r in self._db().execute(sql + ' ORDER BY id', args).fetchall()]
+
+    def run(self, run):
+        column = 'id' if isinstance(run, int) or str(run).isdigit() else 'name'
+        with self._lock:
+            db = self._db()
+            row = db.execute(f'SELECT id, name, source, sha1, source_lang, target_lang, pair, mode, segments, imported_at FROM runs WHERE {column} = ?', (run,)).fetchone()
+            if not row: return None
+            info = self._run_row(row)
+            info['models'] = [m for (m,) in db.execute('SELECT DISTINCT m.name FROM outputs o JOIN models m ON m.id = o.model_id WHERE o.run_id = ? ORDER BY m.name', (info['id'],))]
+            info['metrics'] = [m for (m,) in db.execute('SELECT name FROM metrics WHERE id IN (SELECT DISTINCT metric_id FROM scores WHERE run_id = ?) ORDER BY name', (info['id'],))]
+        return info
+
+    def _filters(self, db, runs=None, models=None, metrics=None, pair=None, mode=None, alias='s'):
+        """SQL conditions and args selecting runs/models/metrics by name or id; ValueError for unknown names."""
+        where, args = [], []
+        if runs or pair or mode:
+            sql, run_args = 'SELECT id FROM runs WHERE 1=1', []
+            if runs:
+                sql += f" AND (id IN ({','.join('?' * len(runs))}) OR name IN ({','.join('?' * len(runs))}))"
+                run_args += [int(r) if str(r).isdigit() else -1 for r in runs] + [str(r) for r in runs]
+            if pair: sql, run_args = sql + ' AND pair = ?', run_args + [pair]
+            if mode: sql, run_args = sql + ' AND mode = ?', run_args + [mode]
+            ids = [r for (r,) in db.execute(sql, run_args)]
+            if not ids: raise ValueError('No runs match the selection')
+            where.append(f"{alias}.run_id IN ({','.join('?' * len(ids))})")
+            args += ids
+        for table, column, names in (('models', 'model_id', models), ('metrics', 'metric_id', metrics)):
+            if not names: continue
+            found = dict(db.execute(f"SELECT name, id FROM {table} WHERE name IN ({','.join('?' * len(names))})", list(names)).fetchall())
+            missing = [n for n in names if n not in found]
+            if missing: raise ValueError(f"Unknown {table}: {', '.join(missing)}")
+            where.append(f"{alias}.{column} IN ({','.join('?' * len(found))})")
+            args += list(found.values())
+        return (' AND '.join(where) or '1=1'), args
+
+    def _names(self, db, table): return dict(db.execute(f'SELECT id, name FROM {table}').fetchall())
+
+    def aggregate(self, runs=None, models=None, metrics=None, pair=None, mode=None, percentiles=DEFAULT_PERCENTILES):
+        """{model: {metric: {n, mean, std, min, max, p<q>...}}} over the selected runs (std is the population std, as in calculateStatistics())."""
+        with self._lock:
+            db = self._db()
+            where, args = self._filters(db, runs, models, metrics, pair, mode)
+            model_names, metric_names = self._names(db, 'models'), self._names(db, 'metrics')
+            out = {}
+            for model_id, metric_id, n, mean, lo, hi, mean_sq in db.execute(
+                    f'SELECT model_id, metric_id, COUNT(*), AVG(value), MIN(value), MAX(value), AVG(value * value) FROM scores s WHERE {where} GROUP BY model_id, metric_id', args):
+                out.setdefault(model_names[model_id], {})[metric_names[metric_id]] = {'n': n, 'mean': mean, 'std': math.sqrt(max(0.0, mean_sq - mean * mean)), 'min': lo, 'max': hi}
+            if percentiles:
+                # scores_metric is ordered by value within (metric, model): each percentile is an OFFSET into it,
+                # so only the two values either side of it leave SQLite
+                model_ids, metric_ids = {v: k for k, v in model_names.items()}, {v: k for k, v in metric_names.items()}
+                for model, by_metric in out.items():
+                    for metric, stats in by_metric.items():
+                        for p in percentiles:
+                            lo = int((stats['n'] - 1) * p / 100)
+                            values = [v for (v,) in db.execute(f'SELECT value FROM scores s INDEXED BY scores_metric WHERE s.metric_id = ? AND s.model_id = ? AND {where} ORDER BY s.value LIMIT 2 OFFSET ?',
+                                                               [metric_ids[metric], model_ids[model]] + args + [lo])]
+                            stats[f'p{p:g}'] = interpolate(dict(enumerate(values, lo)), stats['n'], p)
+        return out
+
+    def deltas(self, metric, baseline, runs=None, models=None, pair=None, mode=None):
+        """Per model, paired differences to `baseline` on the segments both have: mean delta with a 95% interval, wins/losses/ties."""
+        with self._lock:
+            db = self._db()
+            where, args = self._filters(db, runs, models, [metric], pair, mode)
+            base = db.execute('SELECT id FROM models WHERE name = ?', (baseline,)).fetchone()
+            if not base: raise ValueError(f'Unknown models: {baseline}')
+            model_names = self._names(db, 'models')
+            rows = db.execute(
+                f'SELECT s.model_id, COUNT(*), AVG(s.value - b.value), AVG((s.value - b.value) * (s.value - b.value)), SUM(s.value > b.value), SUM(s.value < b.value), AVG(s.value), AVG(b.value) '
+                f'FROM scores s JOIN scores b ON b.run_id = s.run_id AND b.seg = s.seg AND b.model_id = ? AND b.metric_id = s.metric_id '
+                f'WHERE {where} AND s.model_id != ? GROUP BY s.model_id', [base[0]] + args + [base[0]]).fetchall()
+        out = {}
+        for model_id, n, mean, mean_sq, wins, losses, model_mean, base_mean in rows:
+            std = math.sqrt(max(0.0, mean_sq - mean * mean) * n / (n - 1)) if n > 1 else 0.0
+            half = 1.96 * std / math.sqrt(n) if n > 1 else None
+            out[model_names[model_id]] = {'n': n, 'mean': model_mean, 'baseline_mean': base_mean, 'delta': mean, 'ci95': [mean - half, mean + half] if half is not None else None,
+                                          'wins': wins, 'losses': losses, 'ties': n - wins - losses}
+        return dict(sorted(out.items(), key=lambda kv: -kv[1]['delta']))
+
+    def export(self, runs=None, models=None, metrics=None, pair=None, mode=None):
+        """(metric names, rows): the selection is checked here, rows are then read lazily as
+        (run name, segment, original, reference, model, translation, {metric: value}, extra), run by run and segment by segment."""
+        with self._lock:
+            db = self._db()
+            where, args = self._filters(db, runs, models, None, pair, mode, alias='o')
+            metric_where, metric_args = self._filters(db, None, None, metrics, alias='s')
+            model_names, metric_names = self._names(db, 'models'), self._names(db, 'metrics')
+            selected = db.execute(f'SELECT id, name, segments FROM runs WHERE id IN (SELECT DISTINCT run_id FROM outputs o WHERE {where}) ORDER BY id', args).fetchall()
+            columns = list(metrics) if metrics else sorted({metric_names[m] for run_id, _, _ in selected for (m,) in db.execute('SELECT DISTINCT metric_id FROM scores WHERE run_id = ?', (run_id,))})
+        return columns, self._export_rows(selected, where, args, metric_where, metric_args, model_names, metric_names)
+
+    def _export_rows(self, selected, where, args, metric_where, metric_args, model_names, metric_names):
+        # Fetched in segment blocks, so memory stays flat however large the run is
+        for run_id, run_name, count in selected:
+            for start in range(0, count, EXPORT_CHUNK):
+                span = (run_id, start, start + EXPORT_CHUNK - 1)
+                with self._lock:
+                    db = self._db()
+                    outputs = db.execute(f'SELECT o.seg, o.model_id, o.translation, o.extra, g.original, g.reference FROM outputs o JOIN segments g ON g.run_id = o.run_id AND g.seg = o.seg '
+                                         f'WHERE o.run_id = ? AND o.seg BETWEEN ? AND ? AND {where} ORDER BY o.seg, o.model_id', span + tuple(args)).fetchall()
+                    scores = {}
+                    for seg, model_id, metric_id, value in db.execute(f'SELECT seg, model_id, metric_id, value FROM scores s WHERE s.run_id = ? AND s.seg BETWEEN ? AND ? AND {metric_where}', span + tuple(metric_args)):
+                        scores.setdefault((seg, model_id), {})[metric_names[metric_id]] = value
+                for seg, model_id, translation, extra, original, reference in outputs:
+                    yield run_name, seg, original, reference, model_names[model_id], translation, scores.get((seg, model_id), {}), json.loads(extra) if extra else {}
+
+    def stats(self):
+        with self._lock:
+            db = self._db()
+            counts = {t: db.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0] for t in ('runs', 'models', 'metrics', 'segments', 'scores')}
+        return dict(counts, path=self.path, size_mb=round(os.path.getsize(self.path) / 1048576, 2) if os.path.exists(self.path) else 0)
+
+
+def export_json(rows):
+    """evaluation_*.json layout, streamed one segment at a time (numbers stay numbers)."""
+    yield '['
+    current, first = None, True
+    for run, seg, original, reference, model, translation, scores, extra in rows:
+        if current is not None and current['key'] != (run, seg):
+            yield ('' if first else ',') + json.dumps(current['row'], ensure_ascii=False)
+            first = False
+            current = None
+        if current is None: current = {'key': (run, seg), 'row': {'run': run, 'original': original, 'reference': reference, 'evaluations': {}}}
+        current['row']['evaluations'][model] = dict(extra, translation=translation, **scores)
+    if current is not None: yield ('' if first else ',') + json.dumps(current['row'], ensure_ascii=False)
+    yield ']'
+
+
+def export_csv(rows, metrics):
+    """One line per (run, segment, model) with a column per metric."""
+    import csv
+    import io
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['run', 'segment', 'model', 'original', 'reference', 'translation'] + list(metrics))
+    for run, seg, original, reference, model, translation, scores, _ in rows:
+        writer.writerow([run, seg, model, original, reference, translation] + [scores.get(m, '') for m in metrics])
+        if buffer.tell() > 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Evaluation results store')
+    parser.add_argument('command', choices=['import', 'runs', 'aggregate', 'deltas', 'export'])
+    parser.add_argument('paths', nargs='*', help='evaluation JSON files to import')
+    parser.add_argument('--db', default=os.environ.get('RESULTS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'results.sqlite3')))
+    parser.add_argument('--runs')
+    parser.add_argument('--models')
+    parser.add_argument('--metrics')
+    parser.add_argument('--pair')
+    parser.add_argument('--mode', choices=['ref', 'no_ref'])
+    parser.add_argument('--baseline')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help='export format (written to stdout)')
+    args = parser.parse_args()
+    store = ResultsStore(args.db)
+    split = lambda v: [x.strip() for x in v.split(',') if x.strip()] if v else None
+    if args.command == 'import':
+        for path in args.paths:
+            started = time.perf_counter()
+            run = store.import_file(path)
+            print(f" {run['name']}: {run['segments']} segments, {len(run['models'])} models, {len(run['metrics'])} metrics ({run['pair']}, {run['mode']}) in {time.perf_counter() - started:.2f}s")
+        print(f" {store.stats()}")
+    elif args.command == 'runs':
+        for run in store.runs(args.pair, args.mode): print(f" {run['id']:>4}  {run['name']:<45} {run['pair']:<7} {run['mode']:<7} {run['segments']} segments")
+    elif args.command == 'aggregate':
+        print(json.dumps(store.aggregate(split(args.runs), split(args.models), split(args.metrics), args.pair, args.mode), indent=2, ensure_ascii=False))
+    elif args.command == 'export':
+        import sys
+        metrics, rows = store.export(split(args.runs), split(args.models), split(args.metrics), args.pair, args.mode)
+        sys.stdout.writelines(export_csv(rows, metrics) if args.format == 'csv' else export_json(rows))
+    else:
+        metric = (split(args.metrics) or [None])[0]
+        if not metric or not args.baseline: parser.error('deltas needs --metrics <metric> and --baseline <model>')
+        print(json.dumps(store.deltas(metric, args.baseline, split(args.runs), split(args.models), args.pair, args.mode), indent=2, ensure_ascii=False))
@@ -14,10 +14,27 @@ os.environ['HF_HOME'] = os.path.join(_SCRIPT_DIR, 'hf_cache')
 os.environ['XDG_DATA_HOME'] = _SCRIPT_DIR
 os.environ['HF_HUB_DISABLE_SYMLINKS_WARNING'] = '1'
 
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Response, g, request, jsonify, make_response, send_from_directory, send_file, stream_with_context
 from flask_cors import CORS
-import requests
 import logging
+import json
+import time
+import threading
+import weakref
+import functools
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from batching import MicroBatcher
+from cache import ResultCache, make_key
+from providers import get_client, provider_stats
+from jobs import JobManager
+from model_registry import ModelRegistry
+import lexical_metrics
+import synonym_index
+import instrumentation
+import cpu_backend
+import llm_judge
+from results_store import ResultsStore, export_csv, export_json
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -33,15 +50,45 @@ if os.path.exists(LOCAL_PACKAGES_DIR):
 
 app = Flask(__name__)
 CORS(app)
-
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
-DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
-DEEPL_FREE_API_URL = "https://api-free.deepl.com/v2/translate"
-DEEPL_PRO_API_URL = "https://api.deepl.com/v2/translate"
-
-_local_models = {'nllb_600m': None, 'nllb_600m_tokenizer': None, 'nllb_1_3b': None, 'nllb_1_3b_tokenizer': None, 'nllb_3_3b': None, 'nllb_3_3b_tokenizer': None, 'opus_mt': {}}
-_metric_models = {'bertscore': None, 'comet': None, 'comet_qe': None, 'bleurt': None}
+instrumentation.init_app(app)
+
+# Overridable so the provider layer can be pointed at a local stub (see stub_server.py)
+ANTHROPIC_API_URL = os.environ.get('ANTHROPIC_API_URL', "https://api.anthropic.com/v1/messages")
+OPENAI_API_URL = os.environ.get('OPENAI_API_URL', "https://api.openai.com/v1/chat/completions")
+DEEPSEEK_API_URL = os.environ.get('DEEPSEEK_API_URL', "https://api.deepseek.com/chat/completions")
+DEEPL_FREE_API_URL = os.environ.get('DEEPL_FREE_API_URL', "https://api-free.deepl.com/v2/translate")
+DEEPL_PRO_API_URL = os.environ.get('DEEPL_PRO_API_URL', "https://api.deepl.com/v2/translate")
+
+# Loaded models live in one registry: MODEL_MEMORY_BUDGET_MB caps parameter memory (LRU eviction, 0 = no cap),
+# PIN_MODELS are never evicted, PRELOAD_MODELS load in the background at startup (e.g. "comet,nllb-200-600m,opus-mt-en-de")
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0))
+PRELOAD_MODELS = [m.strip() for m in os.environ.get('PRELOAD_MODELS', '').split(',') if m.strip()]
+PIN_MODELS = [m.strip() for m in os.environ.get('PIN_MODELS', '').split(',') if m.strip()]
+# Eviction makes room before a load. A model not loaded yet in this process is assumed to need its fp32 parameter
+# memory: first-match glob rules, MODEL_SIZE_HINTS_MB ahead of the built-in ones (e.g. "nllb-200-*=1400,comet=700"
+# for int8). Failed loads are not retried for MODEL_LOAD_RETRY_S seconds.
+MODEL_SIZE_ESTIMATES_MB = [('nllb-200-600m', 2500), ('nllb-200-1.3b', 5500), ('nllb-200-3.3b', 13500), ('opus-mt-*', 300),
+                           ('comet', 2300), ('comet_qe', 2300), ('bleurt', 2300), ('bertscore', 1400)]
+MODEL_SIZE_HINTS_MB = [(p.strip().lower(), float(mb)) for p, mb in (rule.split('=', 1) for rule in os.environ.get('MODEL_SIZE_HINTS_MB', '').split(',') if '=' in rule)]
+MODEL_LOAD_RETRY_S = float(os.environ.get('MODEL_LOAD_RETRY_S', 60))
+
+def model_size_hint(key):
+    for pattern, mb in MODEL_SIZE_HINTS_MB + MODEL_SIZE_ESTIMATES_MB:
+        if fnmatch.fnmatchcase(key.lower(), pattern): return int(mb * 1048576)
+    return None
+
+_models = ModelRegistry(MODEL_MEMORY_BUDGET_MB * 1048576, PIN_MODELS, model_size_hint, MODEL_LOAD_RETRY_S)
+_preload = {'requested': [], 'done': [], 'failed': [], 'running': False}
+
+# Forward passes run on a small per-process pool (INFERENCE_WORKERS) so request threads don't oversubscribe
+# the CPU; TORCH_NUM_THREADS sets torch intra-op threads per process (0 = torch default)
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 1))
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', 0))
+_inference = {'pid': None, 'executor': None}
+_inference_lock = threading.Lock()
+_inference_local = threading.local()
+# Keyed on the tokenizer object itself, so a lock goes away with its model when the registry evicts it
+_tokenizer_locks = weakref.WeakKeyDictionary()
 
 NLLB_LANG_CODES = {
     'en': 'eng_Latn', 'de': 'deu_Latn', 'fr': 'fra_Latn', 'es': 'spa_Latn', 'it': 'ita_Latn', 'pt': 'por_Latn',
@@ -54,6 +101,45 @@ NLLB_LANG_CODES = {
 
 NLLB_VARIANTS = {'nllb-200-600m': 'facebook/nllb-200-distilled-600M', 'nllb-200-1.3b': 'facebook/nllb-200-distilled-1.3B', 'nllb-200-3.3b': 'facebook/nllb-200-3.3B'}
 
+COMET_MODEL = "Unbabel/wmt22-comet-da"
+COMET_QE_MODELS = ["Unbabel/wmt22-cometkiwi-da", "Unbabel/wmt20-comet-qe-da"]
+BLEURT_MODEL = 'lucadiliello/BLEURT-20'
+BERTSCORE_MODEL = os.environ.get('BERTSCORE_MODEL', 'roberta-large')
+# Cache keys carry the scoring model, so switching checkpoints never serves stale scores;
+# COMET-QE's comes from whichever of COMET_QE_MODELS actually loaded (see metric_model_id)
+METRIC_MODEL_IDS = {'bertscore': f'bert-score/{BERTSCORE_MODEL}/rescaled', 'comet': COMET_MODEL, 'bleurt': BLEURT_MODEL}
+
+# Neural metric batching: padded batch size (longest item * items) is kept under the token budget
+BATCH_TOKEN_BUDGET = int(os.environ.get('BATCH_TOKEN_BUDGET', 8192))
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 64))
+METRIC_ALIASES = {'comet-qe': 'comet_qe', 'cometQE': 'comet_qe', 'bertScore': 'bertscore'}
+METRIC_FIELDS = {'bertscore': ('candidate', 'reference'), 'comet': ('source', 'candidate', 'reference'), 'comet_qe': ('source', 'candidate'), 'bleurt': ('reference', 'candidate')}
+MICROBATCH_MAX_SIZE = int(os.environ.get('MICROBATCH_MAX_SIZE', 32))
+MICROBATCH_WAIT_MS = float(os.environ.get('MICROBATCH_WAIT_MS', 10))
+
+# Local generation: input batches by token budget, output length scales with the longest input
+LOCAL_GEN_TOKEN_BUDGET = int(os.environ.get('LOCAL_GEN_TOKEN_BUDGET', 4096))
+LOCAL_GEN_MAX_BATCH = int(os.environ.get('LOCAL_GEN_MAX_BATCH', 16))
+LOCAL_NUM_BEAMS = int(os.environ.get('LOCAL_NUM_BEAMS', 0)) or None
+LOCAL_MAX_NEW_TOKENS = 512
+LOCAL_MAX_LENGTH = 512
+LOCAL_BATCH_PROVIDERS = ('nllb', 'opus')
+
+# On-disk cache for translations and scores; 'no_cache' in the body or ?no_cache=1 skips the lookup
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', '1') != '0'
+CACHE_PATH = os.environ.get('CACHE_PATH', os.path.join(_SCRIPT_DIR, 'cache', 'results.sqlite3'))
+CACHE_MAX_MB = float(os.environ.get('CACHE_MAX_MB', 1024))
+TRANSLATION_KEY_FIELDS = ('model', 'system_prompt', 'temperature', 'text', 'source_lang', 'target_lang', 'num_beams')
+_cache = ResultCache(CACHE_PATH, CACHE_MAX_MB * 1048576) if CACHE_ENABLED else None
+
+# Server-side corpus evaluation jobs (progress and results persist under JOBS_DIR)
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(_SCRIPT_DIR, 'jobs'))
+JOB_CHUNK_SIZE = int(os.environ.get('JOB_CHUNK_SIZE', 32))
+
+# Imported evaluation results, queried by /results/*
+RESULTS_DB = os.environ.get('RESULTS_DB', os.path.join(_SCRIPT_DIR, 'results', 'results.sqlite3'))
+_results = ResultsStore(RESULTS_DB)
+
 def get_torch_device():
     try:
         import torch
@@ -62,66 +148,235 @@ def get_torch_device():
     except ImportError: pass
     return "cpu"
 
+def configure_torch():
+    if not TORCH_NUM_THREADS: return
+    try:
+        import torch
+        torch.set_num_threads(TORCH_NUM_THREADS)
+    except ImportError: pass
+
+def _mark_inference_thread():
+    _inference_local.active = True
+
+def run_inference(fn, *args, **kwargs):
+    # Profiled requests run inline so the forward pass shows up in their trace
+    if getattr(_inference_local, 'active', False) or instrumentation.profiling(): return fn(*args, **kwargs)
+    with _inference_lock:
+        # Executor threads do not survive fork(), so each worker process creates its own
+        if _inference['pid'] != os.getpid():
+            _inference.update(pid=os.getpid(), executor=ThreadPoolExecutor(INFERENCE_WORKERS, thread_name_prefix='inference', initializer=_mark_inference_thread))
+    return _inference['executor'].submit(fn, *args, **kwargs).result()
+
+def tokenizer_lock(tokenizer):
+    with _inference_lock: return _tokenizer_locks.setdefault(tokenizer, threading.Lock())
+
 def get_bertscore():
-    global _metric_models
-    if _metric_models['bertscore'] is None:
+    def load():
         try:
             from bert_score import BERTScorer
             logger.info("Loading BERTScore...")
-            _metric_models['bertscore'] = BERTScorer(lang="en", rescale_with_baseline=True, device=get_torch_device())
+            scorer = BERTScorer(model_type=BERTSCORE_MODEL, lang="en", rescale_with_baseline=True, device=get_torch_device())
+            scorer._model = cpu_backend.convert_module('bertscore', scorer._model, get_torch_device())
             logger.info(f"BERTScore loaded on {get_torch_device()}")
+            return scorer
         except Exception as e:
             logger.error(f"BERTScore error: {e}")
-            return None
-    return _metric_models['bertscore']
+    return _models.get('bertscore', load)
 
 def get_comet():
-    global _metric_models
-    if _metric_models['comet'] is None:
+    def load():
         try:
             from comet import download_model, load_from_checkpoint
             logger.info("Loading COMET...")
-            _metric_models['comet'] = load_from_checkpoint(download_model("Unbabel/wmt22-comet-da"))
+            model = cpu_backend.convert_module('comet', load_from_checkpoint(download_model(COMET_MODEL)), get_torch_device())
             logger.info(f"COMET loaded on {get_torch_device()}")
+            return model
         except Exception as e:
             logger.error(f"COMET error: {e}")
-            return None
-    return _metric_models['comet']
+    return _models.get('comet', load)
 
 def get_comet_qe():
-    global _metric_models
-    if _metric_models['comet_qe'] is None:
+    def load():
         try:
             from comet import download_model, load_from_checkpoint
             logger.info("Loading COMET-QE...")
-            for model_name in ["Unbabel/wmt22-cometkiwi-da", "Unbabel/wmt20-comet-qe-da"]:
+            for model_name in COMET_QE_MODELS:
                 try:
-                    _metric_models['comet_qe'] = load_from_checkpoint(download_model(model_name))
+                    model = cpu_backend.convert_module('comet_qe', load_from_checkpoint(download_model(model_name)), get_torch_device())
+                    model.checkpoint_id = model_name
                     logger.info(f"COMET-QE loaded: {model_name}")
-                    break
+                    return model
                 except: continue
         except Exception as e:
             logger.error(f"COMET-QE error: {e}")
-            return None
-    return _metric_models['comet_qe']
+    return _models.get('comet_qe', load)
 
 def get_bleurt():
-    global _metric_models
-    if _metric_models['bleurt'] is None:
+    def load():
         try:
             from bleurt_pytorch import BleurtForSequenceClassification, BleurtTokenizer
-            import torch
             logger.info("Loading BLEURT...")
-            model_name = 'lucadiliello/BLEURT-20'
-            _metric_models['bleurt'] = {'model': BleurtForSequenceClassification.from_pretrained(model_name), 'tokenizer': BleurtTokenizer.from_pretrained(model_name)}
+            bleurt_model = {'model': BleurtForSequenceClassification.from_pretrained(BLEURT_MODEL), 'tokenizer': BleurtTokenizer.from_pretrained(BLEURT_MODEL)}
             device = get_torch_device()
-            if device != 'cpu': _metric_models['bleurt']['model'] = _metric_models['bleurt']['model'].to(device)
-            _metric_models['bleurt']['model'].eval()
+            if device != 'cpu': bleurt_model['model'] = bleurt_model['model'].to(device)
+            bleurt_model['model'] = cpu_backend.convert_module('bleurt', bleurt_model['model'].eval(), device)
             logger.info(f"BLEURT loaded on {device}")
+            return bleurt_model
         except Exception as e:
             logger.error(f"BLEURT error: {e}")
-            return None
-    return _metric_models['bleurt']
+    return _models.get('bleurt', load)
+
+def approx_tokens(*texts):
+    # ~4 UTF-8 bytes per subword token holds well enough for Latin, Cyrillic and CJK scripts
+    return sum(len((t or '').encode('utf-8')) // 4 + 2 for t in texts)
+
+def token_batches(lengths, token_budget=BATCH_TOKEN_BUDGET, max_size=BATCH_MAX_SIZE):
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batch, longest = [], 0
+    for i in order:
+        if batch and (max(longest, lengths[i]) * (len(batch) + 1) > token_budget or len(batch) >= max_size):
+            yield batch
+            batch, longest = [], 0
+        batch.append(i)
+        longest = max(longest, lengths[i])
+    if batch: yield batch
+
+def score_bertscore(items):
+    scorer = get_bertscore()
+    if scorer is None: raise RuntimeError('BERTScore not available')
+    P, R, F1 = scorer.score([it.get('candidate', '') for it in items], [it.get('reference', '') for it in items], batch_size=len(items))
+    return [{'precision': float(p), 'recall': float(r), 'f1': float(f)} for p, r, f in zip(P, R, F1)]
+
+def score_comet(items):
+    import torch
+    model = get_comet()
+    if model is None: raise RuntimeError('COMET not available')
+    output = model.predict([{"src": it.get('source', ''), "mt": it.get('candidate', ''), "ref": it.get('reference', '')} for it in items], batch_size=len(items), gpus=1 if torch.cuda.is_available() else 0, progress_bar=False)
+    return [float(s) for s in output.scores]
+
+def score_comet_qe(items):
+    import torch
+    model = get_comet_qe()
+    if model is None: raise RuntimeError('COMET-QE not available')
+    output = model.predict([{"src": it.get('source', ''), "mt": it.get('candidate', '')} for it in items], batch_size=len(items), gpus=1 if torch.cuda.is_available() else 0, progress_bar=False)
+    return [float(s) for s in output.scores]
+
+def score_bleurt(items):
+    import torch
+    bleurt_model = get_bleurt()
+    if bleurt_model is None: raise RuntimeError('BLEURT not available')
+    inputs = bleurt_model['tokenizer']([it.get('reference', '') for it in items], [it.get('candidate', '') for it in items], return_tensors='pt', padding=True, truncation=True, max_length=512)
+    device = next(bleurt_model['model'].parameters()).device
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    with torch.no_grad(): scores = bleurt_model['model'](**inputs).logits.view(-1).tolist()
+    return [float(s) for s in scores]
+
+METRIC_SCORERS = {'bertscore': score_bertscore, 'comet': score_comet, 'comet_qe': score_comet_qe, 'bleurt': score_bleurt}
+METRIC_LOADERS = {'bertscore': get_bertscore, 'comet': get_comet, 'comet_qe': get_comet_qe, 'bleurt': get_bleurt}
+
+def score_metric_batched(metric, items, token_budget=BATCH_TOKEN_BUDGET):
+    scores = [None] * len(items)
+    lengths = [approx_tokens(*(it.get(f, '') for f in METRIC_FIELDS[metric])) for it in items]
+    for batch in token_batches(lengths, token_budget):
+        instrumentation.record_batch('metric', len(batch), sum(lengths[i] for i in batch), metric=metric)
+        with instrumentation.stage('forward', metric=metric): batch_scores = run_inference(METRIC_SCORERS[metric], [items[i] for i in batch])
+        for i, score in zip(batch, batch_scores): scores[i] = score
+    return scores
+
+# Concurrent single-segment requests are coalesced into one forward pass per metric
+_batchers = {m: MicroBatcher(m, lambda items, m=m: score_metric_batched(m, items), MICROBATCH_MAX_SIZE, MICROBATCH_WAIT_MS) for m in METRIC_SCORERS}
+
+def submit_metric(metric, item):
+    # A profiled request scores on its own thread, as run_inference() does, so cProfile sees the forward pass
+    if instrumentation.profiling(): return score_metric_batched(metric, [item])[0]
+    return _batchers[metric].submit(item)
+
+def metric_request(metric):
+    # Checked before queueing: a malformed body is the caller's 400, not an error for the whole micro-batch
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict): raise ValueError('JSON object body required')
+    invalid = [f for f in METRIC_FIELDS[metric] if not isinstance(data.get(f, ''), str)]
+    if invalid: raise ValueError(f'Fields must be strings: {", ".join(invalid)}')
+    return data
+
+def batch_request():
+    # Like metric_request(), for /batch: every pair needs each field its requested metrics read, as a string
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict): raise ValueError('JSON object body required')
+    pairs, metrics = data.get('pairs') or [], data.get('metrics') or list(METRIC_SCORERS)
+    if not isinstance(pairs, list) or not all(isinstance(p, dict) for p in pairs): raise ValueError('pairs must be a list of objects')
+    if not isinstance(metrics, list) or not all(isinstance(m, str) for m in metrics): raise ValueError('metrics must be a list of metric names')
+    metrics = [METRIC_ALIASES.get(m, m) for m in metrics]
+    fields = sorted({f for m in metrics for f in METRIC_FIELDS.get(m, ())})
+    invalid = [f'pairs[{i}].{f}' for i, p in enumerate(pairs) for f in fields if not isinstance(p.get(f), str)]
+    if invalid: raise ValueError(f'Fields must be strings: {", ".join(invalid[:10])}' + (f' (+{len(invalid) - 10} more)' if len(invalid) > 10 else ''))
+    return data, pairs, metrics
+
+def cache_bypassed(data):
+    return _cache is None or bool(data.get('no_cache')) or request.args.get('no_cache') == '1'
+
+def metric_model_id(metric):
+    if metric in METRIC_MODEL_IDS: return METRIC_MODEL_IDS[metric]
+    # COMET-QE falls back to a second checkpoint, so the key needs the one that loaded (even for a cache hit)
+    model = get_comet_qe()
+    if model is None: raise RuntimeError('COMET-QE not available')
+    return model.checkpoint_id
+
+def metric_cache_keys(metric, items):
+    model_id = metric_model_id(metric) + cpu_backend.cache_suffix(metric, get_torch_device(), translator=False)
+    return [make_key('score', model_id, *(it.get(f, '') for f in METRIC_FIELDS[metric])) for it in items]
+
+def score_with_cache(metric, items, compute, bypass=False):
+    if _cache is None: return compute(items)
+    keys = metric_cache_keys(metric, items)
+    hits = {} if bypass else _cache.get_many('score', keys)
+    missing = [i for i, k in enumerate(keys) if k not in hits]
+    if missing:
+        computed = compute([items[i] for i in missing])
+        # Keys again now the model has loaded: scores are stored under the backend that produced them
+        _cache.put_many('score', dict(zip(metric_cache_keys(metric, [items[i] for i in missing]), computed)))
+        hits.update({keys[i]: score for i, score in zip(missing, computed)})
+    return [hits[k] for k in keys]
+
+def parse_max_tokens(data):
+    """data with max_tokens as a positive int (left out when not given); ValueError on anything else."""
+    value = data.get('max_tokens')
+    if value is None or value == '': return {k: v for k, v in data.items() if k != 'max_tokens'}
+    parsed = None
+    if not isinstance(value, bool) and not (isinstance(value, float) and not value.is_integer()):
+        try: parsed = int(value)
+        except (TypeError, ValueError): pass
+    if parsed is None or parsed <= 0: raise ValueError(f'max_tokens must be a positive integer, got {value!r}')
+    return dict(data, max_tokens=parsed)
+
+def translation_request():
+    # Parsed once per request, so the cache key and the provider call see the same max_tokens
+    if 'translation_request' not in g:
+        data = request.get_json(silent=True)
+        g.translation_request = parse_max_tokens(data if isinstance(data, dict) else {})
+    return g.translation_request
+
+def translation_cache_key(provider, data):
+    route = f'/translate/{provider}'
+    if provider == 'nllb': route += cpu_backend.cache_suffix(data.get('model') or 'nllb-200-600m')
+    elif provider == 'opus': route += cpu_backend.cache_suffix(f"opus-mt-{data.get('source_lang', 'en')}-{data.get('target_lang', 'de')}")
+    # max_tokens only joins the key when given, so existing entries stay valid
+    return make_key('translation', route, *(data.get(f) for f in TRANSLATION_KEY_FIELDS), *([data['max_tokens']] if data.get('max_tokens') else []))
+
+def cached_translation(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try: data = translation_request()
+        except ValueError as e: return jsonify({'error': str(e)}), 400
+        key = translation_cache_key(request.path.rsplit('/', 1)[-1], data)
+        if not cache_bypassed(data):
+            hit = _cache.get('translation', key)
+            if hit is not None: return jsonify(dict(hit, cached=True))
+        response = make_response(view(*args, **kwargs))
+        # Keyed again after the view: a local model that fell back to fp32 must not be stored under +int8/+onnx
+        if _cache is not None and response.status_code == 200 and response.is_json: _cache.put('translation', translation_cache_key(request.path.rsplit('/', 1)[-1], data), response.get_json())
+        return response
+    return wrapper
 
 def get_argos_translator(from_code, to_code):
     try:
@@ -156,37 +411,103 @@ def get_argos_installed_pairs():
     except: return []
 
 def get_nllb_model(variant='nllb-200-600m'):
-    global _local_models
-    model_key = variant.replace('-', '_').replace('.', '_').replace('nllb_200_', 'nllb_')
-    tok_key = model_key + '_tokenizer'
-    if model_key not in _local_models: model_key, tok_key = 'nllb_600m', 'nllb_600m_tokenizer'
-    if _local_models[model_key] is None:
+    if variant not in NLLB_VARIANTS: variant = 'nllb-200-600m'
+    def load():
         try:
-            from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-            hf_name = NLLB_VARIANTS.get(variant, NLLB_VARIANTS['nllb-200-600m'])
+            from transformers import AutoTokenizer
+            hf_name = NLLB_VARIANTS[variant]
             logger.info(f"Loading {hf_name}...")
-            _local_models[tok_key] = AutoTokenizer.from_pretrained(hf_name)
-            _local_models[model_key] = AutoModelForSeq2SeqLM.from_pretrained(hf_name)
+            entry = {'tokenizer': AutoTokenizer.from_pretrained(hf_name), 'model': cpu_backend.load_seq2seq(variant, hf_name)}
             logger.info(f"{hf_name} loaded")
+            return entry
         except Exception as e:
             logger.error(f"NLLB error: {e}")
-            return None, None
-    return _local_models[model_key], _local_models[tok_key]
+    entry = _models.get(variant, load)
+    return (entry['model'], entry['tokenizer']) if entry else (None, None)
 
 def get_opus_pipeline(from_code, to_code):
-    global _local_models
     key = f"{from_code}-{to_code}"
-    if key not in _local_models['opus_mt']:
+    def load():
         try:
-            from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+            from transformers import AutoTokenizer
             model_name = f"Helsinki-NLP/opus-mt-{from_code}-{to_code}"
             logger.info(f"Loading OPUS-MT: {model_name}")
-            _local_models['opus_mt'][key] = {'model': AutoModelForSeq2SeqLM.from_pretrained(model_name), 'tokenizer': AutoTokenizer.from_pretrained(model_name, use_fast=False)}
+            pipeline = {'model': cpu_backend.load_seq2seq(f'opus-mt-{key}', model_name), 'tokenizer': AutoTokenizer.from_pretrained(model_name, use_fast=False)}
             logger.info(f"OPUS-MT {key} loaded")
+            return pipeline
         except Exception as e:
             logger.error(f"OPUS-MT error: {e}")
-            return None
-    return _local_models['opus_mt'].get(key)
+    return _models.get(f'opus-mt-{key}', load)
+
+def load_model_by_key(key):
+    if key in METRIC_LOADERS: return METRIC_LOADERS[key]()
+    if key in NLLB_VARIANTS: return get_nllb_model(key)[0]
+    if key.startswith('opus-mt-') and key.count('-') == 3: return get_opus_pipeline(*key[len('opus-mt-'):].split('-'))
+    raise ValueError(f'Unknown model: {key}')
+
+def preload_models(keys=None, background=True):
+    keys = PRELOAD_MODELS if keys is None else keys
+    def run():
+        _preload.update(requested=list(keys), done=[], failed=[], running=True)
+        for key in keys:
+            try:
+                if load_model_by_key(key) is None: raise RuntimeError('loader returned nothing')
+                _preload['done'].append(key)
+            except Exception as e:
+                logger.error(f"Preload {key} failed: {e}")
+                _preload['failed'].append(key)
+        _preload['running'] = False
+    if not keys: return None
+    if not background: return run()
+    thread = threading.Thread(target=run, name='model-preload', daemon=True)
+    thread.start()
+    return thread
+
+def get_local_translator(provider, src, tgt, variant='nllb-200-600m'):
+    if provider == 'nllb':
+        src_code, tgt_code = NLLB_LANG_CODES.get(src), NLLB_LANG_CODES.get(tgt)
+        if not src_code or not tgt_code: raise ValueError(f'Unsupported language: {src} or {tgt}')
+        model, tokenizer = get_nllb_model(variant)
+        if model is None: raise RuntimeError(f'NLLB {variant} not available')
+        return model, tokenizer, {'forced_bos_token_id': tokenizer.convert_tokens_to_ids(tgt_code), 'src_lang': src_code}, variant
+    pipeline = get_opus_pipeline(src, tgt)
+    if not pipeline: raise RuntimeError(f'OPUS-MT {src}-{tgt} not available')
+    return pipeline['model'], pipeline['tokenizer'], {}, f'opus-mt-{src}-{tgt}'
+
+def generate_local(model, tokenizer, texts, num_beams=None, src_lang=None, max_length=None, **gen_kwargs):
+    import torch
+    label = getattr(model.config, 'name_or_path', '') or type(model).__name__
+    # NLLB keeps the source language on the shared tokenizer, so set-and-encode must not interleave
+    with instrumentation.stage('tokenize', model=label), tokenizer_lock(tokenizer):
+        if src_lang: tokenizer.src_lang = src_lang
+        inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+    inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    # Batches cap output at twice the longest input so one short segment cannot run to 512 tokens while the rest wait;
+    # the single-segment routes pass max_length and keep their fixed 512-token limit
+    if max_length: gen_kwargs['max_length'] = max_length
+    else: gen_kwargs['max_new_tokens'] = min(LOCAL_MAX_NEW_TOKENS, 2 * inputs['input_ids'].shape[1] + 16)
+    if num_beams: gen_kwargs['num_beams'] = int(num_beams)
+    instrumentation.record_batch('generate', len(texts), int(inputs['attention_mask'].sum()), model=label)
+    with instrumentation.stage('generate', model=label), torch.no_grad(): outputs = model.generate(**inputs, **gen_kwargs)
+    instrumentation.inc('tokens_total', outputs.numel(), kind='generate_output', model=label)
+    return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+def translate_local_batches(provider, segments, variant='nllb-200-600m', num_beams=LOCAL_NUM_BEAMS, token_budget=LOCAL_GEN_TOKEN_BUDGET):
+    groups = {}
+    for i, seg in enumerate(segments): groups.setdefault((seg['source_lang'], seg['target_lang']), []).append(i)
+    for (src, tgt), idxs in groups.items():
+        try: model, tokenizer, gen_kwargs, label = get_local_translator(provider, src, tgt, variant)
+        except Exception as e:
+            yield [{'index': i, 'error': str(e)} for i in idxs]
+            continue
+        for batch in token_batches([approx_tokens(segments[i]['text']) for i in idxs], token_budget, LOCAL_GEN_MAX_BATCH):
+            ids = [idxs[j] for j in batch]
+            try:
+                texts = run_inference(generate_local, model, tokenizer, [segments[i]['text'] for i in ids], num_beams, **gen_kwargs)
+                yield [{'index': i, 'translation': t, 'model': label, 'provider': provider, 'local': True} for i, t in zip(ids, texts)]
+            except Exception as e:
+                logger.error(f"{provider} batch error: {e}")
+                yield [{'index': i, 'error': str(e)} for i in ids]
 
 @app.route('/')
 def index():
@@ -202,57 +523,99 @@ def synonyms_js():
     js_path = os.path.join(SCRIPT_DIR, 'synonyms.js')
     return send_file(js_path) if os.path.exists(js_path) else ("// No synonyms.js", 200)
 
+@app.route('/synonyms/<lang>')
+def synonyms_slice(lang):
+    payload = synonym_index.slice_payload(lang.lower())
+    if payload is None: return jsonify({'error': f'No synonyms for {lang}', 'available': synonym_index.languages()}), 404
+    etag, body, gz = payload
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        use_gzip = 'gzip' in request.accept_encodings
+        response = make_response(gz if use_gzip else body)
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        if use_gzip: response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 @app.route('/bertscore', methods=['POST'])
 def bertscore():
     try:
-        data = request.json
-        scorer = get_bertscore()
-        if scorer is None: return jsonify({'error': 'BERTScore not available'}), 500
-        P, R, F1 = scorer.score([data.get('candidate', '')], [data.get('reference', '')])
-        return jsonify({'precision': float(P[0]), 'recall': float(R[0]), 'f1': float(F1[0])})
+        data = metric_request('bertscore')
+        return jsonify(score_with_cache('bertscore', [data], lambda items: [submit_metric('bertscore', items[0])], cache_bypassed(data))[0])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/comet', methods=['POST'])
 def comet():
     try:
-        import torch
-        data = request.json
-        model = get_comet()
-        if model is None: return jsonify({'error': 'COMET not available'}), 500
-        output = model.predict([{"src": data.get('source', ''), "mt": data.get('candidate', ''), "ref": data.get('reference', '')}], batch_size=1, gpus=1 if torch.cuda.is_available() else 0)
-        return jsonify({'score': float(output.scores[0])})
+        data = metric_request('comet')
+        return jsonify({'score': score_with_cache('comet', [data], lambda items: [submit_metric('comet', items[0])], cache_bypassed(data))[0]})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/comet-qe', methods=['POST'])
 def comet_qe():
     try:
-        import torch
-        data = request.json
-        model = get_comet_qe()
-        if model is None: return jsonify({'error': 'COMET-QE not available'}), 500
-        output = model.predict([{"src": data.get('source', ''), "mt": data.get('candidate', '')}], batch_size=1, gpus=1 if torch.cuda.is_available() else 0)
-        return jsonify({'score': float(output.scores[0])})
+        data = metric_request('comet_qe')
+        return jsonify({'score': score_with_cache('comet_qe', [data], lambda items: [submit_metric('comet_qe', items[0])], cache_bypassed(data))[0]})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/bleurt', methods=['POST'])
 def bleurt():
     try:
-        import torch
+        data = metric_request('bleurt')
+        return jsonify({'score': score_with_cache('bleurt', [data], lambda items: [submit_metric('bleurt', items[0])], cache_bypassed(data))[0]})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batch', methods=['POST'])
+def batch_metrics():
+    try:
+        data, pairs, metrics = batch_request()
+        unknown = [m for m in metrics if m not in METRIC_SCORERS]
+        if unknown: return jsonify({'error': f'Unknown metrics: {", ".join(unknown)}', 'available': list(METRIC_SCORERS)}), 400
+        token_budget, bypass = int(data.get('token_budget', BATCH_TOKEN_BUDGET)), cache_bypassed(data)
+        results, errors = [{} for _ in pairs], {}
+        for metric in metrics:
+            try:
+                scores = score_with_cache(metric, pairs, lambda items: score_metric_batched(metric, items, token_budget), bypass)
+                for result, score in zip(results, scores): result[metric] = score
+            except Exception as e:
+                logger.error(f"Batch {metric} error: {e}")
+                errors[metric] = str(e)
+        return jsonify({'results': results, 'errors': errors, 'count': len(pairs)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/lexical', methods=['POST'])
+def lexical():
+    try:
         data = request.json
-        bleurt_model = get_bleurt()
-        if bleurt_model is None: return jsonify({'error': 'BLEURT not available'}), 500
-        inputs = bleurt_model['tokenizer']([data.get('reference', '')], [data.get('candidate', '')], return_tensors='pt', padding=True, truncation=True, max_length=512)
-        device = next(bleurt_model['model'].parameters()).device
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        with torch.no_grad(): scores = bleurt_model['model'](**inputs).logits.squeeze().tolist()
-        return jsonify({'score': scores if isinstance(scores, float) else float(scores)})
+        pairs = data.get('pairs') or []
+        lang = data.get('lang') or lexical_metrics.meteor_lang(data.get('target_lang'))
+        results, corpus = lexical_metrics.score_batch(pairs, data.get('metrics'), lang, data.get('variant', lexical_metrics.DEFAULT_VARIANT), bool(data.get('corpus')))
+        return jsonify({'results': results, 'corpus': corpus, 'count': len(pairs)})
+    except ValueError as e:
+        return jsonify({'error': str(e), 'available': list(lexical_metrics.METRIC_NAMES)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/translate/argos', methods=['POST'])
+@cached_translation
 def translate_argos():
     try:
         data = request.json
@@ -265,93 +628,334 @@ def translate_argos():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/translate/nllb', methods=['POST'])
+@cached_translation
 def translate_nllb():
     try:
         data = request.json
         text, src, tgt, variant = data.get('text'), data.get('source_lang', 'en'), data.get('target_lang', 'de'), data.get('model', 'nllb-200-600m')
         if not text: return jsonify({'error': 'Text required'}), 400
-        src_code, tgt_code = NLLB_LANG_CODES.get(src), NLLB_LANG_CODES.get(tgt)
-        if not src_code or not tgt_code: return jsonify({'error': f'Unsupported language: {src} or {tgt}'}), 400
-        model, tokenizer = get_nllb_model(variant)
-        if model is None: return jsonify({'error': f'NLLB {variant} not available'}), 500
-        tokenizer.src_lang = src_code
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-        translated = model.generate(**inputs, forced_bos_token_id=tokenizer.convert_tokens_to_ids(tgt_code), max_length=512)
-        return jsonify({'translation': tokenizer.decode(translated[0], skip_special_tokens=True), 'model': variant, 'provider': 'nllb', 'local': True})
+        try: model, tokenizer, gen_kwargs, _ = get_local_translator('nllb', src, tgt, variant)
+        except ValueError as e: return jsonify({'error': str(e)}), 400
+        translation = run_inference(generate_local, model, tokenizer, [text], data.get('num_beams', LOCAL_NUM_BEAMS), max_length=LOCAL_MAX_LENGTH, **gen_kwargs)[0]
+        return jsonify({'translation': translation, 'model': variant, 'provider': 'nllb', 'local': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/translate/opus', methods=['POST'])
+@cached_translation
 def translate_opus():
     try:
         data = request.json
         text, src, tgt = data.get('text'), data.get('source_lang', 'en'), data.get('target_lang', 'de')
         if not text: return jsonify({'error': 'Text required'}), 400
-        pipeline = get_opus_pipeline(src, tgt)
-        if not pipeline: return jsonify({'error': f'OPUS-MT {src}-{tgt} not available'}), 500
-        inputs = pipeline['tokenizer'](text, return_tensors="pt", truncation=True, max_length=512)
-        outputs = pipeline['model'].generate(**inputs, max_length=512)
-        return jsonify({'translation': pipeline['tokenizer'].decode(outputs[0], skip_special_tokens=True), 'model': f'opus-mt-{src}-{tgt}', 'provider': 'opus', 'local': True})
+        model, tokenizer, gen_kwargs, label = get_local_translator('opus', src, tgt)
+        translation = run_inference(generate_local, model, tokenizer, [text], data.get('num_beams', LOCAL_NUM_BEAMS), max_length=LOCAL_MAX_LENGTH, **gen_kwargs)[0]
+        return jsonify({'translation': translation, 'model': label, 'provider': 'opus', 'local': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/translate/anthropic', methods=['POST'])
-def translate_anthropic():
+@app.route('/translate/batch', methods=['POST'])
+def translate_batch():
     try:
         data = request.json
-        text, api_key, model = data.get('text'), data.get('api_key'), data.get('model', 'claude-sonnet-4-20250514')
-        if not text or not api_key: return jsonify({'error': 'Text and API key required'}), 400
-        res = requests.post(ANTHROPIC_API_URL, headers={'Content-Type': 'application/json', 'x-api-key': api_key, 'anthropic-version': '2023-06-01'},
-            json={'model': model, 'max_tokens': 2000, 'system': data.get('system_prompt', 'You are a professional translator.'), 'messages': [{'role': 'user', 'content': text}], 'temperature': 0.3}, timeout=60)
-        if res.status_code != 200: return jsonify({'error': res.json().get('error', {}).get('message', f'API error {res.status_code}')}), res.status_code
-        result = res.json()
-        return jsonify({'translation': result['content'][0]['text'].strip(), 'model': model, 'usage': result.get('usage', {}), 'provider': 'anthropic', 'local': False})
+        provider = data.get('provider', 'nllb')
+        if provider not in LOCAL_BATCH_PROVIDERS and provider not in CLOUD_PROVIDERS: return jsonify({'error': f'Batch translation not supported for {provider}', 'providers': list(LOCAL_BATCH_PROVIDERS) + list(CLOUD_PROVIDERS)}), 400
+        src, tgt = data.get('source_lang', 'en'), data.get('target_lang', 'de')
+        segments = [{'text': seg, 'source_lang': src, 'target_lang': tgt} if isinstance(seg, str) else {'text': seg.get('text', ''), 'source_lang': seg.get('source_lang', src), 'target_lang': seg.get('target_lang', tgt)} for seg in data.get('segments') or []]
+        if not segments: return jsonify({'error': 'Segments required'}), 400
+        if provider in CLOUD_PROVIDERS:
+            base = parse_max_tokens({k: v for k, v in data.items() if k not in ('segments', 'provider', 'stream')})
+            batches = translate_cloud_batches(provider, base, segments, cache_bypassed(data))
+        else:
+            batches = translate_local_batches(provider, segments, data.get('model', 'nllb-200-600m'), data.get('num_beams', LOCAL_NUM_BEAMS), int(data.get('token_budget', LOCAL_GEN_TOKEN_BUDGET)))
+        if data.get('stream', True):
+            return Response(stream_with_context(json.dumps(r, ensure_ascii=False) + '\n' for batch in batches for r in batch), mimetype='application/x-ndjson')
+        results = [None] * len(segments)
+        for batch in batches:
+            for r in batch: results[r['index']] = r
+        return jsonify({'results': results, 'count': len(results)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/translate/openai', methods=['POST'])
-def translate_openai():
+def call_anthropic(data):
+    text, api_key, model = data.get('text'), data.get('api_key'), data.get('model', 'claude-sonnet-4-20250514')
+    if not text or not api_key: return {'error': 'Text and API key required'}, 400
+    res = get_client('anthropic').post(ANTHROPIC_API_URL, headers={'Content-Type': 'application/json', 'x-api-key': api_key, 'anthropic-version': '2023-06-01'},
+        json={'model': model, 'max_tokens': data.get('max_tokens') or 2000, 'system': data.get('system_prompt', 'You are a professional translator.'), 'messages': [{'role': 'user', 'content': text}], 'temperature': 0.3})
+    if res.status_code != 200: return {'error': res.json().get('error', {}).get('message', f'API error {res.status_code}')}, res.status_code
+    result = res.json()
+    return {'translation': result['content'][0]['text'].strip(), 'model': model, 'usage': result.get('usage', {}), 'provider': 'anthropic', 'local': False}, 200
+
+def call_openai_compatible(provider, url, default_model, data):
+    text, api_key, model = data.get('text'), data.get('api_key'), data.get('model', default_model)
+    if not text or not api_key: return {'error': 'Text and API key required'}, 400
+    res = get_client(provider).post(url, headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {api_key}'},
+        json={'model': model, 'messages': [{'role': 'system', 'content': data.get('system_prompt', 'You are a professional translator.')}, {'role': 'user', 'content': text}], 'temperature': 0.3, 'max_tokens': data.get('max_tokens') or 2000})
+    if res.status_code != 200: return {'error': res.json().get('error', {}).get('message', f'API error {res.status_code}')}, res.status_code
+    result = res.json()
+    return {'translation': result['choices'][0]['message']['content'].strip(), 'model': model, 'usage': result.get('usage', {}), 'provider': provider, 'local': False}, 200
+
+def call_deepl(data):
+    text, api_key, target_lang = data.get('text'), data.get('api_key'), data.get('target_lang', 'EN').upper()
+    source_lang = data.get('source_lang', '').upper()
+    if not text or not api_key: return {'error': 'Text and API key required'}, 400
+    url = DEEPL_FREE_API_URL if api_key.endswith(':fx') else DEEPL_PRO_API_URL
+    target_lang = {'EN': 'EN-US', 'PT': 'PT-BR'}.get(target_lang, target_lang)
+    payload = {'text': text, 'target_lang': target_lang}
+    if source_lang: payload['source_lang'] = source_lang
+    res = get_client('deepl').post(url, headers={'Authorization': f'DeepL-Auth-Key {api_key}', 'Content-Type': 'application/x-www-form-urlencoded'}, data=payload, timeout=(10, 30))
+    if res.status_code != 200: return {'error': f'DeepL: {res.text}'}, res.status_code
+    result = res.json()
+    return {'translation': result['translations'][0]['text'], 'source_lang': result['translations'][0].get('detected_source_language', ''), 'provider': 'deepl', 'local': False}, 200
+
+CLOUD_PROVIDERS = {
+    'anthropic': call_anthropic,
+    'openai': lambda data: call_openai_compatible('openai', OPENAI_API_URL, 'gpt-4o', data),
+    'deepseek': lambda data: call_openai_compatible('deepseek', DEEPSEEK_API_URL, 'deepseek-chat', data),
+    'deepl': call_deepl,
+}
+
+def translate_segment_cached(provider, data, bypass=False):
+    key = translation_cache_key(provider, data)
+    if not bypass and _cache is not None:
+        hit = _cache.get('translation', key)
+        if hit is not None: return dict(hit, cached=True), 200
+    payload, status = CLOUD_PROVIDERS[provider](data)
+    if _cache is not None and status == 200: _cache.put('translation', key, payload)
+    return payload, status
+
+def translate_cloud_batches(provider, base, segments, bypass=False):
+    with ThreadPoolExecutor(max_workers=min(len(segments), get_client(provider).max_concurrency)) as pool:
+        futures = {pool.submit(translate_segment_cached, provider, dict(base, **seg), bypass): i for i, seg in enumerate(segments)}
+        for future in as_completed(futures):
+            try:
+                payload, status = future.result()
+                yield [dict(payload, index=futures[future]) if status == 200 else dict(payload, index=futures[future], status=status)]
+            except Exception as e:
+                yield [{'index': futures[future], 'error': str(e)}]
+
+def cloud_route(provider):
     try:
-        data = request.json
-        text, api_key, model = data.get('text'), data.get('api_key'), data.get('model', 'gpt-4o')
-        if not text or not api_key: return jsonify({'error': 'Text and API key required'}), 400
-        res = requests.post(OPENAI_API_URL, headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {api_key}'},
-            json={'model': model, 'messages': [{'role': 'system', 'content': data.get('system_prompt', 'You are a professional translator.')}, {'role': 'user', 'content': text}], 'temperature': 0.3, 'max_tokens': 2000}, timeout=60)
-        if res.status_code != 200: return jsonify({'error': res.json().get('error', {}).get('message', f'API error {res.status_code}')}), res.status_code
-        result = res.json()
-        return jsonify({'translation': result['choices'][0]['message']['content'].strip(), 'model': model, 'usage': result.get('usage', {}), 'provider': 'openai', 'local': False})
+        payload, status = CLOUD_PROVIDERS[provider](translation_request())
+        return jsonify(payload), status
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/translate/anthropic', methods=['POST'])
+@cached_translation
+def translate_anthropic():
+    return cloud_route('anthropic')
+
+@app.route('/translate/openai', methods=['POST'])
+@cached_translation
+def translate_openai():
+    return cloud_route('openai')
+
 @app.route('/translate/deepseek', methods=['POST'])
+@cached_translation
 def translate_deepseek():
+    return cloud_route('deepseek')
+
+@app.route('/translate/deepl', methods=['POST'])
+@cached_translation
+def translate_deepl():
+    return cloud_route('deepl')
+
+@app.route('/judge', methods=['POST'])
+def judge_segments():
     try:
         data = request.json
-        text, api_key, model = data.get('text'), data.get('api_key'), data.get('model', 'deepseek-chat')
-        if not text or not api_key: return jsonify({'error': 'Text and API key required'}), 400
-        res = requests.post(DEEPSEEK_API_URL, headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {api_key}'},
-            json={'model': model, 'messages': [{'role': 'system', 'content': data.get('system_prompt', 'You are a professional translator.')}, {'role': 'user', 'content': text}], 'temperature': 0.3, 'max_tokens': 2000}, timeout=60)
-        if res.status_code != 200: return jsonify({'error': res.json().get('error', {}).get('message', f'API error {res.status_code}')}), res.status_code
-        result = res.json()
-        return jsonify({'translation': result['choices'][0]['message']['content'].strip(), 'model': model, 'usage': result.get('usage', {}), 'provider': 'deepseek', 'local': False})
+        provider = data.get('provider', 'deepseek')
+        if provider not in llm_judge.PROVIDERS: return jsonify({'error': f'Unknown judge provider: {provider}', 'providers': list(llm_judge.PROVIDERS)}), 400
+        items = [{'original': it.get('original', it.get('source')), 'translation': it.get('translation')} for it in data.get('items') or [] if isinstance(it, dict)]
+        if not items or any(not isinstance(it['original'], str) or not isinstance(it['translation'], str) for it in items): return jsonify({'error': 'Items required: [{original, translation}, ...]'}), 400
+        api_key = data.get('api_key') or load_api_keys().get(provider)
+        if not api_key: return jsonify({'error': 'API key required'}), 400
+        client = get_client(provider)
+        return jsonify(llm_judge.judge(CLOUD_PROVIDERS[provider], provider, items, api_key, data.get('model'), data.get('source_lang', 'en'), data.get('target_lang', 'de'),
+                                       int(data.get('token_budget') or llm_judge.JUDGE_TOKEN_BUDGET), int(data.get('max_segments') or llm_judge.JUDGE_MAX_SEGMENTS),
+                                       concurrency=min(int(data.get('concurrency') or client.max_concurrency), client.max_concurrency), cache=None if cache_bypassed(data) else _cache))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/translate/deepl', methods=['POST'])
-def translate_deepl():
+def load_api_keys():
+    try:
+        with open(os.path.join(SCRIPT_DIR, 'api_keys.json'), encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError): return {}
+
+def job_translate(spec, secrets, items):
+    provider, src, tgt = spec['provider'], spec['source_lang'], spec['target_lang']
+    segments = [{'text': it['source'], 'source_lang': src, 'target_lang': tgt} for it in items]
+    if provider in CLOUD_PROVIDERS:
+        base = {k: v for k, v in {'api_key': secrets.get('api_key') or load_api_keys().get(provider), 'model': spec.get('model'), 'system_prompt': spec.get('system_prompt')}.items() if v}
+        batches = translate_cloud_batches(provider, base, segments)
+    elif provider in LOCAL_BATCH_PROVIDERS:
+        batches = translate_local_batches(provider, segments, spec.get('model') or 'nllb-200-600m', spec.get('num_beams') or LOCAL_NUM_BEAMS)
+    else:
+        translator = get_argos_translator(src, tgt)
+        batches = [[{'index': i, 'translation': translator.translate(seg['text']), 'model': f'argos-{src}-{tgt}'} if translator else {'index': i, 'error': f'Argos: {src}-{tgt} not available'} for i, seg in enumerate(segments)]]
+    for batch in batches:
+        for r in batch:
+            item = items[r['index']]
+            if 'translation' in r: item.update(translation=r['translation'], model=r.get('model', spec.get('model')))
+            else: item['error'] = r.get('error', 'Translation failed')
+    return items
+
+def job_score(spec, items):
+    pairs = [{'source': it['source'], 'candidate': it['translation'], 'reference': it.get('reference') or ''} for it in items]
+    for it in items: it['scores'] = {}
+    lexical = [m for m in spec['metrics'] if m in lexical_metrics.METRIC_NAMES]
+    if lexical:
+        for it, scores in zip(items, lexical_metrics.score_batch(pairs, lexical, lexical_metrics.meteor_lang(spec['target_lang']), workers=1)[0]): it['scores'].update(scores)
+    for metric in spec['metrics']:
+        if metric in lexical: continue
+        try:
+            scores = score_with_cache(metric, pairs, lambda batch: score_metric_batched(metric, batch))
+        except Exception as e:
+            scores = [None] * len(items)
+            for it in items: it.setdefault('score_errors', {})[metric] = str(e)
+        for it, score in zip(items, scores): it['scores'][metric] = score
+
+_jobs = JobManager(JOBS_DIR, SCRIPT_DIR, job_translate, job_score, JOB_CHUNK_SIZE)
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
     try:
         data = request.json
-        text, api_key, target_lang = data.get('text'), data.get('api_key'), data.get('target_lang', 'EN').upper()
-        source_lang = data.get('source_lang', '').upper()
-        if not text or not api_key: return jsonify({'error': 'Text and API key required'}), 400
-        url = DEEPL_FREE_API_URL if api_key.endswith(':fx') else DEEPL_PRO_API_URL
-        target_lang = {'EN': 'EN-US', 'PT': 'PT-BR'}.get(target_lang, target_lang)
-        payload = {'text': text, 'target_lang': target_lang}
-        if source_lang: payload['source_lang'] = source_lang
-        res = requests.post(url, headers={'Authorization': f'DeepL-Auth-Key {api_key}', 'Content-Type': 'application/x-www-form-urlencoded'}, data=payload, timeout=30)
-        if res.status_code != 200: return jsonify({'error': f'DeepL: {res.text}'}), res.status_code
-        result = res.json()
-        return jsonify({'translation': result['translations'][0]['text'], 'source_lang': result['translations'][0].get('detected_source_language', ''), 'provider': 'deepl', 'local': False})
+        provider = data.get('provider', 'nllb')
+        if provider not in LOCAL_BATCH_PROVIDERS and provider not in CLOUD_PROVIDERS and provider != 'argos': return jsonify({'error': f'Unknown provider: {provider}'}), 400
+        metrics = [METRIC_ALIASES.get(m, m) for m in data.get('metrics') or []]
+        unknown = [m for m in metrics if m not in METRIC_SCORERS and m not in lexical_metrics.METRIC_NAMES]
+        if unknown: return jsonify({'error': f'Unknown metrics: {", ".join(unknown)}', 'available': list(METRIC_SCORERS) + list(lexical_metrics.METRIC_NAMES)}), 400
+        if not data.get('corpus'): return jsonify({'error': 'Corpus required'}), 400
+        spec = {'corpus': data['corpus'], 'source_lang': data.get('source_lang', 'en'), 'target_lang': data.get('target_lang', 'de'), 'provider': provider, 'model': data.get('model'),
+                'system_prompt': data.get('system_prompt'), 'num_beams': data.get('num_beams'), 'metrics': metrics, 'limit': data.get('limit')}
+        return jsonify(_jobs.create(spec, {'api_key': data.get('api_key')})), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({'jobs': _jobs.list()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = _jobs.get(job_id)
+    return jsonify(job) if job else (jsonify({'error': 'Job not found'}), 404)
+
+@app.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    job = _jobs.get(job_id)
+    if not job: return jsonify({'error': 'Job not found'}), 404
+    if job['status'] == 'completed': return jsonify(job)
+    if not _jobs.start(job_id, {'api_key': (request.get_json(silent=True) or {}).get('api_key')}): return jsonify({'error': 'Job is already running'}), 409
+    return jsonify(_jobs.get(job_id)), 202
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not _jobs.get(job_id): return jsonify({'error': 'Job not found'}), 404
+    _jobs.cancel(job_id)
+    return jsonify(_jobs.get(job_id))
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    if not _jobs.get(job_id): return jsonify({'error': 'Job not found'}), 404
+    offset, follow = request.args.get('offset', 0, type=int), request.args.get('follow') == '1'
+    def generate():
+        with open(_jobs.results_path(job_id), encoding='utf-8') as f:
+            for _ in range(offset):
+                if not f.readline(): return
+            while True:
+                pos, line = f.tell(), f.readline()
+                if line.endswith('\n'):
+                    yield line
+                    continue
+                f.seek(pos)
+                if not follow or _jobs.get(job_id)['status'] not in ('queued', 'running'):
+                    yield from (l for l in f if l.endswith('\n'))
+                    return
+                time.sleep(0.5)
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def results_filters():
+    split = lambda name: [v.strip() for v in request.args.get(name, '').split(',') if v.strip()] or None
+    return {'runs': split('runs'), 'models': split('models'), 'metrics': split('metrics'), 'pair': request.args.get('pair'), 'mode': request.args.get('mode')}
+
+@app.route('/results/import', methods=['POST'])
+def import_results():
+    try:
+        data = request.get_json(silent=True) or {}
+        if data.get('job'):
+            job = _jobs.get(data['job'])
+            if not job: return jsonify({'error': 'Job not found'}), 404
+            with open(_jobs.results_path(job['id']), encoding='utf-8') as f: return jsonify(_results.import_job(job, [l for l in f if l.endswith('\n')]))
+        if data.get('path'):
+            path = os.path.realpath(os.path.join(SCRIPT_DIR, data['path']))
+            if os.path.commonpath([path, os.path.realpath(SCRIPT_DIR)]) != os.path.realpath(SCRIPT_DIR): return jsonify({'error': 'Path outside project directory'}), 400
+            if not os.path.isfile(path): return jsonify({'error': f"File not found: {data['path']}"}), 404
+            return jsonify(_results.import_file(path, data.get('name')))
+        if not data.get('name') or not isinstance(data.get('rows'), list): return jsonify({'error': 'Expected {path}, {job} or {name, rows}'}), 400
+        return jsonify(_results.import_rows(data['rows'], data['name'], data.get('source')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/results/runs', methods=['GET'])
+def list_results():
+    return jsonify({'runs': _results.runs(request.args.get('pair'), request.args.get('mode')), 'store': _results.stats()})
+
+@app.route('/results/runs/<run>', methods=['GET'])
+def get_results(run):
+    info = _results.run(run)
+    return jsonify(info) if info else (jsonify({'error': 'Run not found'}), 404)
+
+@app.route('/results/runs/<run>', methods=['DELETE'])
+def delete_results(run):
+    return jsonify({'deleted': run}) if _results.delete_run(run) else (jsonify({'error': 'Run not found'}), 404)
+
+@app.route('/results/aggregate', methods=['GET'])
+def aggregate_results():
+    try:
+        percentiles = [float(p) for p in request.args.get('percentiles', '50,90').split(',') if p.strip()]
+        if any(not 0 <= p <= 100 for p in percentiles): return jsonify({'error': 'Percentiles must be between 0 and 100'}), 400
+        return jsonify({'models': _results.aggregate(percentiles=percentiles, **results_filters())})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/results/deltas', methods=['GET'])
+def results_deltas():
+    try:
+        filters = results_filters()
+        metric, baseline = request.args.get('metric'), request.args.get('baseline')
+        if not metric or not baseline: return jsonify({'error': 'metric and baseline required'}), 400
+        return jsonify({'metric': metric, 'baseline': baseline, 'models': _results.deltas(metric, baseline, filters['runs'], filters['models'], filters['pair'], filters['mode'])})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/results/export', methods=['GET'])
+def export_results():
+    try:
+        filters, fmt = results_filters(), request.args.get('format', 'json')
+        if fmt not in ('json', 'csv'): return jsonify({'error': 'format must be json or csv'}), 400
+        metrics, rows = _results.export(**filters)
+        body = export_csv(rows, metrics) if fmt == 'csv' else export_json(rows)
+        return Response(stream_with_context(body), mimetype='text/csv' if fmt == 'csv' else 'application/json',
+                        headers={'Content-Disposition': f'attachment; filename=results.{fmt}'})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -364,9 +968,10 @@ def local_status():
     except: pass
     try:
         from transformers import AutoModelForSeq2SeqLM
-        status['nllb'] = {'installed': True}
-        status['opus'] = {'installed': True, 'loaded_pairs': list(_local_models['opus_mt'].keys())}
+        status['nllb'] = {'installed': True, 'loaded': [k for k in _models.keys() if k in NLLB_VARIANTS]}
+        status['opus'] = {'installed': True, 'loaded_pairs': [k[len('opus-mt-'):] for k in _models.keys() if k.startswith('opus-mt-')]}
     except: pass
+    status['models'] = _models.stats()
     return jsonify(status)
 
 @app.route('/health', methods=['GET'])
@@ -375,12 +980,29 @@ def health():
         import torch
         device = get_torch_device()
     except: device = "cpu"
-    return jsonify({'status': 'ok', 'device': device, 'models_loaded': {
-        'bertscore': _metric_models['bertscore'] is not None,
-        'comet': _metric_models['comet'] is not None,
-        'comet_qe': _metric_models['comet_qe'] is not None,
-        'bleurt': _metric_models['bleurt'] is not None
-    }})
+    return jsonify({'status': 'ok', 'device': device, 'models_loaded': {m: _models.is_loaded(m) for m in METRIC_LOADERS},
+        'models': dict(_models.stats(), preload=_preload, backends=cpu_backend.active()), 'batching': {m: b.stats() for m, b in _batchers.items()}, 'cache': _cache.stats() if _cache else {'enabled': False}, 'providers': provider_stats()})
+
+def server_metrics():
+    rows = []
+    for kind, s in (_cache.stats()['kinds'] if _cache else {}).items():
+        rows += [('cache_hits_total', 'counter', {'kind': kind}, s['hits']), ('cache_misses_total', 'counter', {'kind': kind}, s['misses'])]
+    for provider, s in provider_stats().items():
+        rows += [(f'provider_{f}_total', 'counter', {'provider': provider}, s[f]) for f in ('requests', 'retries', 'errors')] + [('provider_in_flight', 'gauge', {'provider': provider}, s['in_flight'])]
+    models = _models.stats()
+    rows.append(('model_memory_bytes', 'gauge', {}, int(models['used_mb'] * 1048576)))
+    rows += [('model_load_seconds', 'gauge', {'model': key, 'device': m['device']}, m['load_time_s']) for key, m in models['models'].items()]
+    for metric, s in ((m, b.stats()) for m, b in _batchers.items()):
+        rows += [('microbatch_queued', 'gauge', {'metric': metric}, s['queued']), ('microbatch_avg_queue_wait_ms', 'gauge', {'metric': metric}, s['avg_queue_wait_ms'])]
+    return rows
+
+instrumentation.register_collector(server_metrics, {'cache_hits_total': 'Result cache hits by kind (translation, score)', 'provider_retries_total': 'Provider calls retried after 429/5xx or connection errors',
+    'model_load_seconds': 'Load time of each resident model', 'microbatch_avg_queue_wait_ms': 'Mean time single-segment metric requests wait to be batched'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if request.args.get('format') == 'json': return jsonify(instrumentation.snapshot())
+    return Response(instrumentation.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
@@ -393,5 +1015,8 @@ if __name__ == '__main__':
     print(f" Device: {get_torch_device()}")
     if os.path.exists(os.path.join(SCRIPT_DIR, 'translator.html')): print(" translator.html found")
     if os.path.exists(os.path.join(SCRIPT_DIR, 'synonyms.js')): print(" synonyms.js found")
+    if PRELOAD_MODELS: print(f" Preloading in background: {', '.join(PRELOAD_MODELS)}")
+    configure_torch()
+    preload_models()
     print(f"\n Starting server... Press Ctrl+C to stop\n")
-    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
+    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False, threaded=True)
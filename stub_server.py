@@ -0,0 +1,118 @@
+"""
+Local stub of the cloud translation APIs (Anthropic, OpenAI/DeepSeek, DeepL) for
+exercising the provider layer without network access or API spend.
+Packed judge prompts (llm_judge.py) get a JSON array of scores back; --judge-drop-rate
+leaves that fraction of segments out of each reply to exercise the re-requests.
+Run: python stub_server.py --port 5055 --latency-ms 200 --fail-rate 0.1
+Then start the server with the printed *_API_URL variables.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+def stub_translate(text, target_lang=''):
+    return f"[{target_lang or 'xx'}] {text}"
+
+
+def stub_judge(text, drop_rate=0.0):
+    """Scores for the segment objects of a packed judge prompt, one per line; None if the prompt is not one."""
+    segments = []
+    for line in text.splitlines():
+        if not line.startswith('{"id"'): continue
+        try: segments.append(json.loads(line.rstrip(',')))
+        except ValueError: continue
+    if not segments: return None
+    replies = []
+    for seg in segments:
+        if random.random() < drop_rate: continue
+        ratio = len(seg.get('translation') or '') / max(1, len(seg.get('original') or ''))
+        adequacy = round(max(1.0, 10 - abs(1 - ratio) * 10), 1)
+        fluency = round(max(1.0, 9.5 - (seg.get('translation') == seg.get('original')) * 5), 1)
+        replies.append({'id': seg['id'], 'fluency': fluency, 'adequacy': adequacy, 'overall': round((fluency + adequacy) / 2, 1), 'feedback': 'stub judgement'})
+    return json.dumps(replies, ensure_ascii=False)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without TCP_NODELAY each keep-alive reply stalls on delayed ACK
+    disable_nagle_algorithm = True
+    latency, fail_rate, retry_after, judge_drop_rate = 0.0, 0.0, '0', 0.0
+    counts = {'requests': 0, 'failures': 0}
+    lock = threading.Lock()
+
+    def log_message(self, *args): pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for k, v in (headers or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        with self.lock: counts = dict(self.counts)
+        self._send(200, counts)
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0)).decode('utf-8')
+        with self.lock: self.counts['requests'] += 1
+        if self.latency: time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            with self.lock: self.counts['failures'] += 1
+            return self._send(429, {'error': {'message': 'stub rate limit'}}, {'Retry-After': self.retry_after})
+        if self.path.endswith('/v2/translate'):
+            form = parse_qs(raw)
+            return self._send(200, {'translations': [{'text': stub_translate(t, form.get('target_lang', [''])[0]), 'detected_source_language': form.get('source_lang', ['EN'])[0]} for t in form.get('text', [])]})
+        body = json.loads(raw or '{}')
+        text = body.get('messages', [{}])[-1].get('content', '')
+        reply = self.reply_text(body, text)
+        usage_in, usage_out = len(text) // 4 + 1, len(reply) // 4 + 1
+        if self.path.endswith('/v1/messages'):
+            return self._send(200, {'content': [{'type': 'text', 'text': reply}], 'usage': {'input_tokens': usage_in, 'output_tokens': usage_out}})
+        if self.path.endswith('/chat/completions'):
+            return self._send(200, {'choices': [{'message': {'role': 'assistant', 'content': reply}}], 'usage': {'prompt_tokens': usage_in, 'completion_tokens': usage_out, 'total_tokens': usage_in + usage_out}})
+        self._send(404, {'error': {'message': f'Unknown stub path {self.path}'}})
+
+    def reply_text(self, body, text):
+        judged = stub_judge(text, self.judge_drop_rate)
+        return judged if judged is not None else stub_translate(text)
+
+
+def start_stub_server(port=0, latency_ms=0, fail_rate=0.0, retry_after='0', handler=StubHandler, judge_drop_rate=0.0):
+    handler = type('ConfiguredStubHandler', (handler,), {'latency': latency_ms / 1000.0, 'fail_rate': fail_rate, 'retry_after': str(retry_after), 'judge_drop_rate': judge_drop_rate,
+                                                         'counts': {'requests': 0, 'failures': 0}, 'lock': threading.Lock()})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def stub_env(base_url):
+    return {'ANTHROPIC_API_URL': f'{base_url}/v1/messages', 'OPENAI_API_URL': f'{base_url}/v1/chat/completions', 'DEEPSEEK_API_URL': f'{base_url}/chat/completions',
+            'DEEPL_FREE_API_URL': f'{base_url}/v2/translate', 'DEEPL_PRO_API_URL': f'{base_url}/v2/translate'}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stub for the cloud translation APIs')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', default='0')
+    parser.add_argument('--judge-drop-rate', type=float, default=0.0, help='fraction of segments left out of judge replies')
+    args = parser.parse_args()
+    server, base_url = start_stub_server(args.port, args.latency_ms, args.fail_rate, args.retry_after, judge_drop_rate=args.judge_drop_rate)
+    print(f"\n Provider stub - {base_url}\n")
+    for k, v in stub_env(base_url).items(): print(f" {k}={v}")
+    print("\n Press Ctrl+C to stop\n")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,161 @@
+"""
+Compiled synonym index for METEOR.
+synonyms.js is parsed once into one binary file per language under cache/synonyms/
+(sorted words -> group ids, memory-mapped and shared by every worker process), and
+recompiled when synonyms.js changes. Two words are synonyms when they share a group,
+which is the relation buildSynonymMap()/areSynonyms() implement in the browser.
+The browser fetches only its target language's slice from /synonyms/<lang>.
+"""
+
+import bisect
+import functools
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_PATH = os.path.join(SCRIPT_DIR, 'synonyms.js')
+INDEX_DIR = os.environ.get('SYNONYM_INDEX_DIR', os.path.join(SCRIPT_DIR, 'cache', 'synonyms'))
+
+MAGIC = b'SYNIDX1\0'
+# magic, source sha1, word count, group count, id count, blob bytes
+HEADER = struct.Struct('<8s20sIIII')
+GROUP_RE = re.compile(r'\[([^\[\]]*)\]')
+STRING_RE = re.compile(r'''(['"])(.*?)\1''')
+LANG_BLOCK_RE = re.compile(r'^\s*([a-z]{2,3})\s*:\s*\[', re.M)
+
+
+def parse_synonyms_js(source):
+    """{lang: [[word, ...], ...]} from the synonymGroups object literal."""
+    blocks = list(LANG_BLOCK_RE.finditer(source))
+    groups = {}
+    for block, following in zip(blocks, blocks[1:] + [None]):
+        body = source[block.end():following.start() if following else len(source)]
+        groups[block.group(1)] = [[s for _, s in STRING_RE.findall(g)] for g in GROUP_RE.findall(body)]
+    return groups
+
+
+def write_index(path, groups, digest):
+    by_word = {}
+    for gid, group in enumerate(groups):
+        for word in group:
+            ids = by_word.setdefault(word.lower().encode('utf-8'), [])
+            if gid not in ids: ids.append(gid)
+    words = sorted(by_word)
+    word_offsets, id_offsets, ids = [0], [0], []
+    for w in words:
+        word_offsets.append(word_offsets[-1] + len(w))
+        ids += by_word[w]
+        id_offsets.append(len(ids))
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, digest, len(words), len(groups), len(ids), word_offsets[-1]))
+        for values in (word_offsets, id_offsets, ids): f.write(struct.pack(f'<{len(values)}I', *values))
+        f.write(b''.join(words))
+    os.replace(tmp, path)
+
+
+class SynonymIndex:
+    def __init__(self, path):
+        with open(path, 'rb') as f: self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.digest, self.word_count, self.group_count, id_count, _ = HEADER.unpack_from(self._buf)
+        if magic != MAGIC: raise ValueError(f'Not a synonym index: {path}')
+        view = memoryview(self._buf)[HEADER.size:]
+        n = self.word_count + 1
+        self._word_offsets = view[:4 * n].cast('I')
+        self._id_offsets = view[4 * n:8 * n].cast('I')
+        self._ids = view[8 * n:8 * n + 4 * id_count].cast('I')
+        self._blob = view[8 * n + 4 * id_count:]
+        self.groups = functools.lru_cache(maxsize=65536)(self._groups)
+
+    def __len__(self): return self.word_count
+
+    def __getitem__(self, i): return bytes(self._blob[self._word_offsets[i]:self._word_offsets[i + 1]])
+
+    def _groups(self, word):
+        """Group ids containing word (lowercase), empty when it has no synonyms."""
+        key = word.encode('utf-8')
+        i = bisect.bisect_left(self, key)
+        if i == self.word_count or self[i] != key: return frozenset()
+        return frozenset(self._ids[self._id_offsets[i]:self._id_offsets[i + 1]])
+
+    def are_synonyms(self, a, b): return a == b or not self.groups(a).isdisjoint(self.groups(b))
+
+    def items(self):
+        for i in range(self.word_count): yield self[i].decode('utf-8'), list(self._ids[self._id_offsets[i]:self._id_offsets[i + 1]])
+
+
+_lock = threading.Lock()
+_state = {'digest': None, 'mtime': None, 'indexes': {}, 'slices': {}}
+
+
+def _source_digest():
+    with open(SOURCE_PATH, 'rb') as f: return hashlib.sha1(f.read()).digest()
+
+
+def _refresh():
+    """Compile synonyms.js when it changed since the indexes were written; caller holds _lock."""
+    try: mtime = os.stat(SOURCE_PATH).st_mtime_ns
+    except FileNotFoundError: mtime = None
+    if mtime == _state['mtime'] and _state['digest'] is not None: return
+    _state.update(mtime=mtime, indexes={}, slices={})
+    if mtime is None:
+        _state['digest'] = b''
+        return
+    digest = _source_digest()
+    _state['digest'] = digest
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    manifest = os.path.join(INDEX_DIR, 'languages.json')
+    try:
+        with open(manifest, encoding='utf-8') as f: compiled = json.load(f)
+        if compiled.get('sha1') == digest.hex() and all(os.path.exists(os.path.join(INDEX_DIR, f'{l}.bin')) for l in compiled['languages']): return
+    except (FileNotFoundError, ValueError, KeyError): pass
+    with open(SOURCE_PATH, encoding='utf-8') as f: groups = parse_synonyms_js(f.read())
+    for lang, lang_groups in groups.items(): write_index(os.path.join(INDEX_DIR, f'{lang}.bin'), lang_groups, digest)
+    with open(manifest + '.tmp', 'w', encoding='utf-8') as f: json.dump({'sha1': digest.hex(), 'languages': sorted(groups)}, f)
+    os.replace(manifest + '.tmp', manifest)
+
+
+def languages():
+    with _lock:
+        _refresh()
+        try:
+            with open(os.path.join(INDEX_DIR, 'languages.json'), encoding='utf-8') as f: return json.load(f)['languages']
+        except (FileNotFoundError, ValueError, KeyError): return []
+
+
+def get_index(lang):
+    """SynonymIndex for lang, or None when synonyms.js has no (or an empty) table for it."""
+    if not re.fullmatch(r'[a-z]{2,3}', lang or ''): return None
+    with _lock:
+        _refresh()
+        if lang not in _state['indexes']:
+            path = os.path.join(INDEX_DIR, f'{lang}.bin')
+            index = SynonymIndex(path) if os.path.exists(path) else None
+            _state['indexes'][lang] = index if index is not None and len(index) else None
+        return _state['indexes'][lang]
+
+
+def slice_payload(lang):
+    """(etag, json bytes, gzipped bytes) for the browser: {lang, words, groups, index: {word: [group ids]}}."""
+    index = get_index(lang)
+    if index is None: return None
+    with _lock:
+        cached = _state['slices'].get(lang)
+        if cached is None or cached[0] != index.digest.hex()[:16] + f'-{lang}':
+            body = json.dumps({'lang': lang, 'words': len(index), 'groups': index.group_count, 'index': dict(index.items())}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            cached = _state['slices'][lang] = (index.digest.hex()[:16] + f'-{lang}', body, gzip.compress(body, 9))
+        return cached
+
+
+if __name__ == '__main__':
+    for lang in languages():
+        index = get_index(lang)
+        etag, body, gz = slice_payload(lang)
+        print(f" {lang}: {len(index)} words, {index.group_count} groups, slice {len(body) // 1024} KB ({len(gz) // 1024} KB gzip)")
+    print(f" Indexes in {INDEX_DIR}")
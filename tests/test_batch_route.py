@@ -0,0 +1,57 @@
+import pytest
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import server
+    monkeypatch.setattr(server, '_cache', None)
+
+    def comet(items): return [len(it['candidate']) / 10 for it in items]
+
+    def bleurt(items): raise RuntimeError('BLEURT not available')
+
+    monkeypatch.setitem(server.METRIC_SCORERS, 'comet', comet)
+    monkeypatch.setitem(server.METRIC_SCORERS, 'bleurt', bleurt)
+    return server.app.test_client()
+
+
+def pair(candidate): return {'source': 'src', 'reference': 'ref', 'candidate': candidate}
+
+
+def test_results_keep_request_order(client):
+    # Lengths vary so the token batching reorders the work internally
+    candidates = ['a' * n for n in (9, 1, 30, 4, 17)]
+    res = client.post('/batch', json={'pairs': [pair(c) for c in candidates], 'metrics': ['comet'], 'token_budget': 12})
+    assert res.status_code == 200
+    body = res.get_json()
+    assert [r['comet'] for r in body['results']] == [len(c) / 10 for c in candidates]
+    assert body['errors'] == {} and body['count'] == 5
+
+
+def test_one_metric_failing_keeps_the_others(client):
+    res = client.post('/batch', json={'pairs': [pair('abc'), pair('abcdef')], 'metrics': ['comet', 'bleurt']})
+    body = res.get_json()
+    assert res.status_code == 200
+    assert body['errors'] == {'bleurt': 'BLEURT not available'}
+    assert [r['comet'] for r in body['results']] == [0.3, 0.6]
+    assert all('bleurt' not in r for r in body['results'])
+
+
+@pytest.mark.parametrize('body', [
+    [1, 2],
+    {'pairs': 'not a list'},
+    {'pairs': ['text']},
+    {'pairs': [{'source': 's', 'reference': 'r', 'candidate': 3}], 'metrics': ['comet']},
+    {'pairs': [{'source': 's', 'candidate': 'c'}], 'metrics': ['comet']},
+    {'pairs': [pair('c')], 'metrics': 'comet'},
+    {'pairs': [pair('c')], 'metrics': ['comet'], 'token_budget': 'many'},
+])
+def test_malformed_bodies_are_rejected(client, body):
+    res = client.post('/batch', json=body)
+    assert res.status_code == 400
+    assert 'error' in res.get_json()
+
+
+def test_fields_are_only_required_for_requested_metrics(client):
+    res = client.post('/batch', json={'pairs': [{'candidate': 'c', 'reference': 'r'}], 'metrics': ['bleurt']})
+    assert res.status_code == 200
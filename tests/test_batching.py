@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def lengths(items):
+    if any(not isinstance(it, dict) for it in items): raise TypeError('item must be a dict')
+    return [len(it['text']) for it in items]
+
+
+def submit_together(batcher, items):
+    # A long wait window so every item lands in one batch
+    with ThreadPoolExecutor(len(items)) as pool:
+        futures = [pool.submit(batcher.submit, item, 5) for item in items]
+        return [f.exception() or f.result() for f in futures]
+
+
+def test_coalesces_concurrent_requests():
+    batcher = MicroBatcher('len', lengths, max_batch=8, max_wait_ms=200)
+    assert submit_together(batcher, [{'text': 'a' * n} for n in range(1, 5)]) == [1, 2, 3, 4]
+    stats = batcher.stats()
+    assert stats['requests'] == 4 and stats['batches'] == 1 and stats['errors'] == 0
+
+
+def test_bad_input_only_fails_its_own_caller():
+    batcher = MicroBatcher('len', lengths, max_batch=8, max_wait_ms=200)
+    results = submit_together(batcher, [{'text': 'ab'}, None, {'text': 'abc'}])
+    assert results[0] == 2 and results[2] == 3
+    assert isinstance(results[1], TypeError)
+    stats = batcher.stats()
+    assert stats['errors'] == 1 and stats['fallbacks'] == 1
+
+
+def test_short_result_list_resolves_every_future():
+    calls = []
+
+    def drops_last(items):
+        calls.append(len(items))
+        return [0] * (len(items) - 1)
+
+    batcher = MicroBatcher('short', drops_last, max_batch=8, max_wait_ms=200)
+    results = submit_together(batcher, [{'text': 'a'}, {'text': 'b'}])
+    assert all(isinstance(r, RuntimeError) for r in results)
+    with pytest.raises(RuntimeError):
+        batcher.submit({'text': 'c'}, timeout=5)
+
+
+def test_stats_before_first_batch():
+    stats = MicroBatcher('idle', lengths).stats()
+    assert 'queue_wait_ms_total' not in stats
+    assert stats['avg_queue_wait_ms'] == 0 and stats['requests'] == 0
@@ -0,0 +1,69 @@
+import pytest
+
+from cache import ResultCache, make_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / 'cache.sqlite3'), 1 << 20)
+
+
+def test_round_trip(cache):
+    key = make_key('score', 'comet', 'src', 'mt', 'ref')
+    cache.put('score', key, 0.81)
+    assert cache.get('score', key) == 0.81
+    assert cache.get_many('score', [key, 'missing']) == {key: 0.81}
+
+
+def test_failed_write_rolls_back(cache):
+    db = cache._db()
+    db.execute("CREATE TRIGGER reject BEFORE INSERT ON entries WHEN NEW.kind = 'bad' BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+    with pytest.raises(Exception, match='rejected'):
+        cache.put_many('bad', {'a': 1, 'b': 2})
+    assert not db.in_transaction
+    cache.put('score', 'c', 3)
+    assert cache.get('score', 'c') == 3
+    assert cache.stats()['entries'] == 1
+
+
+def test_comet_qe_key_follows_loaded_checkpoint(monkeypatch):
+    import server
+
+    class Loaded:
+        checkpoint_id = server.COMET_QE_MODELS[1]
+
+    monkeypatch.setattr(server, 'get_comet_qe', lambda: Loaded())
+    assert server.metric_model_id('comet_qe') == server.COMET_QE_MODELS[1]
+    monkeypatch.setattr(server, 'get_comet_qe', lambda: None)
+    with pytest.raises(RuntimeError):
+        server.metric_model_id('comet_qe')
+    assert server.metric_model_id('bertscore') == f'bert-score/{server.BERTSCORE_MODEL}/rescaled'
+
+
+def test_cache_suffix_follows_the_loaded_backend(monkeypatch):
+    import cpu_backend
+    monkeypatch.setattr(cpu_backend, '_active', {})
+    monkeypatch.setattr(cpu_backend, '_overrides', {'opus-mt-en-de': 'int8'})
+    assert cpu_backend.cache_suffix('opus-mt-en-de') == '+int8'
+    # The int8 conversion failed and the model runs fp32
+    cpu_backend._active['opus-mt-en-de'] = 'fp32'
+    assert cpu_backend.cache_suffix('opus-mt-en-de') == ''
+
+
+def test_scores_are_stored_under_the_backend_that_produced_them(cache, monkeypatch):
+    import cpu_backend
+    import server
+    monkeypatch.setattr(server, '_cache', cache)
+    monkeypatch.setattr(cpu_backend, '_active', {})
+    monkeypatch.setattr(cpu_backend, '_overrides', {'comet': 'int8'})
+
+    def compute(items):
+        cpu_backend._active['comet'] = 'fp32'
+        return [0.5 for _ in items]
+
+    item = {'source': 's', 'reference': 'r', 'candidate': 'c'}
+    fields = [item[f] for f in server.METRIC_FIELDS['comet']]
+    assert server.score_with_cache('comet', [item], compute) == [0.5]
+    assert cache.get('score', make_key('score', server.COMET_MODEL + '+int8', *fields)) is None
+    assert cache.get('score', make_key('score', server.COMET_MODEL, *fields)) == 0.5
+    assert server.score_with_cache('comet', [item], lambda items: pytest.fail('expected a cache hit')) == [0.5]
@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobManager
+
+pytestmark = pytest.mark.skipif(jobs.fcntl is None, reason='run locks need fcntl')
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate(): return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    (tmp_path / 'corpus.json').write_text(json.dumps([{'source': f'Sentence {i}.', 'reference': f'Satz {i}.'} for i in range(6)]))
+    return tmp_path
+
+
+def manager(base_dir, release=None):
+    def translate(spec, secrets, items):
+        if release is not None: release.wait(5)
+        for it in items: it['translation'] = it['source'].upper()
+        return items
+    return JobManager(str(base_dir / 'jobs'), str(base_dir), translate, lambda spec, items: None, chunk_size=2)
+
+
+def test_running_job_is_visible_to_other_processes(corpus):
+    release = threading.Event()
+    owner, other = manager(corpus, release), manager(corpus)
+    job = owner.create({'corpus': 'corpus.json', 'source_lang': 'en', 'target_lang': 'de'})
+    assert wait_for(lambda: owner.get(job['id'])['status'] == 'running')
+    # A second manager has no thread for the job but sees the run lock
+    assert other.get(job['id'])['status'] == 'running'
+    assert other.start(job['id']) is False
+    release.set()
+    assert wait_for(lambda: other.get(job['id'])['status'] == 'completed')
+    assert other.get(job['id'])['processed'] == 6
+
+
+def test_cancel_reaches_runner_in_another_process(corpus):
+    release = threading.Event()
+    owner, other = manager(corpus, release), manager(corpus)
+    job = owner.create({'corpus': 'corpus.json', 'source_lang': 'en', 'target_lang': 'de'})
+    assert wait_for(lambda: owner.get(job['id'])['status'] == 'running')
+    assert other.cancel(job['id']) is True
+    release.set()
+    assert wait_for(lambda: other.get(job['id'])['status'] == 'cancelled')
+
+
+def test_dead_runner_is_interrupted_and_resumable(corpus):
+    owner = manager(corpus)
+    job = owner.create({'corpus': 'corpus.json', 'source_lang': 'en', 'target_lang': 'de'})
+    assert wait_for(lambda: owner.get(job['id'])['status'] == 'completed')
+    # Simulate a worker that died mid-run: job.json says running, nobody holds the lock
+    path = corpus / 'jobs' / job['id'] / 'job.json'
+    state = json.loads(path.read_text())
+    state.update(status='running', processed=2)
+    path.write_text(json.dumps(state))
+    lines = (corpus / 'jobs' / job['id'] / 'results.ndjson').read_text().splitlines(True)
+    (corpus / 'jobs' / job['id'] / 'results.ndjson').write_text(''.join(lines[:2]))
+
+    other = manager(corpus)
+    assert other.get(job['id'])['status'] == 'interrupted'
+    assert other.start(job['id']) is True
+    assert wait_for(lambda: other.get(job['id'])['status'] == 'completed')
+    assert len((corpus / 'jobs' / job['id'] / 'results.ndjson').read_text().splitlines()) == 6
+
+
+def test_cancel_after_local_runner_finished_reaches_external_runner(corpus):
+    release = threading.Event()
+    finished = manager(corpus)
+    job = finished.create({'corpus': 'corpus.json', 'source_lang': 'en', 'target_lang': 'de'})
+    assert wait_for(lambda: finished.get(job['id'])['status'] == 'completed')
+    path = corpus / 'jobs' / job['id'] / 'job.json'
+    state = json.loads(path.read_text())
+    state.update(status='interrupted', processed=2)
+    path.write_text(json.dumps(state))
+    lines = (corpus / 'jobs' / job['id'] / 'results.ndjson').read_text().splitlines(True)
+    (corpus / 'jobs' / job['id'] / 'results.ndjson').write_text(''.join(lines[:2]))
+
+    # The job is resumed by another worker while this manager still remembers its own finished run
+    external = manager(corpus, release)
+    assert external.start(job['id']) is True
+    assert wait_for(lambda: finished.get(job['id'])['status'] == 'running')
+    assert finished.cancel(job['id']) is True
+    assert (corpus / 'jobs' / job['id'] / 'cancel').exists()
+    release.set()
+    assert wait_for(lambda: external.get(job['id'])['status'] == 'cancelled')
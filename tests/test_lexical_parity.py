@@ -0,0 +1,55 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import lexical_metrics
+from lexical_metrics import LEGACY_FORMULAS, check_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPORTS = sorted(glob.glob(os.path.join(ROOT, '1Results', 'evaluation_*.json')))
+
+
+@pytest.mark.parametrize('path', EXPORTS, ids=os.path.basename)
+def test_exports_match_translator_scores(path):
+    report = check_file(path, 'translator')
+    mismatched = {metric: entry[2] for metric, entry in report.items() if entry[1]}
+    assert not mismatched, f'unexplained mismatches: {mismatched}'
+
+
+def test_legacy_formulas_explain_the_known_differences():
+    legacy = LEGACY_FORMULAS['translator']
+    # Short segment scored over all four orders
+    assert lexical_metrics.bleu('04:26:35', '04:26:35') == '100.00'
+    assert legacy['bleu'][1]('04:26:35', '04:26:35', '') == '0.32'
+    # Reference without ASCII tokens
+    assert lexical_metrics.wer('Только бы не вылететь.', 'Если ты только останешься там.') == '0.00'
+    assert legacy['wer'][1]('Только бы не вылететь.', 'Если ты только останешься там.', '') == 'NaN'
+    assert legacy['wer'][1]('Только', 'only', '') == 'Infinity'
+    # Stray CJK characters in otherwise Cyrillic output
+    assert len(lexical_metrics.tokenize('(e) нецелевое援助')) == 3
+    assert legacy['wordCount'][1]('', '(e) нецелевое援助', '') == 1
+
+
+def test_legacy_formula_does_not_hide_other_drift(tmp_path):
+    row = {'original': 'Time', 'reference': '04:26:35', 'targetLang': 'de',
+           'evaluations': {'m': {'translation': '04:26:35', 'bleu': '0.32', 'wer': '12.00'}}}
+    path = tmp_path / 'evaluation_x.json'
+    path.write_text(json.dumps([row]))
+    report = check_file(str(path), 'translator')
+    assert report['bleu'][1] == 0 and report['bleu'][3] == 1
+    assert report['wer'][1] == 1
+
+
+def test_check_exits_non_zero_on_mismatch(tmp_path):
+    row = {'original': 'Hello', 'reference': 'Hallo Welt', 'targetLang': 'de', 'evaluations': {'m': {'translation': 'Hallo Welt', 'wer': '50.00'}}}
+    bad, good = tmp_path / 'evaluation_bad.json', tmp_path / 'evaluation_good.json'
+    bad.write_text(json.dumps([row]))
+    row['evaluations']['m']['wer'] = '0.00'
+    good.write_text(json.dumps([row]))
+    run = lambda path: subprocess.run([sys.executable, os.path.join(ROOT, 'lexical_metrics.py'), '--check', str(path)], capture_output=True, text=True, cwd=ROOT)
+    assert run(bad).returncode == 1
+    assert run(good).returncode == 0
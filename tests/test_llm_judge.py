@@ -0,0 +1,70 @@
+import json
+
+import pytest
+import requests
+
+import llm_judge
+import stub_server
+
+
+@pytest.fixture
+def judge_stub(monkeypatch):
+    import server
+    servers = []
+
+    def start(judge_drop_rate=0.0):
+        stub, url = stub_server.start_stub_server(judge_drop_rate=judge_drop_rate)
+        servers.append(stub)
+        # The provider calls read the URL at call time, so the running server module can be pointed at the stub
+        monkeypatch.setattr(server, 'OPENAI_API_URL', stub_server.stub_env(url)['OPENAI_API_URL'])
+        client = server.app.test_client()
+
+        def judge(items, **options):
+            res = client.post('/judge', json=dict({'items': items, 'provider': 'openai', 'api_key': 'test', 'no_cache': True}, **options))
+            assert res.status_code == 200, res.get_json()
+            return res.get_json()
+        judge.requests = lambda: requests.get(url, timeout=5).json()['requests']
+        return judge
+
+    yield start
+    for stub in servers: stub.shutdown()
+
+
+def segments(n):
+    return [{'original': f'Sentence number {i} of the test set.', 'translation': f'Satz Nummer {i} des Testsatzes.'} for i in range(n)]
+
+
+def test_packing_cuts_the_request_count(judge_stub):
+    judge = judge_stub()
+    result = judge(segments(30))
+    assert result['usage']['requests'] == judge.requests() == 2
+    assert result['usage']['rerequested'] == 0
+    assert all('error' not in r and 1 <= r['score'] <= 10 for r in result['results'])
+    assert [r['index'] for r in result['results']] == list(range(30))
+
+
+def test_dropped_segments_are_rerequested_then_reported(judge_stub):
+    judge = judge_stub(judge_drop_rate=1.0)
+    result = judge(segments(10))
+    usage = result['usage']
+    # Every round gets an empty reply: the first request, then smaller packs for the rest of JUDGE_MAX_ROUNDS
+    assert usage['rerequested'] == 10 * (llm_judge.JUDGE_MAX_ROUNDS - 1)
+    assert usage['requests'] == judge.requests() > 1
+    assert all(r['error'] == llm_judge.MALFORMED for r in result['results'])
+
+
+def test_segment_costs_add_up_to_the_usage_cost(judge_stub):
+    judge = judge_stub(judge_drop_rate=0.3)
+    result = judge(segments(40), max_segments=8)
+    assert result['usage']['cost'] > 0
+    assert sum(r['cost'] for r in result['results']) == pytest.approx(result['usage']['cost'])
+
+
+@pytest.mark.parametrize('overall', [0, 11, '0', -1])
+def test_out_of_range_scores_are_dropped(overall):
+    reply = json.dumps([{'id': 1, 'fluency': 7, 'adequacy': 8, 'overall': overall, 'feedback': 'x'},
+                        {'id': 2, 'fluency': 1, 'adequacy': 10, 'overall': 1, 'feedback': 'y'}])
+    found = llm_judge.parse_reply(reply, [1, 2])
+    # The prompt asks for 1-10, so a 0 is as malformed as an 11 and that segment is re-requested
+    assert list(found) == [2]
+    assert found[2]['score'] == 1 and found[2]['adequacy'] == 10
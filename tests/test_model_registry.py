@@ -0,0 +1,71 @@
+import pytest
+
+from model_registry import ModelRegistry
+
+MB = 1048576
+
+
+class Fake:
+    def __init__(self, mb): self.footprint_bytes = mb * MB
+
+
+def test_evicts_before_loading_an_unseen_model():
+    registry = ModelRegistry(1000 * MB, size_hint=lambda key: 600 * MB)
+    registry.get('a', lambda: Fake(600))
+    resident_during_load = []
+    registry.get('b', lambda: resident_during_load.extend(registry.keys()) or Fake(600))
+    assert resident_during_load == []
+    assert registry.keys() == ['b']
+
+
+def test_measured_size_replaces_the_hint():
+    registry = ModelRegistry(1000 * MB, size_hint=lambda key: 900 * MB)
+    registry.get('a', lambda: Fake(300))
+    registry.unload('a')
+    assert registry.expected_size('a') == 300 * MB
+    registry.get('b', lambda: Fake(300))
+    seen = []
+    registry.get('a', lambda: seen.extend(registry.keys()) or Fake(300))
+    assert seen == ['b']
+
+
+def test_without_a_hint_eviction_happens_after_the_load():
+    registry = ModelRegistry(1000 * MB)
+    registry.get('a', lambda: Fake(600))
+    seen = []
+    registry.get('b', lambda: seen.extend(registry.keys()) or Fake(600))
+    assert seen == ['a'] and registry.keys() == ['b']
+
+
+def test_pinned_models_are_not_evicted_for_a_hint():
+    registry = ModelRegistry(1000 * MB, pinned=['a'], size_hint=lambda key: 600 * MB)
+    registry.get('a', lambda: Fake(600))
+    registry.get('b', lambda: Fake(100))
+    assert registry.keys() == ['a', 'b']
+
+
+def test_failed_loads_are_negatively_cached(monkeypatch):
+    registry = ModelRegistry(failure_ttl=30)
+    calls = []
+    assert registry.get('a', lambda: calls.append(1)) is None
+    assert registry.get('a', lambda: calls.append(1) or Fake(1)) is None
+    assert len(calls) == 1
+    assert 'a' in registry.stats()['failed_retry_in_s']
+
+    def boom():
+        calls.append(1)
+        raise OSError('download failed')
+    with pytest.raises(OSError): registry.get('b', boom)
+    assert registry.get('b', boom) is None and len(calls) == 2
+
+
+def test_failed_load_is_retried_after_the_ttl(monkeypatch):
+    import model_registry
+    now = [1000.0]
+    monkeypatch.setattr(model_registry.time, 'monotonic', lambda: now[0])
+    registry = ModelRegistry(failure_ttl=30)
+    assert registry.get('a', lambda: None) is None
+    now[0] += 31
+    model = Fake(1)
+    assert registry.get('a', lambda: model) is model
+    assert registry.stats()['failed_retry_in_s'] == {}
@@ -0,0 +1,21 @@
+def test_profiled_metric_request_scores_on_the_request_thread(monkeypatch):
+    import threading
+    import server
+    threads = []
+
+    def score(metric, items):
+        threads.append(threading.current_thread())
+        return [0.5 for _ in items]
+
+    monkeypatch.setattr(server, 'score_metric_batched', score)
+    monkeypatch.setattr(server.instrumentation, 'profiling', lambda: True)
+    assert server.submit_metric('comet', {'source': 'a', 'reference': 'b', 'candidate': 'c'}) == 0.5
+    assert threads == [threading.current_thread()]
+    assert server._batchers['comet'].stats()['requests'] == 0
+
+
+def test_process_metrics_without_resource_module(monkeypatch):
+    import instrumentation
+    monkeypatch.setattr(instrumentation, 'resource', None)
+    names = [row[0] for row in instrumentation._process_values()]
+    assert 'process_peak_resident_memory_bytes' not in names
@@ -0,0 +1,116 @@
+import socket
+import time
+
+import pytest
+import requests
+
+import stub_server
+from providers import ProviderClient, TokenBucket
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server, url = stub_server.start_stub_server(**kwargs)
+        servers.append(server)
+        return url
+
+    yield start
+    for server in servers: server.shutdown()
+
+
+def body(text='Hello'):
+    return {'model': 'stub', 'messages': [{'role': 'user', 'content': text}]}
+
+
+def stub_counts(url):
+    return requests.get(url, timeout=5).json()
+
+
+def test_success_passes_through(stub):
+    url = stub()
+    client = ProviderClient('test', backoff_base=0.01)
+    res = client.post(f'{url}/v1/chat/completions', json=body())
+    assert res.status_code == 200
+    assert res.json()['choices'][0]['message']['content'] == '[xx] Hello'
+    assert client.stats()['requests'] == 1 and client.stats()['retries'] == 0
+
+
+def test_429_is_retried_until_max_retries(stub):
+    url = stub(fail_rate=1.0)
+    client = ProviderClient('test', max_retries=2, backoff_base=0.01)
+    res = client.post(f'{url}/v1/messages', json=body())
+    assert res.status_code == 429
+    assert stub_counts(url)['requests'] == 3
+    stats = client.stats()
+    assert stats['requests'] == 3 and stats['retries'] == 2 and stats['errors'] == 1
+
+
+def test_transient_failures_recover(stub):
+    class FlakyHandler(stub_server.StubHandler):
+        def do_POST(self):
+            with self.lock: first = self.counts['requests'] < 2
+            if first:
+                with self.lock: self.counts['requests'] += 1
+                self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+                return self._send(503, {'error': {'message': 'overloaded'}})
+            return super().do_POST()
+
+    url = stub(handler=FlakyHandler)
+    client = ProviderClient('test', max_retries=4, backoff_base=0.01)
+    res = client.post(f'{url}/v1/messages', json=body())
+    assert res.status_code == 200
+    assert client.stats()['retries'] == 2 and client.stats()['errors'] == 0
+
+
+def test_retry_after_is_honoured(stub):
+    url = stub(fail_rate=1.0, retry_after='0.3')
+    client = ProviderClient('test', max_retries=1, backoff_base=0.0)
+    started = time.perf_counter()
+    client.post(f'{url}/v1/messages', json=body())
+    assert time.perf_counter() - started >= 0.3
+
+
+def test_backoff_is_bounded_and_grows():
+    client = ProviderClient('test', backoff_base=0.5, backoff_max=4)
+    for attempt in range(8):
+        ceiling = min(4, 0.5 * 2 ** attempt)
+        assert all(0 <= client._backoff(attempt) <= ceiling for _ in range(50))
+
+
+def test_read_timeout_is_not_retried(stub):
+    url = stub(latency_ms=500)
+    client = ProviderClient('test', max_retries=3, timeout=0.1, backoff_base=0.01)
+    with pytest.raises(requests.ReadTimeout):
+        client.post(f'{url}/v1/messages', json=body())
+    time.sleep(0.6)
+    assert stub_counts(url)['requests'] == 1
+    assert client.stats()['retries'] == 0 and client.stats()['errors'] == 1
+
+
+def test_connection_errors_are_retried():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    client = ProviderClient('test', max_retries=2, backoff_base=0.01)
+    with pytest.raises(requests.ConnectionError):
+        client.post(f'http://127.0.0.1:{port}/v1/messages', json=body())
+    assert client.stats()['requests'] == 3 and client.stats()['retries'] == 2
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=20, burst=1)
+    started = time.perf_counter()
+    for _ in range(6): bucket.acquire()
+    # The first token is available at once, the next five arrive at 20/s
+    assert 0.2 <= time.perf_counter() - started < 1.0
+
+
+def test_rate_limit_applies_to_posts(stub):
+    url = stub()
+    client = ProviderClient('test', max_concurrency=1, rate_limit=10)
+    started = time.perf_counter()
+    for _ in range(4): client.post(f'{url}/v1/messages', json=body())
+    assert time.perf_counter() - started >= 0.25
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+import statistics
+
+import pytest
+
+from results_store import ResultsStore, export_csv, export_json
+
+BLEU_A = [0.12, 0.5, 0.33, 0.91, 0.05, 0.47, 0.62, 0.28, 0.77, 0.4, 0.19]
+BLEU_B = [0.2, 0.45, 0.3, 0.95, 0.1, 0.47, 0.7, 0.2, 0.8, 0.35, 0.25]
+
+
+def rows(bleu_a=BLEU_A, bleu_b=BLEU_B):
+    # Scores arrive as strings, the way the evaluation_*.json exports write them
+    return [{'original': f'Satz {i}.', 'reference': f'Sentence {i}.', 'sourceLang': 'Deutsch', 'targetLang': 'English',
+             'evaluations': {'model-a': {'translation': f'A {i}', 'bleu': str(a), 'comet': 'N/A' if i == 0 else a + 0.1},
+                             'model-b': {'translation': f'B {i}', 'bleu': str(b), 'comet': 'Error', 'note': 'retried' if i == 3 else ''}}}
+            for i, (a, b) in enumerate(zip(bleu_a, bleu_b))]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite3'))
+    store.import_rows(rows(), 'run-1')
+    return store
+
+
+def test_import_coerces_types(store):
+    run = store.run('run-1')
+    assert (run['pair'], run['mode'], run['segments']) == ('de-en', 'ref', 11)
+    assert run['models'] == ['model-a', 'model-b'] and run['metrics'] == ['bleu', 'comet']
+    # Numeric strings become REALs; 'N/A', 'Error', NaN and bools are not scores
+    stats = store.aggregate(percentiles=None)
+    assert stats['model-a']['bleu']['n'] == 11 and stats['model-a']['comet']['n'] == 10
+    assert 'comet' not in stats['model-b']
+    assert store.stats()['scores'] == 11 + 10 + 11
+    store.import_rows([{'original': 'x', 'evaluations': {'m': {'bleu': True, 'chrF': float('nan'), 'cer': ' 0.5 '}}}], 'run-odd')
+    assert store.run('run-odd')['metrics'] == ['cer']
+
+
+def test_aggregates_and_percentiles_match_statistics(store):
+    stats = store.aggregate(metrics=['bleu'], percentiles=(10, 50, 90, 95))
+    for model, values in (('model-a', BLEU_A), ('model-b', BLEU_B)):
+        got = stats[model]['bleu']
+        assert got['mean'] == pytest.approx(statistics.fmean(values))
+        assert got['std'] == pytest.approx(statistics.pstdev(values))
+        assert (got['min'], got['max']) == (min(values), max(values))
+        # Each percentile is read through an OFFSET into the value index and interpolated between neighbours
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+        for p in (10, 50, 90, 95): assert got[f'p{p}'] == pytest.approx(cuts[p - 1])
+
+
+def test_deltas_across_runs(store):
+    store.import_rows(rows(BLEU_A[:5], BLEU_B[:5]), 'run-2')
+    deltas = store.deltas('bleu', 'model-a')
+    diffs = [b - a for a, b in zip(BLEU_A + BLEU_A[:5], BLEU_B + BLEU_B[:5])]
+    got = deltas['model-b']
+    assert got['n'] == len(diffs)
+    assert got['delta'] == pytest.approx(statistics.fmean(diffs))
+    half = 1.96 * statistics.stdev(diffs) / len(diffs) ** 0.5
+    assert got['ci95'] == pytest.approx([statistics.fmean(diffs) - half, statistics.fmean(diffs) + half])
+    assert (got['wins'], got['losses'], got['ties']) == (sum(d > 0 for d in diffs), sum(d < 0 for d in diffs), sum(d == 0 for d in diffs))
+    assert store.deltas('bleu', 'model-a', runs=['run-2'])['model-b']['n'] == 5
+
+
+def test_json_export_round_trips(store, tmp_path):
+    columns, exported = store.export(runs=['run-1'])
+    assert columns == ['bleu', 'comet']
+    data = json.loads(''.join(export_json(exported)))
+    assert len(data) == 11
+    assert data[3]['evaluations']['model-b'] == {'translation': 'B 3', 'bleu': BLEU_B[3], 'comet': 'Error', 'note': 'retried'}
+    again = ResultsStore(str(tmp_path / 'again.sqlite3'))
+    again.import_rows(data, 'copy')
+    for model, by_metric in store.aggregate().items():
+        for metric, stats in by_metric.items(): assert again.aggregate()[model][metric] == pytest.approx(stats)
+
+
+def test_csv_export(store):
+    columns, exported = store.export(runs=['run-1'], models=['model-a'], metrics=['bleu', 'comet'])
+    lines = list(csv.reader(io.StringIO(''.join(export_csv(exported, columns)))))
+    assert lines[0] == ['run', 'segment', 'model', 'original', 'reference', 'translation', 'bleu', 'comet']
+    assert lines[1] == ['run-1', '0', 'model-a', 'Satz 0.', 'Sentence 0.', 'A 0', str(BLEU_A[0]), '']
+    assert [float(line[6]) for line in lines[1:]] == BLEU_A
+
+
+def test_failed_delete_rolls_back(store):
+    db = store._db()
+    db.execute("CREATE TRIGGER keep_runs BEFORE DELETE ON runs BEGIN SELECT RAISE(ABORT, 'kept'); END")
+    with pytest.raises(Exception, match='kept'):
+        store.delete_run('run-1')
+    assert not db.in_transaction
+    assert store.stats()['scores'] == 32
+    db.execute('DROP TRIGGER keep_runs')
+    assert store.delete_run('run-1') is True
+    assert store.run('run-1') is None and store.stats()['scores'] == 0
@@ -0,0 +1,18 @@
+import gc
+
+
+class Tokenizer:
+    pass
+
+
+def test_lock_is_shared_per_tokenizer_and_dropped_with_it():
+    import server
+    first, second = Tokenizer(), Tokenizer()
+    lock = server.tokenizer_lock(first)
+    assert server.tokenizer_lock(first) is lock
+    assert server.tokenizer_lock(second) is not lock
+    before = len(server._tokenizer_locks)
+    del first
+    gc.collect()
+    # An evicted model's tokenizer must not leave its lock behind for a new object to inherit by id
+    assert len(server._tokenizer_locks) == before - 1
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import stub_server
+from cache import ResultCache
+
+
+class RecordingHandler(stub_server.StubHandler):
+    bodies = []
+
+    def reply_text(self, body, text):
+        self.bodies.append(body)
+        return super().reply_text(body, text)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    import server
+    RecordingHandler.bodies = []
+    stub, url = stub_server.start_stub_server(handler=RecordingHandler)
+    monkeypatch.setattr(server, 'OPENAI_API_URL', stub_server.stub_env(url)['OPENAI_API_URL'])
+    monkeypatch.setattr(server, '_cache', ResultCache(str(tmp_path / 'cache.sqlite3'), 1 << 20))
+    yield server.app.test_client()
+    stub.shutdown()
+
+
+def translate(client, **fields):
+    return client.post('/translate/openai', json=dict({'text': 'Hello', 'api_key': 'test', 'target_lang': 'de'}, **fields))
+
+
+@pytest.mark.parametrize('value', ['abc', '1.5', 1.5, 0, -3, True, [300]])
+def test_bad_max_tokens_is_a_json_400(client, value):
+    res = translate(client, max_tokens=value)
+    assert res.status_code == 400
+    assert 'max_tokens' in res.get_json()['error']
+
+
+def test_max_tokens_is_parsed_once_for_key_and_provider(client):
+    first = translate(client, max_tokens='300')
+    assert first.status_code == 200 and not first.get_json().get('cached')
+    assert RecordingHandler.bodies[-1]['max_tokens'] == 300
+    # The string and the integer form are the same request, so the second is a cache hit
+    second = translate(client, max_tokens=300)
+    assert second.get_json().get('cached') is True
+    assert len(RecordingHandler.bodies) == 1
+
+
+def test_batch_route_rejects_bad_max_tokens(client):
+    res = client.post('/translate/batch', json={'provider': 'openai', 'api_key': 'test', 'segments': ['Hello'], 'max_tokens': 'abc', 'stream': False})
+    assert res.status_code == 400